@@ -3,6 +3,12 @@ from flask import Flask, g, request
 from flask_cors import CORS
 from config import CORS_ORIGINS, SECRET_KEY, UPLOAD_FOLDER
 from services.task_service import start_task_status_updater
+from services.latency_service import start_latency_monitor
+from services.retention_service import start_retention_worker
+from services.log_store_service import start_log_store_gc
+from services.run_tracker_service import mark_interrupted_runs
+from utils.json_utils import FastJSONProvider, ORJSON_AVAILABLE
+from utils.http_utils import register_compression
 
 try:
     from middleware_manager import MiddlewareManager, MiddlewareContext
@@ -16,13 +22,19 @@ except Exception as e:
 # Create Flask app
 app = Flask(__name__)
 
+# Serialize every jsonify() response through orjson when it is installed
+app.json = FastJSONProvider(app)
+
+# Registered first so it runs last, after every other after_request hook
+register_compression(app)
+
 # Configure CORS - MUST be done before any routes or blueprints are registered
 CORS(app,
      origins=CORS_ORIGINS,
      supports_credentials=True,
      allow_headers=['Content-Type', 'Authorization', 'X-Requested-With', 'Accept'],
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     expose_headers=['Content-Type', 'X-Cache', 'X-Middleware-Processed'])
+     expose_headers=['Content-Type', 'ETag', 'X-Cache', 'X-Middleware-Processed'])
 
 # App configuration
 app.secret_key = SECRET_KEY
@@ -60,6 +72,8 @@ from routes.dashboard import dashboard_bp
 from routes.network import network_bp
 from routes.logs import logs_bp
 from routes.nodes import nodes_bp
+from routes.export import export_bp
+from routes.uploads import uploads_bp
 
 app.register_blueprint(health_bp)
 app.register_blueprint(instances_bp)
@@ -70,6 +84,8 @@ app.register_blueprint(dashboard_bp)
 app.register_blueprint(network_bp)
 app.register_blueprint(logs_bp)
 app.register_blueprint(nodes_bp)
+app.register_blueprint(export_bp)
+app.register_blueprint(uploads_bp)
 
 # Middleware request/response handlers
 if MIDDLEWARE_AVAILABLE and middleware_manager:
@@ -197,8 +213,12 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', '8000'))
     debug_mode = os.getenv('FLASK_DEBUG', 'true').lower() == 'true'
     
+    mark_interrupted_runs()
     # Start task status updater
     start_task_status_updater()
+    start_latency_monitor()
+    start_retention_worker()
+    start_log_store_gc()
     
     print("\n" + "="*60)
     print("🚀 TES Dashboard Backend Server")
@@ -207,6 +227,7 @@ if __name__ == '__main__':
     print(f"🌐 CORS enabled for: {', '.join(CORS_ORIGINS)}")
     print(f"🔧 Environment: {'development' if debug_mode else 'production'}")
     print(f"🔒 Middleware: {'enabled ✅' if MIDDLEWARE_AVAILABLE else 'disabled ⚠️'}")
+    print(f"⚡ JSON encoder: {'orjson' if ORJSON_AVAILABLE else 'stdlib json'}")
     print(f"⏱️  Task auto-update: enabled (every 30s)")
     print("="*60 + "\n")
     
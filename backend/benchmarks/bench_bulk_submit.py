@@ -0,0 +1,82 @@
+"""
+Throughput of submitting many tasks: one POST /api/submit_task per task
+(connectivity probe, POST, 0.5 s status refresh) against a single
+POST /api/tasks/bulk, both against a local fake TES server that answers
+every request after a fixed delay.
+
+Usage: python benchmarks/bench_bulk_submit.py [tasks] [tes_latency_ms]
+"""
+
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import BACKEND_DIR  # noqa: E402  (puts the backend on sys.path)
+from app import app  # noqa: E402
+
+LATENCY_S = 0.02
+
+class FakeTES(BaseHTTPRequestHandler):
+    def _reply(self, body):
+        time.sleep(LATENCY_S)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.endswith('/service-info'):
+            self._reply({'name': 'fake-tes'})
+        else:
+            self._reply({'id': self.path.rsplit('/', 1)[-1].split('?')[0], 'state': 'QUEUED'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({'id': str(uuid.uuid4())})
+
+    def log_message(self, *args):
+        pass
+
+def make_spec(tes_url, i):
+    return {'tes_instance': tes_url, 'docker_image': 'ubuntu:22.04', 'command': ['echo', f'sample-{i}'],
+            'task_name': f'bench-{i}'}
+
+def report(label, count, elapsed, accepted):
+    print(f"{label:<28}{elapsed * 1000:>12.0f}{count / elapsed:>12.1f}{accepted:>10}")
+
+def main():
+    global LATENCY_S
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    LATENCY_S = (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTES)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tes_url = f'http://127.0.0.1:{server.server_port}'
+    client = app.test_client()
+
+    try:
+        print(f"{count} tasks, TES answers after {LATENCY_S * 1000:.0f} ms")
+        print(f"{'path':<28}{'ms':>12}{'tasks/s':>12}{'accepted':>10}")
+
+        start = time.perf_counter()
+        accepted = sum(client.post('/api/submit_task', json=make_spec(tes_url, i)).status_code == 200
+                       for i in range(count))
+        report('sequential /api/submit_task', count, time.perf_counter() - start, accepted)
+
+        start = time.perf_counter()
+        response = client.post('/api/tasks/bulk', json={
+            'template': make_spec(tes_url, '${i}'),
+            'parameters': [{'i': i} for i in range(count)]
+        })
+        lines = [json.loads(line) for line in response.get_data().splitlines() if line]
+        report('/api/tasks/bulk', count, time.perf_counter() - start, lines[-1]['accepted'])
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
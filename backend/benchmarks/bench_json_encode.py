@@ -0,0 +1,33 @@
+"""
+Compare encode time of a 10k-task /api/tasks payload across the stdlib
+encoder (what jsonify used before), the FastJSONProvider path and a
+pre-encoded cache hit.
+
+Usage: python benchmarks/bench_json_encode.py [task_count]
+"""
+
+import json
+import sys
+
+from common import make_tasks, timeit
+from utils.json_utils import ORJSON_AVAILABLE, EncodedResponseCache, _default, dumps_bytes
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tasks = make_tasks(count)
+
+    # Flask's DefaultJSONProvider used sort_keys=True and ensure_ascii=True
+    stdlib_ms, stdlib_body = timeit(lambda: json.dumps(tasks, default=_default, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    fast_ms, fast_body = timeit(lambda: dumps_bytes(tasks))
+
+    cache = EncodedResponseCache()
+    cache.get_or_build('tasks', 1, lambda: tasks)
+    cached_ms, _ = timeit(lambda: cache.get_or_build('tasks', 1, lambda: tasks), repeat=50)
+
+    print(f"Encoding {count} tasks (orjson available: {ORJSON_AVAILABLE})")
+    print(f"  stdlib json.dumps     : {stdlib_ms:9.2f} ms  {len(stdlib_body):>11,} bytes")
+    print(f"  dumps_bytes           : {fast_ms:9.2f} ms  {len(fast_body):>11,} bytes  ({stdlib_ms / fast_ms:.1f}x)")
+    print(f"  pre-encoded cache hit : {cached_ms:9.4f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Compare payload size and encode/decode time of the /api/tasks body as
+JSON (dumps_bytes) and MessagePack (packb), raw and gzip-compressed.
+
+Usage: python benchmarks/bench_msgpack.py [task_count]
+"""
+
+import gzip
+import sys
+
+from common import make_tasks, timeit
+from utils.json_utils import MSGPACK_AVAILABLE, dumps_bytes, loads, packb, unpackb
+
+def main():
+    if not MSGPACK_AVAILABLE:
+        print("msgpack is not installed; pip install msgpack to run this benchmark")
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tasks = make_tasks(count)
+
+    json_encode_ms, json_body = timeit(lambda: dumps_bytes(tasks))
+    json_decode_ms, _ = timeit(lambda: loads(json_body))
+    msgpack_encode_ms, msgpack_body = timeit(lambda: packb(tasks))
+    msgpack_decode_ms, decoded = timeit(lambda: unpackb(msgpack_body))
+    assert decoded == loads(json_body)
+
+    print(f"{count} tasks")
+    print(f"{'format':<10}{'bytes':>14}{'gzip bytes':>14}{'encode ms':>12}{'decode ms':>12}")
+    for name, body, encode_ms, decode_ms in (
+        ('json', json_body, json_encode_ms, json_decode_ms),
+        ('msgpack', msgpack_body, msgpack_encode_ms, msgpack_decode_ms),
+    ):
+        gzipped = len(gzip.compress(body, compresslevel=5))
+        print(f"{name:<10}{len(body):>14,}{gzipped:>14,}{encode_ms:>12.2f}{decode_ms:>12.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Peak memory and time to ingest one large FULL TES task document: the old
+path (response body + response.json() + externalize_logs) against
+parse_task_document, which streams stdout straight into the log store.
+
+Usage: python benchmarks/bench_stream_parse.py [stdout_megabytes]
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+STORE_DIR = tempfile.mkdtemp(prefix='bench-log-store-')
+os.environ['LOG_STORE_DIR'] = STORE_DIR
+
+from common import BACKEND_DIR  # noqa: E402  (puts the backend on sys.path)
+from services.log_store_service import externalize_logs, parse_task_document  # noqa: E402
+
+CHUNK_BYTES = 64 * 1024
+
+def document_chunks(stdout_bytes):
+    """Yield a FULL task document as the HTTP response would deliver it, without ever holding it whole"""
+    yield json.dumps({'id': 'bench', 'state': 'COMPLETE', 'creation_time': '2025-01-01T00:00:00Z'})[:-1].encode()
+    yield b', "logs": [{"start_time": "2025-01-01T00:00:01Z", "logs": [{"exit_code": 0, "stdout": "'
+    line = json.dumps('step 0000000 processed record "sample" é ok\n')[1:-1].encode()
+    sent = 0
+    while sent < stdout_bytes:
+        chunk = line * (CHUNK_BYTES // len(line))
+        yield chunk
+        sent += len(chunk)
+    yield b'", "stderr": "warning: done"}], "end_time": "2025-01-01T01:00:00Z"}]}'
+
+def measure(label, fn):
+    # Timed untraced; tracemalloc slows allocation-heavy code down too much to time it
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28}{elapsed * 1000:>12.0f}{peak / 1e6:>16.1f}")
+    return result
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    stdout_bytes = megabytes * 1024 * 1024
+
+    def load_whole():
+        body = b''.join(document_chunks(stdout_bytes))
+        document = json.loads(body)
+        document['logs'] = externalize_logs(document['logs'])
+        return document
+
+    try:
+        print(f"task document with {megabytes} MB of stdout")
+        print(f"{'path':<28}{'ms':>12}{'peak MB':>16}")
+        whole = measure('response.json()', load_whole)
+        streamed = measure('parse_task_document', lambda: parse_task_document(document_chunks(stdout_bytes)))
+        assert whole == streamed
+    finally:
+        shutil.rmtree(STORE_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
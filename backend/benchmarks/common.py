@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+STATES = ['QUEUED', 'INITIALIZING', 'RUNNING', 'COMPLETE', 'EXECUTOR_ERROR', 'SYSTEM_ERROR', 'CANCELED']
+
+def make_task(i):
+    """Build a task record shaped like the ones routes/tasks.submit_task stores"""
+    submitted = datetime(2025, 1, 1) + timedelta(seconds=i * 7)
+    state = STATES[i % len(STATES)]
+    return {
+        'id': f'task-{i:08d}',
+        'task_id': f'task-{i:08d}',
+        'name': f'benchmark-task-{i}',
+        'task_name': f'benchmark-task-{i}',
+        'description': 'Task submitted via TES Dashboard',
+        'state': state,
+        'status': state,
+        'creation_time': submitted.isoformat(),
+        'submitted_at': submitted.isoformat(),
+        'start_time': (submitted + timedelta(seconds=30)).isoformat(),
+        'end_time': (submitted + timedelta(seconds=90)).isoformat() if i % 3 else None,
+        'tes_url': f'https://tes-{i % 8}.example.org',
+        'tes_name': f'TES Instance {i % 8}',
+        'tes_endpoint': f'https://tes-{i % 8}.example.org/ga4gh/tes/v1/tasks',
+        'inputs': [{'url': f's3://bucket/input/{i}.txt', 'path': '/tmp/input', 'type': 'FILE'}],
+        'outputs': [{'url': f's3://bucket/output/{i}.txt', 'path': '/tmp/output', 'type': 'FILE'}],
+        'resources': {'cpu_cores': 1 + i % 4, 'ram_gb': 2.0, 'disk_gb': 10.0},
+        'executors': [{'image': 'ubuntu:22.04', 'command': ['echo', f'hello {i}'], 'workdir': '/tmp'}],
+        'volumes': [],
+        'tags': {'project': 'benchmark', 'index': str(i)},
+        'docker_image': 'ubuntu:22.04',
+        'command': f'echo hello {i}',
+        'logs': [{'logs': [{'stdout': f'hello {i}\n', 'stderr': '', 'exit_code': 0}]}],
+        'client_info': {'user_agent': 'bench', 'client_ip': '127.0.0.1', 'timestamp': submitted},
+        'metadata': {'input_count': 1, 'output_count': 1, 'executor_count': 1},
+    }
+
+def make_tasks(count):
+    return [make_task(i) for i in range(count)]
+
+def timeit(fn, repeat=5):
+    """Return the best wall time in milliseconds over `repeat` runs"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -26,6 +26,39 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'supersecretkey')
 
+LATENCY_PROBE_INTERVAL = int(os.getenv('LATENCY_PROBE_INTERVAL', '60'))
+LATENCY_PROBE_TIMEOUT = float(os.getenv('LATENCY_PROBE_TIMEOUT', '5'))
+
+TRANSFER_BUCKET_SECONDS = int(os.getenv('TRANSFER_BUCKET_SECONDS', '300'))
+TRANSFER_RETENTION_SECONDS = int(os.getenv('TRANSFER_RETENTION_SECONDS', str(7 * 24 * 3600)))
+TRANSFER_HISTORY_LIMIT = int(os.getenv('TRANSFER_HISTORY_LIMIT', '50000'))
+
+TASK_CACHE_MAX_BYTES = int(os.getenv('TASK_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+TASK_CACHE_TTL = float(os.getenv('TASK_CACHE_TTL', '10'))
+TASK_NOT_FOUND_TTL = float(os.getenv('TASK_NOT_FOUND_TTL', '30'))
+
+TASK_RESOLVE_DEADLINE = float(os.getenv('TASK_RESOLVE_DEADLINE', '15'))
+
+LOG_FOLLOW_MIN_INTERVAL = float(os.getenv('LOG_FOLLOW_MIN_INTERVAL', '2'))
+LOG_FOLLOW_MAX_INTERVAL = float(os.getenv('LOG_FOLLOW_MAX_INTERVAL', '30'))
+LOG_FOLLOW_IDLE_TIMEOUT = float(os.getenv('LOG_FOLLOW_IDLE_TIMEOUT', '30'))
+LOG_FOLLOW_MAX_FAILURES = int(os.getenv('LOG_FOLLOW_MAX_FAILURES', '5'))
+
+LOG_STORE_DIR = os.getenv('LOG_STORE_DIR', 'log_store')
+LOG_STORE_FRAME_BYTES = int(os.getenv('LOG_STORE_FRAME_BYTES', str(64 * 1024)))
+LOG_STORE_INLINE_BYTES = int(os.getenv('LOG_STORE_INLINE_BYTES', '512'))
+LOG_STORE_GC_INTERVAL = int(os.getenv('LOG_STORE_GC_INTERVAL', '600'))
+LOG_STORE_GC_GRACE = int(os.getenv('LOG_STORE_GC_GRACE', '600'))
+
+SEARCH_LOG_BYTES = int(os.getenv('SEARCH_LOG_BYTES', str(1024 * 1024)))
+SEARCH_MAX_LOG_TOKENS = int(os.getenv('SEARCH_MAX_LOG_TOKENS', '20000'))
+
+METRICS_BUCKET_SECONDS = int(os.getenv('METRICS_BUCKET_SECONDS', '60'))
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '5'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
 CORS_ORIGINS = [
     'http://localhost:3000',
     'http://127.0.0.1:3000',
@@ -37,3 +70,30 @@ CORS_ORIGINS = [
 TES_INSTANCES_FILE = Path(__file__).parent / '.tes_instances'
 TES_LOCATIONS_FILE = Path(__file__).parent / 'tes_instance_locations.json'
 BATCH_RUNS_FILE = os.path.join(UPLOAD_FOLDER, 'batch_runs.json')
+BATCH_RUNS_JOURNAL = os.path.join(UPLOAD_FOLDER, 'batch_runs.jsonl')
+BATCH_RUNS_SNAPSHOT = os.path.join(UPLOAD_FOLDER, 'batch_runs.snapshot.jsonl')
+BATCH_JOURNAL_COMPACT_RECORDS = int(os.getenv('BATCH_JOURNAL_COMPACT_RECORDS', '1000'))
+BATCH_DISPATCH_WORKERS = int(os.getenv('BATCH_DISPATCH_WORKERS', '8'))
+BATCH_SHARD_SIZE = int(os.getenv('BATCH_SHARD_SIZE', '25'))
+BATCH_SHARD_INFLIGHT = int(os.getenv('BATCH_SHARD_INFLIGHT', '2'))
+BATCH_SHARD_MAX_ATTEMPTS = int(os.getenv('BATCH_SHARD_MAX_ATTEMPTS', '3'))
+BATCH_SHARD_FAILURE_LIMIT = int(os.getenv('BATCH_SHARD_FAILURE_LIMIT', '3'))
+BULK_SUBMIT_MAX_TASKS = int(os.getenv('BULK_SUBMIT_MAX_TASKS', '1000'))
+BULK_SUBMIT_WORKERS = int(os.getenv('BULK_SUBMIT_WORKERS', '16'))
+BULK_SUBMIT_PER_INSTANCE = int(os.getenv('BULK_SUBMIT_PER_INSTANCE', '4'))
+WORKFLOW_MAX_PARALLEL_STEPS = int(os.getenv('WORKFLOW_MAX_PARALLEL_STEPS', '4'))
+WORKFLOW_STORAGE_URL = os.getenv('WORKFLOW_STORAGE_URL', '')
+WORKFLOW_PROGRESS_MAX_RUNS = int(os.getenv('WORKFLOW_PROGRESS_MAX_RUNS', '1000'))
+UPLOAD_OBJECTS_DIR = os.path.join(UPLOAD_FOLDER, 'objects')
+UPLOAD_INDEX_JOURNAL = os.path.join(UPLOAD_FOLDER, 'objects.jsonl')
+UPLOAD_INDEX_SNAPSHOT = os.path.join(UPLOAD_FOLDER, 'objects.snapshot.jsonl')
+UPLOAD_INDEX_COMPACT_RECORDS = int(os.getenv('UPLOAD_INDEX_COMPACT_RECORDS', '1000'))
+UPLOAD_INCOMING_DIR = os.path.join(UPLOAD_FOLDER, 'incoming')
+UPLOAD_PART_BYTES = int(os.getenv('UPLOAD_PART_BYTES', str(8 * 1024 * 1024)))
+UPLOAD_PART_MAX_BYTES = int(os.getenv('UPLOAD_PART_MAX_BYTES', str(64 * 1024 * 1024)))
+UPLOAD_MAX_PARTS = int(os.getenv('UPLOAD_MAX_PARTS', '10000'))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+UPLOAD_RETENTION_INTERVAL = int(os.getenv('UPLOAD_RETENTION_INTERVAL', '3600'))
+UPLOAD_RETENTION_MAX_AGE = int(os.getenv('UPLOAD_RETENTION_MAX_AGE', str(30 * 24 * 3600)))
+UPLOAD_RETENTION_MAX_FILES = int(os.getenv('UPLOAD_RETENTION_MAX_FILES', '10000'))
+UPLOAD_RETENTION_MAX_BYTES = int(os.getenv('UPLOAD_RETENTION_MAX_BYTES', str(10 * 1024 ** 3)))
@@ -1,48 +1,116 @@
 from flask import Blueprint, jsonify, request
 from datetime import datetime
 import uuid
-import os
-from services.batch_service import get_batch_runs, add_batch_run
+import json
+from services.batch_service import get_batch_runs, get_batch_runs_version, add_batch_run, update_batch_run
+from services.dispatch_service import build_workflow_task, dispatch_batch, get_dispatch
+from services.run_tracker_service import track_run, add_child_task, add_child_failure
+from services.progress_service import start_run_progress
+from services.shard_service import create_sharded_batch, start_sharded_batch, get_sharded_batch, preview_plan
 from utils.tes_utils import load_tes_instances
-from config import UPLOAD_FOLDER, TES_GATEWAY
-import routes.workflows as workflows_module
+from utils.json_utils import cached_json_response
+from services.upload_service import save_request_files, release_files
+from config import TES_GATEWAY
 
 batch_bp = Blueprint('batch', __name__)
 
+# Workflow-path stage shown on the dashboard for each batch engine
+WORKFLOW_PATH_STEPS = {'snakemake': 3, 'nextflow': 4, 'cwl': 5}
+
 @batch_bp.route('/api/batch_runs', methods=['GET'])
 def get_batch_runs_route():
-    return jsonify(get_batch_runs())
+    return cached_json_response('batch_runs', get_batch_runs_version(), get_batch_runs, allow_msgpack=True)
+
+def _record_dispatch_result(target, local_task, error):
+    run_ids = list(dict.fromkeys([target['run_id'], target['batch_run_id']]))
+    if error:
+        update_batch_run(target['run_id'], {'error': error})
+        add_child_failure(run_ids)
+    else:
+        update_batch_run(target['run_id'], {'task_id': local_task['task_id'], 'task_ids': [local_task['task_id']]})
+        add_child_task(run_ids, local_task)
 
-def _create_batch_run(run_id, workflow_type, batch_mode, uploaded_files):
+def _create_sharded_batch_run(run_id, workflow_type, uploaded_files, params=None):
+    """Split the uploaded sample_sheet across all instances by capacity"""
+    sample_sheet = next((file for file in uploaded_files if file['key'] == 'sample_sheet'), None)
+    if sample_sheet is None:
+        raise ValueError("sample_sheet file is required in sharded mode")
+    tes_task = build_workflow_task(workflow_type, run_id, [file for file in uploaded_files if file is not sample_sheet], params)
+    shard_size = request.form.get('shard_size', type=int)
     tes_instances = load_tes_instances()
+    batch = create_sharded_batch(run_id, tes_task, sample_sheet, tes_instances, shard_size)
+    start_run_progress(run_id, 'batch', WORKFLOW_PATH_STEPS[workflow_type], [inst['name'] for inst in tes_instances],
+                       f'Sharded {workflow_type} batch: {len(batch.shards)} shards')
+    add_batch_run({
+        'run_id': run_id,
+        'mode': 'sharded',
+        'workflow_type': workflow_type,
+        'tes_url': None,
+        'tes_name': f'{len(tes_instances)} instances (sharded)',
+        'status': 'SUBMITTING',
+        'submitted_at': datetime.utcnow().isoformat(),
+        'files': uploaded_files,
+        'task_ids': []
+    })
+    start_sharded_batch(batch, uploaded_files)
+    return batch
+
+def _create_batch_run(run_id, workflow_type, batch_mode, uploaded_files, params=None):
+    """Record and start submitting a batch; returns its dispatch (or sharded batch) for the response"""
+    try:
+        if batch_mode == 'sharded':
+            return _create_sharded_batch_run(run_id, workflow_type, uploaded_files, params)
+        tes_task = build_workflow_task(workflow_type, run_id, uploaded_files, params)
+    except ValueError:
+        # Nothing was recorded, so nothing will ever use the files
+        release_files(uploaded_files)
+        raise
     
     if batch_mode == 'all':
-        for inst in tes_instances:
-            batch_run = {
-                'run_id': f"{run_id}_{inst['name']}",
-                'mode': 'batch',
-                'workflow_type': workflow_type,
-                'tes_url': inst['url'],
-                'tes_name': inst['name'],
-                'status': 'RUNNING',
-                'submitted_at': datetime.utcnow().isoformat(),
-                'files': uploaded_files
-            }
-            add_batch_run(batch_run)
-        return [inst['name'] for inst in tes_instances]
+        targets = [{'run_id': f"{run_id}_{inst['name']}", 'tes_url': inst['url'], 'tes_name': inst['name'],
+                    'mode': 'batch', 'batch_run_id': run_id} for inst in load_tes_instances()]
+        # The group id is not a stored record; its aggregate is served from the tracker,
+        # which also holds the files until every instance finished
+        track_run('batch', run_id, expected=len(targets), persisted=False, files=uploaded_files)
     else:
+        targets = [{'run_id': run_id, 'tes_url': TES_GATEWAY, 'tes_name': 'TES Gateway', 'mode': 'federated',
+                    'batch_run_id': run_id}]
+    
+    start_run_progress(run_id, 'batch', WORKFLOW_PATH_STEPS[workflow_type], [target['tes_name'] for target in targets],
+                       f'{workflow_type} batch to {len(targets)} instance(s) in {batch_mode} mode')
+    for target in targets:
         batch_run = {
-            'run_id': run_id,
-            'mode': 'federated',
+            'run_id': target['run_id'],
+            'mode': target['mode'],
             'workflow_type': workflow_type,
-            'tes_url': TES_GATEWAY,
-            'tes_name': 'TES Gateway',
-            'status': 'RUNNING',
+            'tes_url': target['tes_url'],
+            'tes_name': target['tes_name'],
+            'status': 'SUBMITTING',
             'submitted_at': datetime.utcnow().isoformat(),
-            'files': uploaded_files
+            'files': uploaded_files,
+            'batch_run_id': run_id,
+            'task_ids': []
         }
         add_batch_run(batch_run)
-        return ['TES Gateway']
+        track_run('batch', target['run_id'], expected=1, files=uploaded_files if batch_mode != 'all' else None)
+    return dispatch_batch(run_id, tes_task, targets, _record_dispatch_result)
+
+@batch_bp.route('/api/batch_runs/<run_id>/dispatch', methods=['GET'])
+def get_batch_dispatch(run_id):
+    """Per-instance submission results and latency of a batch run, or shard progress of a sharded one"""
+    dispatch = get_dispatch(run_id) or get_sharded_batch(run_id)
+    if dispatch is None:
+        return jsonify({'error': 'No dispatch in progress or recently finished for this run'}), 404
+    return jsonify(dispatch.snapshot())
+
+@batch_bp.route('/api/batch_capacity', methods=['GET'])
+def get_batch_capacity():
+    """Measured capacity per instance and how a sheet of ?samples=N rows would be sharded now"""
+    samples = request.args.get('samples', 0, type=int)
+    shard_size = request.args.get('shard_size', type=int)
+    if samples < 0 or (shard_size is not None and shard_size < 1):
+        return jsonify({'error': 'samples must be >= 0 and shard_size >= 1'}), 400
+    return jsonify(preview_plan(load_tes_instances(), samples, shard_size))
 
 @batch_bp.route('/api/batch_snakemake', methods=['POST'])
 def batch_snakemake():
@@ -50,27 +118,19 @@ def batch_snakemake():
         batch_mode = request.form.get('batch_mode', 'all')
         run_id = str(uuid.uuid4())
         
-        uploaded_files = []
-        for file_key in request.files:
-            file = request.files[file_key]
-            if file and file.filename:
-                filename = f"batch_{run_id}_{file.filename}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                uploaded_files.append({'key': file_key, 'filename': filename, 'path': filepath})
+        uploaded_files = save_request_files(request.files, request.form.get('upload_ids'))
         
-        path_list = _create_batch_run(run_id, 'snakemake', batch_mode, uploaded_files)
-        
-        import routes.workflows as workflows_module
-        workflows_module.current_workflow_step = 3
-        workflows_module.latest_workflow_path = path_list
+        dispatch = _create_batch_run(run_id, 'snakemake', batch_mode, uploaded_files)
         
         return jsonify({
             'success': True,
             'run_id': run_id,
+            'dispatch': dispatch.snapshot(),
             'message': f'Batch Snakemake workflow submitted in {batch_mode} mode'
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -79,28 +139,21 @@ def batch_nextflow():
     try:
         batch_mode = request.form.get('batch_mode', 'all')
         run_id = str(uuid.uuid4())
+        params = json.loads(request.form.get('nextflow_params') or '{}')
         
-        uploaded_files = []
-        for file_key in request.files:
-            file = request.files[file_key]
-            if file and file.filename:
-                filename = f"batch_{run_id}_{file.filename}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                uploaded_files.append({'key': file_key, 'filename': filename, 'path': filepath})
-        
-        path_list = _create_batch_run(run_id, 'nextflow', batch_mode, uploaded_files)
+        uploaded_files = save_request_files(request.files, request.form.get('upload_ids'))
         
-        import routes.workflows as workflows_module
-        workflows_module.current_workflow_step = 4
-        workflows_module.latest_workflow_path = path_list
+        dispatch = _create_batch_run(run_id, 'nextflow', batch_mode, uploaded_files, params)
         
         return jsonify({
             'success': True,
             'run_id': run_id,
+            'dispatch': dispatch.snapshot(),
             'message': f'Batch Nextflow workflow submitted in {batch_mode} mode'
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -110,26 +163,18 @@ def batch_cwl():
         batch_mode = request.form.get('batch_mode', 'all')
         run_id = str(uuid.uuid4())
         
-        uploaded_files = []
-        for file_key in request.files:
-            file = request.files[file_key]
-            if file and file.filename:
-                filename = f"batch_{run_id}_{file.filename}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                uploaded_files.append({'key': file_key, 'filename': filename, 'path': filepath})
-        
-        path_list = _create_batch_run(run_id, 'cwl', batch_mode, uploaded_files)
+        uploaded_files = save_request_files(request.files, request.form.get('upload_ids'))
         
-        import routes.workflows as workflows_module
-        workflows_module.current_workflow_step = 5
-        workflows_module.latest_workflow_path = path_list
+        dispatch = _create_batch_run(run_id, 'cwl', batch_mode, uploaded_files)
         
         return jsonify({
             'success': True,
             'run_id': run_id,
+            'dispatch': dispatch.snapshot(),
             'message': f'Batch CWL workflow submitted in {batch_mode} mode'
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
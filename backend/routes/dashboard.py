@@ -1,16 +1,20 @@
 from flask import Blueprint, jsonify
-from datetime import datetime, timezone
-import json
-from utils.tes_utils import load_tes_location_data
-from services.task_service import get_submitted_tasks
-from services.workflow_service import get_workflow_runs
-from services.batch_service import get_batch_runs
+from utils.tes_utils import load_tes_location_data, get_tes_config_version
+from services.task_service import get_submitted_tasks, get_tasks_version
+from services.workflow_service import get_workflow_runs, get_workflow_runs_version
+from services.batch_service import get_batch_runs, get_batch_runs_version
 from utils.tes_utils import load_tes_instances
+from utils.json_utils import cached_json_response, dumps_bytes
+from utils.http_utils import cache_for
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/api/dashboard_data', methods=['GET'])
 def get_dashboard_data():
+    version = (get_tasks_version(), get_workflow_runs_version(), get_batch_runs_version(), get_tes_config_version())
+    return cached_json_response('dashboard_data', version, _build_dashboard_data)
+
+def _build_dashboard_data():
     current_tes_locations = load_tes_location_data()
     
     fresh_instances = []
@@ -18,8 +22,7 @@ def get_dashboard_data():
         fresh_instances.append({
             "name": tes_instance.get("name"),
             "url": tes_instance.get("url"),
-            "status": "healthy",
-            "last_checked": datetime.now(timezone.utc).isoformat()
+            "status": "healthy"
         })
     
     data = {
@@ -32,10 +35,15 @@ def get_dashboard_data():
         'tes_locations': current_tes_locations
     }
     
+    try:
+        return dumps_bytes(data)
+    except Exception:
+        pass
+    
     serializable_data = {}
     for k, v in data.items():
         try:
-            json.dumps(v)
+            dumps_bytes(v)
             serializable_data[k] = v
         except Exception as e:
             print(f"Key '{k}' is not serializable: {e}")
@@ -44,9 +52,10 @@ def get_dashboard_data():
             else:
                 serializable_data[k] = str(v) if v else None
     
-    return jsonify(serializable_data)
+    return dumps_bytes(serializable_data)
 
 @dashboard_bp.route('/', methods=['GET'])
+@cache_for(60)
 def index():
     import os
     import json
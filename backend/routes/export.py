@@ -0,0 +1,146 @@
+from flask import Blueprint, jsonify, request
+from datetime import datetime
+import csv
+import io
+from services.task_service import get_submitted_tasks
+from services.workflow_service import get_workflow_runs
+from services.batch_service import get_batch_runs
+from utils.json_utils import dumps_bytes
+from utils.http_utils import stream_response
+from utils.time_utils import parse_timestamp
+
+export_bp = Blueprint('export', __name__, url_prefix='/api/export')
+
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+EXPORT_SOURCES = {
+    'tasks': {
+        'rows': get_submitted_tasks,
+        'time_fields': ('submitted_at', 'creation_time'),
+        'csv_fields': ['task_id', 'name', 'state', 'tes_name', 'tes_url', 'docker_image', 'command',
+                       'creation_time', 'submitted_at', 'start_time', 'end_time'],
+    },
+    'workflows': {
+        'rows': get_workflow_runs,
+        'time_fields': ('submitted_at',),
+        'csv_fields': ['run_id', 'type', 'status', 'tes_name', 'tes_url', 'submitted_at'],
+    },
+    'batch_runs': {
+        'rows': get_batch_runs,
+        'time_fields': ('submitted_at',),
+        'csv_fields': ['run_id', 'mode', 'workflow_type', 'status', 'tes_name', 'tes_url', 'submitted_at'],
+    },
+}
+
+def _row_time(row, time_fields):
+    for field in time_fields:
+        parsed = parse_timestamp(row.get(field))
+        if parsed:
+            return parsed
+    return None
+
+def _build_filter(args, time_fields):
+    since = parse_timestamp(args.get('since'))
+    until = parse_timestamp(args.get('until'))
+    if args.get('since') and since is None:
+        raise ValueError(f"Invalid 'since' timestamp: {args.get('since')}")
+    if args.get('until') and until is None:
+        raise ValueError(f"Invalid 'until' timestamp: {args.get('until')}")
+
+    instances = {value.strip().rstrip('/') for value in args.get('instance', '').split(',') if value.strip()}
+    states = {value.strip().upper() for value in args.get('state', '').split(',') if value.strip()}
+
+    def matches(row):
+        if not isinstance(row, dict):
+            return False
+        if instances and (row.get('tes_name') not in instances and (row.get('tes_url') or '').rstrip('/') not in instances):
+            return False
+        if states and str(row.get('state') or row.get('status') or '').upper() not in states:
+            return False
+        if since or until:
+            row_time = _row_time(row, time_fields)
+            if row_time is None or (since and row_time < since) or (until and row_time > until):
+                return False
+        return True
+
+    return matches
+
+def _iter_rows(rows, matches):
+    # Walk the live store by index instead of copying it, so memory stays flat
+    # however long the history is; rows appended mid-export are included.
+    index = 0
+    while index < len(rows):
+        row = rows[index]
+        index += 1
+        if matches(row):
+            yield row
+
+def _project(row, fields):
+    if not fields:
+        return row
+    return {field: row.get(field) for field in fields}
+
+def _ndjson_stream(rows, fields):
+    buffer = bytearray()
+    for row in rows:
+        buffer += dumps_bytes(_project(row, fields))
+        buffer += b'\n'
+        if len(buffer) >= EXPORT_FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return dumps_bytes(value).decode('utf-8')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _csv_stream(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_csv_value(row.get(field)) for field in fields])
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@export_bp.route('/<source>', methods=['GET'])
+def export_history(source):
+    """Stream task, workflow or batch history as NDJSON or CSV"""
+    config = EXPORT_SOURCES.get(source)
+    if not config:
+        return jsonify({'error': f'Unknown export source: {source}', 'sources': list(EXPORT_SOURCES)}), 404
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': f'Unsupported export format: {export_format}', 'formats': ['ndjson', 'csv']}), 400
+
+    try:
+        matches = _build_filter(request.args, config['time_fields'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    rows = _iter_rows(config['rows'](), matches)
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    if export_format == 'csv':
+        body = _csv_stream(rows, fields or config['csv_fields'])
+        mimetype = 'text/csv'
+    else:
+        body = _ndjson_stream(rows, fields)
+        mimetype = 'application/x-ndjson'
+
+    response = stream_response(body, mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{source}-{timestamp}.{export_format}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
 from datetime import datetime, timezone
-from utils.tes_utils import load_tes_instances
+from utils.tes_utils import load_tes_instances, get_tes_config_version
+from utils.json_utils import cached_json_response
 from services.tes_service import get_healthy_instances, fetch_tes_status
 from concurrent.futures import ThreadPoolExecutor
 import requests
@@ -9,8 +10,7 @@ instances_bp = Blueprint('instances', __name__)
 
 @instances_bp.route('/api/instances', methods=['GET'])
 def get_instances():
-    instances = load_tes_instances()
-    return jsonify(instances)
+    return cached_json_response('instances', get_tes_config_version(), load_tes_instances)
 
 @instances_bp.route('/api/healthy-instances', methods=['GET'])
 def get_healthy_instances_route():
@@ -1,11 +1,16 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response
 from datetime import datetime, timedelta
 from urllib.parse import unquote
-import requests
 from services.task_service import get_submitted_tasks
 from services.workflow_service import get_workflow_runs
-from services.batch_service import get_batch_runs
-from utils.auth_utils import get_instance_credentials
+from services.batch_service import find_batch_run
+from services.run_tracker_service import get_run_progress
+from services.shard_service import get_sharded_batch
+from services.tes_service import resolve_task_document, TASK_NOT_FOUND_ERROR
+from services.log_service import LOG_STREAMS, describe_streams, get_log_text, read_log
+from services.log_follow_service import follow_task_logs
+from services.log_store_service import hydrate_document
+from utils.json_utils import dumps_bytes
 
 logs_bp = Blueprint('logs', __name__)
 
@@ -18,77 +23,26 @@ def get_task_details():
     if not task_id or not tes_url:
         return jsonify({'success': False, 'error': 'task_id and tes_url parameters are required'}), 400
     
+    instance_name = 'unknown'
     try:
         from utils.tes_utils import load_tes_instances
         
-        base_url = tes_url.rstrip('/')
-         
         view_levels_to_try = ['FULL', 'MINIMAL'] if view_level == 'FULL' else [view_level]
-         
-        endpoint_patterns = [
-            f"{base_url}/v1/tasks/{task_id}",
-            f"{base_url}/ga4gh/tes/v1/tasks/{task_id}",
-            f"{base_url}/tasks/{task_id}",
-        ]
-        
         instance_name = next((inst['name'] for inst in load_tes_instances() if inst['url'] in tes_url), 'unknown')
-        credentials = get_instance_credentials(instance_name, tes_url)
         
-        headers = {'Accept': 'application/json'}
-        auth = None
-        if credentials.get('token'):
-            headers['Authorization'] = f"Bearer {credentials['token']}"
-        elif credentials.get('user') and credentials.get('password'):
-            auth = (credentials['user'], credentials['password'])
-         
-        last_error = None
-        for view in view_levels_to_try:
-            for pattern in endpoint_patterns:
-                tes_endpoint = f"{pattern}?view={view}"
-                
-                try:
-                    print(f"🔍 Trying task detail endpoint: {tes_endpoint}")
-                    response = requests.get(tes_endpoint, headers=headers, auth=auth, timeout=15)
-                    
-                    if response.status_code == 200:
-                        task_json = response.json()
-                        print(f"✅ Successfully retrieved task from {tes_endpoint}")
-                        
-                        enhanced_response = {
-                            'success': True,
-                            'task_json': task_json,
-                            'source': 'tes_instance',
-                            'tes_endpoint': tes_endpoint,
-                            'view_level': view,
-                            'instance_name': instance_name,
-                            'fetch_timestamp': datetime.utcnow().isoformat(),
-                        }
-                        return jsonify(enhanced_response)
-                        
-                    elif response.status_code == 404:
-                        print(f"⚠️ Task not found at {tes_endpoint}")
-                        last_error = f"Task not found (404)"
-                        continue
-                        
-                    else:
-                        print(f"⚠️ Endpoint returned {response.status_code}: {tes_endpoint}")
-                        last_error = f"HTTP {response.status_code}"
-                        continue
-                        
-                except requests.exceptions.Timeout:
-                    print(f"⏱️ Timeout for endpoint: {tes_endpoint}")
-                    last_error = "Connection timeout"
-                    continue
-                    
-                except requests.exceptions.ConnectionError as e:
-                    print(f"🔌 Connection error for {tes_endpoint}: {e}")
-                    last_error = f"Connection failed"
-                    continue
-                    
-                except Exception as e:
-                    print(f"❌ Error with endpoint {tes_endpoint}: {e}")
-                    last_error = str(e)
-                    continue
+        print(f"🔍 Resolving task {task_id} on {tes_url}")
+        result, last_error = resolve_task_document(tes_url, task_id, view_levels_to_try, tes_name=instance_name)
+        if result:
+            print(f"✅ Successfully retrieved task from {result['endpoint']}")
+            return jsonify({
+                'success': True,
+                'task_json': hydrate_document(result['task']),
+                'source': 'cache' if result['cached'] else 'tes_instance',
+                'tes_endpoint': result['endpoint'],
+                'view_level': result['view'],
+                'instance_name': instance_name,
+                'fetch_timestamp': datetime.utcnow().isoformat(),
+            })
         
         print(f"❌ All TES endpoints failed for task {task_id}. Last error: {last_error}")
         
@@ -107,10 +61,10 @@ def get_task_details():
         print(f"✅ Found task in dashboard submitted tasks")
         return jsonify({
             'success': True,
-            'task_json': task,
+            'task_json': hydrate_document(task),
             'source': 'dashboard_submitted',
             'view_level': view_level,
-            'instance_name': instance_name if 'instance_name' in locals() else 'unknown',
+            'instance_name': instance_name,
             'fetch_timestamp': datetime.utcnow().isoformat(),
         })
     
@@ -184,27 +138,36 @@ Submitted: {workflow['submitted_at']}
 def get_batch_log(run_id):
     decoded_run_id = unquote(run_id)
     
-    batch = None
-    for b in get_batch_runs():
-        if b['run_id'] == decoded_run_id or b['run_id'].startswith(decoded_run_id + '_'):
-            batch = b
-            break
+    batch = find_batch_run(decoded_run_id)
     
     if not batch:
         return jsonify({'success': False, 'error': 'Batch run not found'}), 404
     
+    # Live aggregate of the run's child tasks (for a batch group id, across all its instances);
+    # sharded batches only write their record when their status changes
+    sharded = get_sharded_batch(decoded_run_id)
+    progress = get_run_progress(decoded_run_id) or (sharded.progress() if sharded else batch.get('progress'))
+    status = progress['status'] if progress else batch['status']
+    
     log_content = f"""=== Batch {batch['workflow_type'].upper()} Log ===
 Run ID: {decoded_run_id}
 Mode: {batch['mode']}
 TES Instance: {batch['tes_name']}
 TES URL: {batch.get('tes_url', 'Unknown')}
-Status: {batch['status']}
+Status: {status}
 Submitted: {batch['submitted_at']}
+"""
+    if progress:
+        log_content += f"""Tasks: {progress['total']} total, {progress['queued']} queued, {progress['running']} running, {progress['done']} done, {progress['failed']} failed
+Started: {progress['started_at'] or '-'}
+Finished: {progress['finished_at'] or '-'}
 """
     
     return jsonify({
         'success': True,
         'log': log_content,
+        'status': status,
+        'progress': progress,
         'batch': batch
     })
 
@@ -216,77 +179,144 @@ def task_log():
     if not tes_url or not task_id:
         return jsonify({'error': 'Missing parameters'}), 400
     
-    base_url = tes_url.rstrip('/')
-     
-    view_levels = ['FULL', 'MINIMAL']
-    endpoint_patterns = [
-        f"{base_url}/v1/tasks/{task_id}",
-        f"{base_url}/ga4gh/tes/v1/tasks/{task_id}",
-        f"{base_url}/tasks/{task_id}"
-    ]
-    
-    for view in view_levels:
-        for pattern in endpoint_patterns:
-            endpoint = f"{pattern}?view={view}"
-            
-            try:
-                print(f"🔍 Trying log endpoint: {endpoint}")
-                resp = requests.get(endpoint, timeout=10)
+    print(f"🔍 Resolving logs for task {task_id} on {tes_url}")
+    result, error = resolve_task_document(tes_url, task_id, ('FULL', 'MINIMAL'))
+    if result:
+        data = hydrate_document(result['task'])
+        view = result['view']
+        endpoint = result['endpoint']
+        logs = []
+         
+        if 'logs' in data and data['logs']:
+            for log_entry in data['logs']:
+                if 'logs' in log_entry:
+                    for executor_log in log_entry['logs']:
+                        stdout = executor_log.get('stdout', '')
+                        stderr = executor_log.get('stderr', '')
+                        exit_code = executor_log.get('exit_code')
+                        
+                        if stdout:
+                            logs.append(f"=== STDOUT (exit code: {exit_code}) ===\n{stdout}")
+                        if stderr:
+                            logs.append(f"=== STDERR (exit code: {exit_code}) ===\n{stderr}")
                 
-                if resp.status_code == 200:
-                    data = resp.json()
-                    logs = []
-                     
-                    if 'logs' in data and data['logs']:
-                        for log_entry in data['logs']:
-                            if 'logs' in log_entry:
-                                for executor_log in log_entry['logs']:
-                                    stdout = executor_log.get('stdout', '')
-                                    stderr = executor_log.get('stderr', '')
-                                    exit_code = executor_log.get('exit_code')
-                                    
-                                    if stdout:
-                                        logs.append(f"=== STDOUT (exit code: {exit_code}) ===\n{stdout}")
-                                    if stderr:
-                                        logs.append(f"=== STDERR (exit code: {exit_code}) ===\n{stderr}")
-                            
-                            if 'metadata' in log_entry and log_entry['metadata']:
-                                import json
-                                logs.append(f"=== METADATA ===\n{json.dumps(log_entry['metadata'], indent=2)}")
-                    
-                    if 'executors' in data:
-                        for executor in data['executors']:
-                            if 'logs' in executor:
-                                for log in executor['logs']:
-                                    stdout = log.get('stdout', '')
-                                    stderr = log.get('stderr', '')
-                                    exit_code = log.get('exit_code')
-                                    
-                                    if stdout:
-                                        logs.append(f"=== EXECUTOR STDOUT (exit code: {exit_code}) ===\n{stdout}")
-                                    if stderr:
-                                        logs.append(f"=== EXECUTOR STDERR (exit code: {exit_code}) ===\n{stderr}")
-                    
-                    if not logs:
-                        logs.append(f"=== NO LOGS AVAILABLE (view: {view}) ===\nThe task may still be running or logs were not captured.")
-                    
-                    print(f"✅ Successfully retrieved {len(logs)} log entries from {endpoint}")
-                    return jsonify({
-                        'success': True,
-                        'logs': logs,
-                        'task': data,
-                        'log_count': len(logs),
-                        'endpoint': endpoint,
-                        'view_level': view
-                    })
-                else:
-                    print(f"⚠️ Endpoint returned {resp.status_code}: {endpoint}")
-            except Exception as e:
-                print(f"❌ Error with endpoint {endpoint}: {e}")
-                continue
+                if 'metadata' in log_entry and log_entry['metadata']:
+                    import json
+                    logs.append(f"=== METADATA ===\n{json.dumps(log_entry['metadata'], indent=2)}")
+        
+        if 'executors' in data:
+            for executor in data['executors']:
+                if 'logs' in executor:
+                    for log in executor['logs']:
+                        stdout = log.get('stdout', '')
+                        stderr = log.get('stderr', '')
+                        exit_code = log.get('exit_code')
+                        
+                        if stdout:
+                            logs.append(f"=== EXECUTOR STDOUT (exit code: {exit_code}) ===\n{stdout}")
+                        if stderr:
+                            logs.append(f"=== EXECUTOR STDERR (exit code: {exit_code}) ===\n{stderr}")
+        
+        if not logs:
+            logs.append(f"=== NO LOGS AVAILABLE (view: {view}) ===\nThe task may still be running or logs were not captured.")
+        
+        print(f"✅ Successfully retrieved {len(logs)} log entries from {endpoint}")
+        return jsonify({
+            'success': True,
+            'logs': logs,
+            'task': data,
+            'log_count': len(logs),
+            'endpoint': endpoint,
+            'view_level': view,
+            'cached': result['cached']
+        })
     
+    print(f"❌ Could not retrieve logs for task {task_id}: {error}")
     return jsonify({
         'success': False,
         'error': 'Could not retrieve task logs from any endpoint',
         'logs': ['=== ERROR ===\nFailed to fetch logs from TES instance. Tried both FULL and MINIMAL views.']
-    }), 502
\ No newline at end of file
+    }), 404 if error == TASK_NOT_FOUND_ERROR else 502
+
+@logs_bp.route('/api/task_output', methods=['GET'])
+def task_output():
+    """Page through one executor's stdout/stderr by bytes, lines or tail"""
+    tes_url = request.args.get('tesUrl')
+    task_id = request.args.get('taskId')
+    if not tes_url or not task_id:
+        return jsonify({'error': 'Missing parameters'}), 400
+    
+    stream = request.args.get('stream', 'stdout').lower()
+    if stream not in LOG_STREAMS:
+        return jsonify({'error': f'Unknown stream: {stream}', 'streams': list(LOG_STREAMS)}), 400
+    
+    attempt = request.args.get('attempt', -1, type=int)
+    executor = request.args.get('executor', 0, type=int)
+    
+    result, error = resolve_task_document(tes_url, task_id, ('FULL',))
+    if not result:
+        return jsonify({'success': False, 'error': f'Could not retrieve task: {error}'}), 404 if error == TASK_NOT_FOUND_ERROR else 502
+    
+    task = result['task']
+    log_text = get_log_text(tes_url, task_id, task, attempt, executor, stream)
+    if log_text is None:
+        return jsonify({
+            'success': False,
+            'error': f'No {stream} for executor {executor}',
+            'streams': describe_streams(task, attempt)
+        }), 404
+    
+    page = read_log(
+        log_text,
+        offset=request.args.get('offset', type=int),
+        length=request.args.get('length', type=int),
+        start_line=request.args.get('start_line', type=int),
+        end_line=request.args.get('end_line', type=int),
+        tail=request.args.get('tail', type=int)
+    )
+    
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'state': task.get('state'),
+        'attempt': attempt,
+        'executor': executor,
+        'stream': stream,
+        **page,
+        'streams': describe_streams(task, attempt)
+    })
+
+@logs_bp.route('/api/task_output/follow', methods=['GET'])
+def follow_task_output():
+    """Stream new stdout/stderr of a running task as Server-Sent Events or NDJSON"""
+    tes_url = request.args.get('tesUrl')
+    task_id = request.args.get('taskId')
+    if not tes_url or not task_id:
+        return jsonify({'error': 'Missing parameters'}), 400
+    
+    stream_format = request.args.get('format', 'sse').lower()
+    if stream_format not in ('sse', 'ndjson'):
+        return jsonify({'error': f'Unsupported stream format: {stream_format}', 'formats': ['sse', 'ndjson']}), 400
+    
+    # Fail fast on a wrong id or unreachable instance instead of streaming keep-alives
+    result, error = resolve_task_document(tes_url, task_id, ('FULL',))
+    if error:
+        return jsonify({'error': f'Could not retrieve task: {error}'}), 404 if error == TASK_NOT_FOUND_ERROR else 502
+    
+    events = follow_task_logs(tes_url, task_id)
+    
+    def generate():
+        for event in events:
+            if stream_format == 'sse':
+                if event is None:
+                    yield b': keep-alive\n\n'
+                else:
+                    yield b'event: ' + event['type'].encode('utf-8') + b'\ndata: ' + dumps_bytes(event) + b'\n\n'
+            elif event is not None:
+                yield dumps_bytes(event) + b'\n'
+            else:
+                yield b'\n'
+    
+    # Not compressed: every event has to reach the viewer as soon as it is written
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
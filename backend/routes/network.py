@@ -1,31 +1,40 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from datetime import datetime
 import random
 from utils.tes_utils import load_tes_location_data
 from services.workflow_service import get_workflow_runs
+from services.latency_service import get_adjacency, get_instance_latencies, get_latency_matrix
+from services.transfer_service import get_transfers, count_transfers, get_transfer_aggregates, get_transfer_timeseries
+from services.metrics_service import get_instance_activity, get_all_activity, get_instance_series
+from utils.http_utils import cache_for
 
 network_bp = Blueprint('network', __name__)
 
 @network_bp.route('/api/network_topology', methods=['GET'])
 def get_network_topology():
     try:
+        top_k = request.args.get('top_k', type=int)
         current_tes_locations = load_tes_location_data()
+        latencies = get_instance_latencies()
         
-        active_instances = len([loc for loc in current_tes_locations if loc.get('status') == 'healthy'])
+        for loc in current_tes_locations:
+            measured = latencies.get(loc.get('id'))
+            if measured and measured['samples']:
+                loc['latency'] = measured['rtt_ms']
+                loc['status'] = 'healthy' if measured['reachable'] else 'unreachable'
+        
+        healthy_ids = {loc.get('id') for loc in current_tes_locations if loc.get('status') == 'healthy'}
+        active_instances = len(healthy_ids)
         total_tasks = sum(loc.get('tasks', 0) for loc in current_tes_locations)
         total_workflows = sum(loc.get('workflows', 0) for loc in current_tes_locations)
         
-        connections = []
-        for i, instance in enumerate(current_tes_locations):
-            for j, target in enumerate(current_tes_locations):
-                if i != j:
-                    connections.append({
-                        'source': instance.get('id', f'instance-{i}'),
-                        'target': target.get('id', f'instance-{j}'),
-                        'latency': abs(instance.get('latency', 50) - target.get('latency', 50)),
-                        'bandwidth': '10Gbps',
-                        'status': 'active' if instance.get('status') == 'healthy' and target.get('status') == 'healthy' else 'inactive'
-                    })
+        connections = [
+            {
+                **connection,
+                'status': 'active' if connection['source'] in healthy_ids and connection['target'] in healthy_ids else 'inactive'
+            }
+            for connection in get_adjacency(top_k if top_k and top_k > 0 else None)
+        ]
         
         data_flows = []
         workflow_runs = get_workflow_runs()
@@ -37,11 +46,11 @@ def get_network_topology():
                     'type': workflow.get('type', 'unknown'),
                     'source': source_instance.get('id', 'unknown'),
                     'path': [source_instance.get('id', 'unknown')],
-                    'data_size': f"{random.randint(10, 500)}MB",
-                    'transfer_rate': f"{random.randint(50, 200)}MB/s",
                     'status': workflow.get('status', 'RUNNING')
                 })
         
+        measured_latencies = [loc['latency'] for loc in current_tes_locations if loc.get('latency') is not None]
+        
         topology_data = {
             'instances': current_tes_locations,
             'connections': connections,
@@ -52,7 +61,8 @@ def get_network_topology():
                 'total_tasks': total_tasks,
                 'total_workflows': total_workflows,
                 'network_health': 'healthy' if active_instances == len(current_tes_locations) else 'degraded',
-                'avg_latency': sum(loc.get('latency', 50) for loc in current_tes_locations) / len(current_tes_locations) if current_tes_locations else 0,
+                'avg_latency': sum(measured_latencies) / len(measured_latencies) if measured_latencies else None,
+                'measured_instances': len(measured_latencies),
                 'last_updated': datetime.now().isoformat()
             },
             'geographic_coverage': {
@@ -72,6 +82,15 @@ def get_network_topology():
     except Exception as e:
         return jsonify({'error': 'Failed to retrieve network topology data'}), 500
 
+@network_bp.route('/api/latency_matrix', methods=['GET'])
+def get_latency_matrix_route():
+    try:
+        matrix = get_latency_matrix()
+        matrix['measurements'] = get_instance_latencies()
+        return jsonify(matrix)
+    except Exception as e:
+        return jsonify({'error': 'Failed to retrieve latency matrix'}), 500
+
 @network_bp.route('/api/network_status', methods=['GET'])
 def get_network_status():
     try:
@@ -102,7 +121,7 @@ def get_network_status():
             'activity': {
                 'active_tasks': sum(loc.get('tasks', 0) for loc in current_tes_locations),
                 'active_workflows': sum(loc.get('workflows', 0) for loc in current_tes_locations),
-                'data_transfers': random.randint(5, 15),
+                'data_transfers': count_transfers('active'),
                 'network_utilization': f"{random.randint(15, 85)}%"
             },
             'last_updated': datetime.now().isoformat()
@@ -119,6 +138,12 @@ def get_instance_metrics(instance_id):
         if not instance:
             return jsonify({'error': 'Instance not found'}), 404
         
+        activity = get_instance_activity(instance.get('url', ''))
+        today = activity['windows']['24h']
+        recent = activity['windows']['1h']
+        rtt_ms = get_instance_latencies().get(instance_id, {}).get('rtt_ms')
+        api_response_time = recent['avg_poll_latency_ms'] if recent['avg_poll_latency_ms'] is not None else rtt_ms
+        
         metrics = {
             'instance_info': instance,
             'performance': {
@@ -131,17 +156,20 @@ def get_instance_metrics(instance_id):
                 }
             },
             'tasks': {
-                'running': random.randint(0, instance.get('tasks', 0)),
-                'queued': random.randint(0, 5),
-                'completed_today': random.randint(10, 50),
-                'failed_today': random.randint(0, 3)
+                'running': activity['current'].get('RUNNING', 0) + activity['current'].get('INITIALIZING', 0),
+                'queued': activity['current'].get('QUEUED', 0),
+                'completed_today': today['completed'],
+                'failed_today': today['failed'],
+                'submitted_today': today['submissions']
             },
             'health_checks': {
-                'api_response_time': f"{random.randint(50, 200)}ms",
+                'api_response_time': f"{api_response_time:.0f}ms" if api_response_time is not None else None,
                 'last_health_check': datetime.now().isoformat(),
-                'uptime': f"{random.randint(95, 100):.1f}%",
-                'error_rate': f"{random.randint(0, 5):.1f}%"
+                'uptime': f"{(1 - today['poll_error_rate']) * 100:.1f}%" if today['poll_error_rate'] is not None else None,
+                'error_rate': f"{recent['poll_error_rate'] * 100:.1f}%" if recent['poll_error_rate'] is not None else None,
+                'submit_error_rate': f"{recent['submit_error_rate'] * 100:.1f}%" if recent['submit_error_rate'] is not None else None
             },
+            'activity': activity,
             'connections': {
                 'active_connections': random.randint(3, 8),
                 'peer_instances': [loc.get('id', '') for loc in current_tes_locations if loc.get('id') != instance_id][:3]
@@ -153,64 +181,83 @@ def get_instance_metrics(instance_id):
     except Exception as e:
         return jsonify({'error': 'Failed to retrieve instance metrics'}), 500
 
+@network_bp.route('/api/instance_metrics/<instance_id>/series', methods=['GET'])
+def get_instance_metric_series(instance_id):
+    instance = next((loc for loc in load_tes_location_data() if loc.get('id') == instance_id), None)
+    if not instance:
+        return jsonify({'error': 'Instance not found'}), 404
+    field = request.args.get('field', 'submissions')
+    buckets = max(1, min(request.args.get('buckets', 60, type=int), 1440))
+    try:
+        series = get_instance_series(instance.get('url', ''), field, buckets)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'instance_id': instance_id, 'field': field, 'series': series})
+
 @network_bp.route('/api/data_transfers', methods=['GET'])
 def get_data_transfers():
-    from datetime import timedelta
-    from utils.tes_utils import load_tes_location_data
+    window_seconds = request.args.get('window', 3600, type=int)
+    tes_url = request.args.get('tes_url')
+    storage = request.args.get('storage')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
     
-    transfers = []
-    storage_endpoints = [
-        {'id': 'storage-eu-central', 'name': 'EU Central Storage', 'location': 'Frankfurt'},
-        {'id': 'storage-eu-north', 'name': 'EU North Storage', 'location': 'Stockholm'},
-        {'id': 'storage-na-east', 'name': 'NA East Storage', 'location': 'Virginia'},
-        {'id': 'storage-global', 'name': 'Global Cache Hub', 'location': 'London'}
-    ]
+    locations_by_url = {loc.get('url', '').rstrip('/'): loc for loc in load_tes_location_data()}
     
-    tes_locations = load_tes_location_data()
-    for i in range(random.randint(3, 8)):
-        source = random.choice(tes_locations)
-        target = random.choice(storage_endpoints)
-        
+    transfers = []
+    for record in get_transfers(tes_url=tes_url, storage=storage, status=request.args.get('status'), limit=limit):
+        instance = locations_by_url.get(record['tes_url'], {})
         transfers.append({
-            'id': f'transfer-{i}',
+            **record,
             'source': {
-                'name': source.get('name', ''),
-                'lat': source.get('lat', 0),
-                'lng': source.get('lng', 0)
+                'name': record['tes_name'],
+                'lat': instance.get('lat', 0),
+                'lng': instance.get('lng', 0)
             },
             'target': {
-                'name': target['name'],
-                'location': target['location']
+                'name': record['storage_host'],
+                'location': record['storage_host']
             },
-            'status': random.choice(['active', 'completed', 'pending']),
-            'progress': random.randint(10, 95),
-            'speed': f"{random.randint(50, 500)} MB/s",
-            'size': f"{random.uniform(1, 50):.1f} GB",
-            'start_time': (datetime.now() - timedelta(minutes=random.randint(5, 60))).isoformat(),
-            'estimated_completion': (datetime.now() + timedelta(minutes=random.randint(2, 30))).isoformat()
         })
     
+    aggregates = get_transfer_aggregates(window_seconds)
+    window_bytes = sum(a['bytes'] for a in aggregates)
+    
     return jsonify({
         'transfers': transfers,
-        'total_active': len([t for t in transfers if t['status'] == 'active']),
-        'total_bandwidth': f"{sum(int(t['speed'].split()[0]) for t in transfers)} MB/s"
+        'total_active': count_transfers('active'),
+        'total_pending': count_transfers('pending'),
+        'window_seconds': window_seconds,
+        'window_bytes': window_bytes,
+        'total_bandwidth': f"{window_bytes / window_seconds / 1e6:.2f} MB/s" if window_seconds > 0 else None,
+        'aggregates': aggregates,
+        'timeseries': get_transfer_timeseries(window_seconds, tes_url=tes_url, storage=storage)
     })
 
 @network_bp.route('/api/network_metrics', methods=['GET'])
 def get_network_metrics():
     tes_locations = load_tes_location_data()
+    activity = get_all_activity('1h')
+    latencies = get_instance_latencies()
+    
+    measured_latencies = [l['rtt_ms'] for l in latencies.values() if l['rtt_ms'] is not None]
+    polls = sum(a['window']['polls'] for a in activity.values())
+    poll_errors = sum(a['window']['polls'] * (a['window']['poll_error_rate'] or 0) for a in activity.values())
     
     metrics = {
         'timestamp': datetime.now().isoformat(),
-        'network_health': random.randint(85, 98),
+        'network_health': round(100 * (1 - poll_errors / polls)) if polls else None,
         'total_throughput': f"{random.randint(800, 1500)} MB/s",
-        'average_latency': random.randint(25, 85),
+        'average_latency': round(sum(measured_latencies) / len(measured_latencies), 1) if measured_latencies else None,
+        'error_rate': round(poll_errors / polls, 4) if polls else None,
         'packet_loss': round(random.uniform(0.01, 0.5), 2),
         'connection_count': random.randint(150, 300),
         'instance_metrics': []
     }
     
     for instance in tes_locations:
+        instance_activity = activity.get(instance.get('url', '').rstrip('/'), {})
+        window = instance_activity.get('window', {})
+        current = instance_activity.get('current', {})
         metrics['instance_metrics'].append({
             'id': instance.get('id', instance.get('name', '').replace(' ', '-').lower()),
             'name': instance.get('name', ''),
@@ -220,12 +267,19 @@ def get_network_metrics():
             'network_in': f"{random.randint(10, 200)} MB/s",
             'network_out': f"{random.randint(5, 150)} MB/s",
             'active_connections': random.randint(5, 25),
-            'uptime': f"{random.randint(95, 100)}%"
+            'running_tasks': current.get('RUNNING', 0) + current.get('INITIALIZING', 0),
+            'queued_tasks': current.get('QUEUED', 0),
+            'completed_last_hour': window.get('completed', 0),
+            'failed_last_hour': window.get('failed', 0),
+            'error_rate': window.get('poll_error_rate'),
+            'api_response_time_ms': window.get('avg_poll_latency_ms'),
+            'uptime': f"{(1 - window['poll_error_rate']) * 100:.1f}%" if window.get('poll_error_rate') is not None else None
         })
     
     return jsonify(metrics)
 
 @network_bp.route('/api/storage_locations', methods=['GET'])
+@cache_for(300)
 def get_storage_locations():
     storage_locations = [
         {
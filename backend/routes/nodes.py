@@ -4,7 +4,14 @@ from pathlib import Path
 import json
 import time
 import requests
-from utils.tes_utils import load_tes_instances
+from utils.tes_utils import load_tes_instances, get_tes_config_version
+from utils.json_utils import cached_json_response
+from services.task_cache_service import get_task_cache_stats
+from services.log_store_service import get_log_store_stats
+from services.batch_service import get_batch_journal_stats
+from services.run_tracker_service import get_tracker_stats
+from services.log_follow_service import get_follow_stats
+from services.retention_service import get_upload_usage
 
 nodes_bp = Blueprint('nodes', __name__, url_prefix='/api')
 
@@ -57,6 +64,12 @@ def get_service_status():
             'writable': os.access(UPLOAD_FOLDER, os.W_OK) if os.path.exists(UPLOAD_FOLDER) else False,
             'path': UPLOAD_FOLDER
         }
+        over_limit = False
+        if upload_folder_status['exists']:
+            usage = get_upload_usage()
+            upload_folder_status['usage'] = usage
+            # Retention could not get below the size limit: what is left is in use
+            over_limit = usage['bytes'] > usage['limits']['max_bytes']
         
         middleware_available = current_app.config.get('MIDDLEWARE_AVAILABLE', False)
         
@@ -69,7 +82,7 @@ def get_service_status():
                     'uptime': 'running'
                 },
                 'storage': {
-                    'status': 'operational' if upload_folder_status['exists'] and upload_folder_status['writable'] else 'degraded',
+                    'status': 'operational' if upload_folder_status['exists'] and upload_folder_status['writable'] and not over_limit else 'degraded',
                     'details': upload_folder_status
                 },
                 'middleware': {
@@ -79,6 +92,26 @@ def get_service_status():
                 'database': {
                     'status': 'operational',
                     'type': 'in-memory'
+                },
+                'task_cache': {
+                    'status': 'operational',
+                    'details': get_task_cache_stats()
+                },
+                'log_store': {
+                    'status': 'operational',
+                    'details': get_log_store_stats()
+                },
+                'batch_journal': {
+                    'status': 'operational',
+                    'details': get_batch_journal_stats()
+                },
+                'run_tracker': {
+                    'status': 'operational',
+                    'details': get_tracker_stats()
+                },
+                'log_follow': {
+                    'status': 'operational',
+                    'details': {'followers': get_follow_stats()}
                 }
             },
             'version': '1.0.0',
@@ -102,16 +135,17 @@ def get_service_status():
 def get_nodes():
     """Get all nodes/instances"""
     try:
-        tes_locations_file = Path(__file__).parent.parent / 'tes_instance_locations.json'
-        if tes_locations_file.exists():
-            with open(tes_locations_file, 'r') as f:
-                nodes = json.load(f)
-                return jsonify({'nodes': nodes})
-        else:
-            return jsonify({'nodes': []})
+        return cached_json_response('nodes', get_tes_config_version(), _load_nodes)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _load_nodes():
+    tes_locations_file = Path(__file__).parent.parent / 'tes_instance_locations.json'
+    if tes_locations_file.exists():
+        with open(tes_locations_file, 'r') as f:
+            return {'nodes': json.load(f)}
+    return {'nodes': []}
+
 @nodes_bp.route('/nodes', methods=['POST'])
 def add_node():
     """Add a new node"""
@@ -1,18 +1,64 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response
 from datetime import datetime, timezone
 import uuid
 import json
 import time
 import requests
-from services.task_service import get_submitted_tasks, add_task, update_single_task_status
+from services.task_service import get_submitted_tasks, get_tasks_version, add_task, update_single_task_status
+from services.metrics_service import record_submit_request
+from services.search_service import search_tasks, get_search_stats
+from services.bulk_submit_service import build_tes_task, prepare_bulk_submission, run_bulk_submission
 from utils.tes_utils import load_tes_instances
 from utils.auth_utils import get_instance_credentials
+from utils.json_utils import cached_json_response, dumps_bytes
 
 tasks_bp = Blueprint('tasks', __name__)
 
 @tasks_bp.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    return jsonify(get_submitted_tasks())
+    return cached_json_response('tasks', get_tasks_version(), get_submitted_tasks, allow_msgpack=True)
+
+@tasks_bp.route('/api/tasks/search', methods=['GET'])
+def search_task_history():
+    """Ranked full-text search over task names, images, commands, tags and finished output"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    states = {value.strip().upper() for value in request.args.get('state', '').split(',') if value.strip()}
+    instance = request.args.get('instance', '').rstrip('/')
+    
+    def matches(task):
+        if states and (task.get('state') or task.get('status')) not in states:
+            return False
+        if instance and instance not in (task.get('tes_name'), (task.get('tes_url') or '').rstrip('/')):
+            return False
+        return True
+    
+    total, hits = search_tasks(query, (page - 1) * per_page, per_page, matches if states or instance else None)
+    results = [{
+        'score': score,
+        'task_id': task.get('task_id') or task.get('id'),
+        'name': task.get('name') or task.get('task_name'),
+        'state': task.get('state') or task.get('status'),
+        'tes_name': task.get('tes_name'),
+        'tes_url': task.get('tes_url'),
+        'docker_image': task.get('docker_image'),
+        'command': task.get('command'),
+        'submitted_at': task.get('submitted_at'),
+    } for score, task in hits]
+    
+    return jsonify({
+        'query': query,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+        'results': results,
+        'index': get_search_stats()
+    })
 
 @tasks_bp.route('/api/submit_task', methods=['POST'])
 def submit_task():
@@ -36,52 +82,9 @@ def submit_task():
                 tes_name = inst['name']
                 break
         
-        executor = {
-            "image": docker_image,
-            "command": data.get('command') if isinstance(data.get('command'), list) else (data.get('command', '').split() if data.get('command') else ['echo', 'Hello World']),
-            "workdir": data.get('workdir', '/tmp')
-        }
-        
-        stdin = data.get('stdin', '').strip()
-        if stdin and stdin.startswith('/'):
-            executor["stdin"] = stdin
-            
-        stdout = data.get('stdout', '').strip()
-        if stdout and stdout.startswith('/'):
-            executor["stdout"] = stdout
-            
-        stderr = data.get('stderr', '').strip()
-        if stderr and stderr.startswith('/'):
-            executor["stderr"] = stderr
-        
-        tes_task = {
-            "name": data.get('task_name', f'Task-{datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")}'),
-            "description": data.get('description', 'Task submitted via TES Dashboard'),
-            "inputs": [],
-            "outputs": [],
-            "resources": {
-                "cpu_cores": int(data.get('cpu_cores', 1)),
-                "ram_gb": float(data.get('ram_gb', 2.0)),
-                "disk_gb": float(data.get('disk_gb', 10.0))
-            },
-            "executors": [executor]
-        }
-        
+        tes_task = build_tes_task(data)
         input_url = data.get('input_url', '').strip()
-        if input_url:
-            tes_task["inputs"].append({
-                "url": input_url,
-                "path": data.get('input_path', '/tmp/input'),
-                "type": "FILE"
-            })
-        
         output_url = data.get('output_url', '').strip()
-        if output_url:
-            tes_task["outputs"].append({
-                "url": output_url,
-                "path": data.get('output_path', '/tmp/output'),
-                "type": "FILE"
-            }) 
         base_url = tes_url.rstrip('/')
         endpoint_patterns = [
             {'service_info': f'{base_url}/ga4gh/tes/v1/service-info', 'tasks': f'{base_url}/ga4gh/tes/v1/tasks'},
@@ -211,13 +214,19 @@ def submit_task():
         elif credentials.get('user') and credentials.get('password'):
             auth = (credentials['user'], credentials['password'])
          
-        response = requests.post(
-            tes_endpoint,
-            json=tes_task,
-            headers=headers,
-            auth=auth,
-            timeout=30
-        )
+        submit_started = time.monotonic()
+        try:
+            response = requests.post(
+                tes_endpoint,
+                json=tes_task,
+                headers=headers,
+                auth=auth,
+                timeout=30
+            )
+        except requests.exceptions.RequestException:
+            record_submit_request(tes_url, (time.monotonic() - submit_started) * 1000, False)
+            raise
+        record_submit_request(tes_url, (time.monotonic() - submit_started) * 1000, response.status_code in [200, 201])
         
         if response.status_code in [200, 201]:
             response_data = response.json()
@@ -353,4 +362,27 @@ def submit_task():
             'error': f'Task submission failed: {str(e)}',
             'error_type': 'unknown_error',
             'error_code': 'UNKNOWN_ERROR'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@tasks_bp.route('/api/tasks/bulk', methods=['POST'])
+def submit_tasks_bulk():
+    """Submit many tasks at once and stream one NDJSON result line per task, then a summary"""
+    try:
+        items, errors = prepare_bulk_submission(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if errors:
+        return jsonify({
+            'success': False,
+            'error': f'{len(errors)} of {len(items) + len(errors)} task specs are invalid; nothing was submitted',
+            'errors': errors
+        }), 400
+    
+    results = run_bulk_submission(items)
+    
+    def generate():
+        for result in results:
+            yield dumps_bytes(result) + b'\n'
+    
+    # Not compressed: each result is sent as soon as its submission finishes
+    return Response(generate(), mimetype='application/x-ndjson', headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
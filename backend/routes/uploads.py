@@ -0,0 +1,87 @@
+from flask import Blueprint, jsonify, request
+from services.upload_service import (
+    UPLOAD_NOT_FOUND_ERROR, get_upload, get_upload_storage_report, create_upload_session,
+    get_upload_session, upload_part, commit_upload, abort_upload,
+)
+from services.retention_service import run_retention, get_upload_usage
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+@uploads_bp.route('/storage', methods=['GET'])
+def upload_storage():
+    """Disk use of uploaded files and how much deduplication saved"""
+    try:
+        top = min(max(int(request.args.get('top', 10)), 0), 100)
+    except ValueError:
+        return jsonify({'error': 'top must be an integer'}), 400
+    return jsonify(get_upload_storage_report(top))
+
+@uploads_bp.route('/usage', methods=['GET'])
+def upload_usage():
+    return jsonify(get_upload_usage())
+
+@uploads_bp.route('/gc', methods=['POST'])
+def upload_gc():
+    """Run a retention pass now; ?dry_run=true only reports what would be removed"""
+    dry_run = request.args.get('dry_run', 'false').lower() in ('1', 'true', 'yes')
+    return jsonify(run_retention(dry_run=dry_run))
+
+@uploads_bp.route('/objects/<sha256>', methods=['GET'])
+def upload_object(sha256):
+    entry = get_upload(sha256)
+    if entry is None:
+        return jsonify({'error': UPLOAD_NOT_FOUND_ERROR}), 404
+    return jsonify(entry)
+
+@uploads_bp.route('', methods=['POST'])
+def create_upload():
+    """Start a chunked upload: PUT the parts, then commit"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    if not filename:
+        return jsonify({'error': 'filename is required'}), 400
+    try:
+        size = int(data['size']) if data.get('size') is not None else None
+        session = create_upload_session(filename, size, data.get('sha256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(session), 201
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Parts received so far, for a client resuming an upload"""
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': UPLOAD_NOT_FOUND_ERROR}), 404
+    return jsonify(session)
+
+@uploads_bp.route('/<upload_id>/parts/<int:part_number>', methods=['PUT'])
+def put_upload_part(upload_id, part_number):
+    """Raw part body; X-Checksum-Sha256 (hex) is verified and makes retries free"""
+    checksum = (request.headers.get('X-Checksum-Sha256') or '').lower() or None
+    part, error = upload_part(upload_id, part_number, request.stream, checksum)
+    if error == UPLOAD_NOT_FOUND_ERROR:
+        return jsonify({'error': error}), 404
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(part)
+
+@uploads_bp.route('/<upload_id>/commit', methods=['POST'])
+def commit_upload_route(upload_id):
+    """Assemble the parts; the returned upload_id can then be passed to submissions in upload_ids"""
+    parts = (request.get_json(silent=True) or {}).get('parts')
+    try:
+        session, error = commit_upload(upload_id, parts)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'parts must be a list of {"part", "sha256"} objects'}), 400
+    if error == UPLOAD_NOT_FOUND_ERROR:
+        return jsonify({'error': error}), 404
+    if error:
+        return jsonify({'error': error}), 409
+    return jsonify(session)
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+def abort_upload_route(upload_id):
+    if not abort_upload(upload_id):
+        return jsonify({'error': UPLOAD_NOT_FOUND_ERROR}), 404
+    return jsonify({'success': True})
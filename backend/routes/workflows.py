@@ -1,19 +1,18 @@
 from flask import Blueprint, jsonify, request
 from datetime import datetime
 import uuid
-import os
-from services.workflow_service import get_workflow_runs, add_workflow_run
+from services.workflow_service import get_workflow_runs, get_workflow_runs_version, add_workflow_run
 from utils.tes_utils import load_tes_instances
-from config import UPLOAD_FOLDER
+from utils.json_utils import cached_json_response
+from services.upload_service import save_request_files, release_files
+from services.progress_service import start_run_progress, record_status, get_latest_progress, get_recent_progress, get_progress
+from services.workflow_engine_service import prepare_cwl_execution, start_cwl_execution, get_cwl_execution
 
 workflows_bp = Blueprint('workflows', __name__)
 
-current_workflow_step = 0
-latest_workflow_path = []
-
 @workflows_bp.route('/api/workflows', methods=['GET'])
 def get_workflows():
-    return jsonify(get_workflow_runs())
+    return cached_json_response('workflows', get_workflow_runs_version(), get_workflow_runs, allow_msgpack=True)
 
 @workflows_bp.route('/api/submit_workflow', methods=['POST'])
 def submit_workflow():
@@ -30,30 +29,35 @@ def submit_workflow():
                 tes_name = inst['name']
                 break
         
-        uploaded_files = []
-        for file_key in request.files:
-            file = request.files[file_key]
-            if file and file.filename:
-                filename = f"{run_id}_{file.filename}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                uploaded_files.append({'key': file_key, 'filename': filename, 'path': filepath})
+        uploaded_files = save_request_files(request.files, request.form.get('upload_ids'))
+        
+        # CWL workflows are executed step by step; parse and validate before recording the run
+        try:
+            execution = prepare_cwl_execution(run_id, uploaded_files, tes_instance, tes_name) if workflow_type == 'cwl' else None
+        except ValueError:
+            release_files(uploaded_files)
+            raise
         
         workflow_run = {
             'run_id': run_id,
             'type': workflow_type,
             'tes_url': tes_instance,
             'tes_name': tes_name,
-            'status': 'RUNNING',
+            'status': 'SUBMITTING' if execution else 'RUNNING',
             'submitted_at': datetime.utcnow().isoformat(),
-            'files': uploaded_files
+            'files': uploaded_files,
+            'task_ids': []
         }
         
+        start_run_progress(run_id, 'workflow', 2, [tes_name] if tes_name != 'Unknown' else [],
+                           f'{workflow_type.upper()} workflow submitted to {tes_name}')
         add_workflow_run(workflow_run)
-        
-        global current_workflow_step, latest_workflow_path
-        current_workflow_step = 2
-        latest_workflow_path = [tes_name] if tes_name != 'Unknown' else []
+        if execution:
+            start_cwl_execution(execution, uploaded_files)
+        else:
+            # Other workflow types are only recorded; nothing reads their files later
+            release_files(uploaded_files)
+            record_status(run_id, 'RUNNING')
         
         return jsonify({
             'success': True,
@@ -61,13 +65,45 @@ def submit_workflow():
             'message': f'{workflow_type.upper()} workflow submitted successfully to {tes_name}'
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@workflows_bp.route('/api/workflows/<run_id>/steps', methods=['GET'])
+def get_workflow_steps(run_id):
+    """Step DAG of a CWL run with each step's state and TES task"""
+    execution = get_cwl_execution(run_id)
+    if execution is None:
+        return jsonify({'error': 'No CWL execution found for this run'}), 404
+    return jsonify(execution.snapshot())
+
 @workflows_bp.route('/api/latest_workflow_status', methods=['GET'])
 def latest_workflow_status():
-    global current_workflow_step, latest_workflow_path
+    """Stage and path of the most recently submitted workflow or batch run"""
+    latest = get_latest_progress()
+    if latest is None:
+        return jsonify({'currentStep': 0, 'latestPath': []})
     return jsonify({
-        'currentStep': current_workflow_step,
-        'latestPath': latest_workflow_path
+        'currentStep': latest['step'],
+        'latestPath': latest['path'],
+        'runId': latest['run_id'],
+        'kind': latest['kind'],
+        'status': latest['status'],
+        'startedAt': latest['started_at'],
+        'updatedAt': latest['updated_at'],
+        'timeline': latest['timeline']
     })
+
+@workflows_bp.route('/api/workflow_progress', methods=['GET'])
+def recent_workflow_progress():
+    """Progress of the newest runs, newest first (?limit=N, at most 100)"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    return jsonify(get_recent_progress(limit))
+
+@workflows_bp.route('/api/workflow_progress/<run_id>', methods=['GET'])
+def workflow_progress(run_id):
+    progress = get_progress(run_id)
+    if progress is None:
+        return jsonify({'error': 'No progress recorded for this run'}), 404
+    return jsonify(progress)
@@ -1,11 +1,102 @@
-from utils.file_utils import load_batch_runs, save_batch_runs
+import threading
+from config import BATCH_RUNS_JOURNAL, BATCH_RUNS_SNAPSHOT, BATCH_JOURNAL_COMPACT_RECORDS
+from utils.file_utils import load_batch_runs
+from utils.journal import Journal
 
-batch_runs = load_batch_runs()
-save_batch_runs(batch_runs)
+# Runs are journaled by run_id; batch_runs.json from older versions seeds the first snapshot
+_journal = Journal(BATCH_RUNS_JOURNAL, BATCH_RUNS_SNAPSHOT, BATCH_JOURNAL_COMPACT_RECORDS)
+_journal.open(lambda: [(run['run_id'], run) for run in load_batch_runs()])
+
+_lock = threading.Lock()
+# Full list, read from the journal the first time something asks for it
+batch_runs = None
+# run_id -> position in batch_runs, kept while the list is loaded
+_positions = {}
+# Batch group id -> its first per-instance run id, built on first lookup
+_groups = None
+# run_id -> (journal seq, run) of updates queued but not yet durable; newer than what the journal returns
+_unsynced = {}
+batch_runs_version = 0
 
 def get_batch_runs():
-    return batch_runs
+    global batch_runs
+    with _lock:
+        if batch_runs is None:
+            batch_runs = _journal.values()
+            _positions.update((run['run_id'], index) for index, run in enumerate(batch_runs))
+        return batch_runs
+
+def get_active_batch_runs():
+    """Runs still SUBMITTING, QUEUED or RUNNING, read without keeping the full list loaded"""
+    return [run for run in _journal.values() if run.get('status') in ('SUBMITTING', 'QUEUED', 'RUNNING')]
+
+def get_batch_runs_version():
+    return batch_runs_version
+
+def get_batch_run(run_id):
+    """One run by id, read through the journal's offset index"""
+    with _lock:
+        queued = _unsynced.get(run_id)
+    return dict(queued[1]) if queued is not None else _journal.get(run_id)
+
+def _group_of(run_id):
+    # Per-instance runs are '<run_id>_<instance>' and run ids themselves contain no '_'
+    return run_id.split('_', 1)[0] if '_' in run_id else None
+
+def find_batch_run(run_id):
+    """The run itself, or for an 'all' mode batch its first per-instance run ('<run_id>_<instance>')"""
+    global _groups
+    batch_run = get_batch_run(run_id)
+    if batch_run is not None:
+        return batch_run
+    with _lock:
+        if _groups is None:
+            _groups = {}
+            for key in _journal.keys():
+                group = _group_of(key)
+                if group is not None:
+                    _groups.setdefault(group, key)
+        first_run_id = _groups.get(run_id)
+    return get_batch_run(first_run_id) if first_run_id is not None else None
 
 def add_batch_run(batch_run):
-    batch_runs.append(batch_run)
-    save_batch_runs(batch_runs)
+    global batch_runs_version
+    _journal.put(batch_run['run_id'], batch_run)
+    with _lock:
+        if batch_runs is not None:
+            _positions[batch_run['run_id']] = len(batch_runs)
+            batch_runs.append(batch_run)
+        group = _group_of(batch_run['run_id'])
+        if _groups is not None and group is not None:
+            _groups.setdefault(group, batch_run['run_id'])
+        batch_runs_version += 1
+
+def update_batch_run(run_id, changes):
+    """Apply changes to a stored run; returns the updated run, or None if there is no such run.
+
+    The change is applied and queued for the journal under the lock, which
+    fixes the order of concurrent updates; waiting for the fsync happens
+    outside it so updates of different runs share a commit.
+    """
+    global batch_runs_version
+    with _lock:
+        queued = _unsynced.get(run_id)
+        batch_run = dict(queued[1]) if queued is not None else _journal.get(run_id)
+        if batch_run is None:
+            return None
+        batch_run.update(changes)
+        seq = _journal.enqueue(run_id, batch_run)
+        _unsynced[run_id] = (seq, batch_run)
+        if batch_runs is not None and run_id in _positions:
+            batch_runs[_positions[run_id]] = batch_run
+        batch_runs_version += 1
+    try:
+        _journal.wait(seq)
+    finally:
+        with _lock:
+            if _unsynced.get(run_id, (None,))[0] == seq:
+                del _unsynced[run_id]
+    return batch_run
+
+def get_batch_journal_stats():
+    return _journal.get_stats()
@@ -0,0 +1,259 @@
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from config import BULK_SUBMIT_MAX_TASKS, BULK_SUBMIT_WORKERS, BULK_SUBMIT_PER_INSTANCE
+from services.dispatch_service import submit_task_to_instance
+from utils.tes_utils import load_tes_instances
+
+# ${name} is replaced from the parameter set; $${name} stays a literal ${name}
+PLACEHOLDER = re.compile(r'\$(\$?)\{(\w+)\}')
+
+# Shared by every bulk request: BULK_SUBMIT_WORKERS threads in total and at most
+# BULK_SUBMIT_PER_INSTANCE submissions in flight to any one instance
+_pool = ThreadPoolExecutor(max_workers=BULK_SUBMIT_WORKERS, thread_name_prefix='bulk-submit')
+_lock = threading.Lock()
+_in_flight = {}  # tes_url -> submissions running or queued in _pool
+_waiting = {}    # tes_url -> deque of requests with items left for that instance
+
+def build_tes_task(data):
+    """TES task document for a submit_task style spec (docker_image, command, resources, input/output URLs)"""
+    executor = {
+        "image": data.get('docker_image'),
+        "command": data.get('command') if isinstance(data.get('command'), list) else (data.get('command', '').split() if data.get('command') else ['echo', 'Hello World']),
+        "workdir": data.get('workdir', '/tmp')
+    }
+    for stream in ('stdin', 'stdout', 'stderr'):
+        path = data.get(stream, '').strip()
+        if path and path.startswith('/'):
+            executor[stream] = path
+
+    tes_task = {
+        "name": data.get('task_name', f'Task-{datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")}'),
+        "description": data.get('description', 'Task submitted via TES Dashboard'),
+        "inputs": [],
+        "outputs": [],
+        "resources": {
+            "cpu_cores": int(data.get('cpu_cores', 1)),
+            "ram_gb": float(data.get('ram_gb', 2.0)),
+            "disk_gb": float(data.get('disk_gb', 10.0))
+        },
+        "executors": [executor]
+    }
+
+    input_url = data.get('input_url', '').strip()
+    if input_url:
+        tes_task["inputs"].append({
+            "url": input_url,
+            "path": data.get('input_path', '/tmp/input'),
+            "type": "FILE"
+        })
+
+    output_url = data.get('output_url', '').strip()
+    if output_url:
+        tes_task["outputs"].append({
+            "url": output_url,
+            "path": data.get('output_path', '/tmp/output'),
+            "type": "FILE"
+        })
+    return tes_task
+
+def _substitute(value, params):
+    if isinstance(value, dict):
+        return {key: _substitute(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, params) for item in value]
+    if not isinstance(value, str):
+        return value
+    whole = PLACEHOLDER.fullmatch(value)
+    if whole and not whole.group(1):
+        # A bare placeholder keeps the parameter's type, e.g. "cpu_cores": "${cores}"
+        if whole.group(2) not in params:
+            raise ValueError(f"Missing parameter '{whole.group(2)}'")
+        return params[whole.group(2)]
+
+    def replace(match):
+        if match.group(1):
+            return '${' + match.group(2) + '}'
+        if match.group(2) not in params:
+            raise ValueError(f"Missing parameter '{match.group(2)}'")
+        return str(params[match.group(2)])
+    return PLACEHOLDER.sub(replace, value)
+
+def _expand_request(body):
+    """Task specs of a bulk request: a list of specs, {"tasks": [...]} or {"template": {...}, "parameters": [...]}.
+
+    Returns (specs, errors); a parameter set that cannot be applied becomes an
+    error for its index.
+    """
+    if isinstance(body, list):
+        return body, []
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a list of task specs or an object with tasks or template and parameters")
+    if 'tasks' in body:
+        if not isinstance(body['tasks'], list):
+            raise ValueError("tasks must be a list")
+        return body['tasks'], []
+    template, parameters = body.get('template'), body.get('parameters')
+    if not isinstance(template, dict) or not isinstance(parameters, list):
+        raise ValueError("template must be an object and parameters a list of objects")
+    specs, errors = [], []
+    for index, params in enumerate(parameters):
+        try:
+            if not isinstance(params, dict):
+                raise ValueError("Parameter set must be an object")
+            specs.append(_substitute(template, params))
+        except ValueError as e:
+            specs.append(None)
+            errors.append({'index': index, 'error': str(e)})
+    return specs, errors
+
+def _check_spec(spec, instances):
+    # Raises ValueError for anything submit_task would reject or TES would refuse
+    if not isinstance(spec, dict):
+        raise ValueError("Task spec must be an object")
+    tes_instance, docker_image = spec.get('tes_instance'), spec.get('docker_image')
+    if not isinstance(tes_instance, str) or not tes_instance.strip():
+        raise ValueError("tes_instance is required")
+    if not isinstance(docker_image, str) or not docker_image.strip():
+        raise ValueError("docker_image is required")
+    command = spec.get('command')
+    if command is not None and not isinstance(command, str) and not (
+            isinstance(command, list) and command and all(isinstance(part, str) for part in command)):
+        raise ValueError("command must be a string or a non-empty list of strings")
+    for field in ('task_name', 'description', 'workdir', 'stdin', 'stdout', 'stderr',
+                  'input_url', 'input_path', 'output_url', 'output_path'):
+        if field in spec and not isinstance(spec[field], str):
+            raise ValueError(f"{field} must be a string")
+    try:
+        tes_task = build_tes_task(spec)
+    except (TypeError, ValueError):
+        raise ValueError("cpu_cores, ram_gb and disk_gb must be numbers")
+    resources = tes_task['resources']
+    if resources['cpu_cores'] < 1 or resources['ram_gb'] <= 0 or resources['disk_gb'] <= 0:
+        raise ValueError("cpu_cores must be at least 1 and ram_gb and disk_gb positive")
+
+    tes_url = tes_instance.strip().rstrip('/')
+    if tes_url in instances:
+        return tes_url, instances[tes_url], tes_task
+    for url, name in instances.items():
+        if name == tes_instance:
+            return url, name, tes_task
+    if not tes_url.startswith(('http://', 'https://')):
+        raise ValueError(f"Unknown TES instance: {tes_instance}")
+    return tes_url, 'Unknown TES Instance', tes_task
+
+def prepare_bulk_submission(body):
+    """Validate every spec of a bulk request before anything is submitted.
+
+    Returns (items, errors): items are {index, tes_url, tes_name, tes_task}
+    and errors {index, error}. Raises ValueError when the body itself is
+    malformed, empty or has more than BULK_SUBMIT_MAX_TASKS specs.
+    """
+    specs, errors = _expand_request(body)
+    if not specs:
+        raise ValueError("No task specs given")
+    if len(specs) > BULK_SUBMIT_MAX_TASKS:
+        raise ValueError(f"At most {BULK_SUBMIT_MAX_TASKS} tasks can be submitted at once, got {len(specs)}")
+    instances = {inst['url'].rstrip('/'): inst['name'] for inst in load_tes_instances()}
+    failed = {error['index'] for error in errors}
+    items = []
+    for index, spec in enumerate(specs):
+        if index in failed:
+            continue
+        try:
+            tes_url, tes_name, tes_task = _check_spec(spec, instances)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        items.append({'index': index, 'tes_url': tes_url, 'tes_name': tes_name, 'tes_task': tes_task})
+    errors.sort(key=lambda error: error['index'])
+    return items, errors
+
+def _schedule(tes_url):
+    # Called with _lock held: hands tes_url's next items to the pool, up to its limit
+    waiting = _waiting.get(tes_url)
+    while waiting and _in_flight.get(tes_url, 0) < BULK_SUBMIT_PER_INSTANCE:
+        request = waiting.popleft()
+        item = request['pending'].popleft()
+        if request['pending']:
+            # Requests for the same instance take turns
+            waiting.append(request)
+        _in_flight[tes_url] = _in_flight.get(tes_url, 0) + 1
+        _pool.submit(_submit_item, request, item)
+    if not waiting:
+        _waiting.pop(tes_url, None)
+
+def _submit_item(request, item):
+    """Submit one item and put its result on the request's queue"""
+    tes_task = item['tes_task']
+    tes_task = dict(tes_task, tags=dict(tes_task.get('tags', {}), bulk_id=request['bulk_id'], bulk_index=str(item['index'])))
+    started = time.monotonic()
+    try:
+        local_task, error = submit_task_to_instance(item['tes_url'], tes_task, item['tes_name'],
+                                                    submission_method='Bulk API')
+    except Exception as e:
+        local_task, error = None, str(e)
+    finally:
+        with _lock:
+            _in_flight[item['tes_url']] -= 1
+            if not _in_flight[item['tes_url']]:
+                del _in_flight[item['tes_url']]
+            _schedule(item['tes_url'])
+    request['results'].put({
+        'type': 'result',
+        'index': item['index'],
+        'success': error is None,
+        'task_id': local_task and local_task['task_id'],
+        'task_name': tes_task['name'],
+        'tes_name': item['tes_name'],
+        'tes_url': item['tes_url'],
+        'error': error,
+        'latency_ms': round((time.monotonic() - started) * 1000, 1)
+    })
+
+def run_bulk_submission(items):
+    """Submit validated items concurrently and return a generator of results in completion order.
+
+    Items run on a pool of BULK_SUBMIT_WORKERS threads shared by all bulk
+    requests, with at most BULK_SUBMIT_PER_INSTANCE submissions in flight to
+    any one instance across those requests. An instance's next item is only
+    handed to the pool when one of its submissions finishes, so a slow
+    instance holds at most its own share of the threads and the others keep
+    going. The last item yielded is a summary. Submission carries on if the
+    consumer stops reading.
+    """
+    bulk_id = str(uuid.uuid4())
+    started = time.monotonic()
+    results = queue.Queue()
+    by_instance = {}
+    for item in items:
+        by_instance.setdefault(item['tes_url'], deque()).append(item)
+    with _lock:
+        for tes_url, pending in by_instance.items():
+            _waiting.setdefault(tes_url, deque()).append({'bulk_id': bulk_id, 'pending': pending, 'results': results})
+            _schedule(tes_url)
+    print(f"📦 Bulk {bulk_id}: submitting {len(items)} tasks to {len(by_instance)} instance(s)")
+
+    def stream():
+        accepted = 0
+        for _ in range(len(items)):
+            result = results.get()
+            accepted += result['success']
+            yield result
+        elapsed = time.monotonic() - started
+        print(f"📦 Bulk {bulk_id}: {accepted} accepted, {len(items) - accepted} rejected in {elapsed:.1f}s")
+        yield {
+            'type': 'summary',
+            'bulk_id': bulk_id,
+            'total': len(items),
+            'accepted': accepted,
+            'rejected': len(items) - accepted,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'tasks_per_second': round(len(items) / elapsed, 1) if elapsed else None
+        }
+    return stream()
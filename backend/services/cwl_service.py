@@ -0,0 +1,326 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from services.upload_service import object_path
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    yaml = None
+    YAML_AVAILABLE = False
+
+DEFAULT_IMAGE = 'ubuntu:22.04'
+INPUTS_DIR = '/inputs'
+OUTPUTS_DIR = '/outputs'
+# Uploaded files referenced by a job are passed inline, like batch workflow files
+INLINE_FILE_MAX_BYTES = 128 * 1024
+# $(inputs.name) and $(inputs.name.path|basename|...); JavaScript expressions are not evaluated
+PARAMETER_REFERENCE = re.compile(r'\$\(inputs\.(\w+)(?:\.(path|basename|nameroot|nameext|location))?\)')
+UNSUPPORTED_REQUIREMENTS = {'ScatterFeatureRequirement', 'SubworkflowFeatureRequirement', 'InlineJavascriptRequirement',
+                            'StepInputExpressionRequirement', 'MultipleInputFeatureRequirement'}
+
+def load_document(text, name):
+    """Parse a CWL or job document; YAML when PyYAML is installed, otherwise JSON"""
+    try:
+        document = yaml.safe_load(text) if YAML_AVAILABLE else json.loads(text)
+    except Exception as e:
+        raise ValueError(f"{name} is not valid {'YAML' if YAML_AVAILABLE else 'JSON'}: {str(e)}")
+    if not isinstance(document, dict):
+        raise ValueError(f"{name} must be a mapping")
+    return document
+
+def _short_id(value):
+    return str(value).split('#')[-1].split('/')[-1]
+
+def _id_map(value, shorthand='type', key='id'):
+    """CWL allows {id: spec}, {id: shorthand} or [{id: ...}]; returns id -> spec dict"""
+    entries = OrderedDict()
+    if isinstance(value, dict):
+        for name, spec in value.items():
+            entries[_short_id(name)] = dict(spec) if isinstance(spec, dict) else {shorthand: spec}
+    for spec in value if isinstance(value, list) else []:
+        spec = {key: spec} if isinstance(spec, str) else dict(spec)
+        entries[_short_id(spec[key])] = spec
+    return entries
+
+def _requirements(document):
+    found = {}
+    for key in ('hints', 'requirements'):
+        for class_name, spec in _id_map(document.get(key) or [], key='class').items():
+            found[spec.get('class', class_name)] = spec
+    return found
+
+def _base_type(cwl_type):
+    if isinstance(cwl_type, dict):
+        return 'array' if cwl_type.get('type') == 'array' else cwl_type.get('type')
+    if isinstance(cwl_type, list):
+        return next((_base_type(t) for t in cwl_type if t != 'null'), None)
+    cwl_type = str(cwl_type or '').rstrip('?')
+    return 'array' if cwl_type.endswith('[]') else cwl_type
+
+def _load_tool(run, step_id, documents):
+    if isinstance(run, str):
+        name = os.path.basename(run.split('#')[0])
+        if name not in documents:
+            raise ValueError(f"Step {step_id} runs {run}, which was not uploaded")
+        run = documents[name]
+    if not isinstance(run, dict) or run.get('class') != 'CommandLineTool':
+        raise ValueError(f"Step {step_id}: only CommandLineTool steps are supported")
+    unsupported = UNSUPPORTED_REQUIREMENTS & set(_requirements(run))
+    if unsupported:
+        raise ValueError(f"Step {step_id} needs {', '.join(sorted(unsupported))}, which is not supported")
+    return run
+
+def parse_workflow(document, documents=None):
+    """Steps of a CWL Workflow as a DAG: step id -> {tool, in, out, depends_on}.
+
+    A lone CommandLineTool is treated as a one-step workflow. Raises
+    ValueError for documents outside the supported subset or with cycles.
+    """
+    documents = documents or {}
+    if document.get('class') == 'CommandLineTool':
+        tool = _load_tool(document, 'main', documents)
+        document = {
+            'class': 'Workflow',
+            'inputs': document.get('inputs') or {},
+            'outputs': {},
+            'steps': {'main': {'run': tool, 'in': {name: name for name in _id_map(tool.get('inputs') or {})},
+                               'out': list(_id_map(tool.get('outputs') or {}))}}
+        }
+    if document.get('class') != 'Workflow':
+        raise ValueError("The CWL document must be a Workflow or a CommandLineTool")
+    unsupported = UNSUPPORTED_REQUIREMENTS & set(_requirements(document))
+    if unsupported:
+        raise ValueError(f"Workflow needs {', '.join(sorted(unsupported))}, which is not supported")
+    inputs = _id_map(document.get('inputs') or {})
+    steps = OrderedDict()
+    for step_id, spec in _id_map(document.get('steps') or {}, shorthand='run').items():
+        if 'scatter' in spec or 'when' in spec:
+            raise ValueError(f"Step {step_id}: scatter and when are not supported")
+        step_inputs = OrderedDict()
+        for name, binding in _id_map(spec.get('in') or {}, shorthand='source').items():
+            sources = binding.get('source')
+            sources = sources if isinstance(sources, list) else [sources] if sources else []
+            if len(sources) > 1:
+                raise ValueError(f"Step {step_id}: input {name} has more than one source")
+            step_inputs[name] = {'source': sources[0].lstrip('#') if sources else None, 'default': binding.get('default')}
+        steps[step_id] = {
+            'id': step_id,
+            'tool': _load_tool(spec.get('run'), step_id, documents),
+            'in': step_inputs,
+            'out': [_short_id(out['id'] if isinstance(out, dict) else out) for out in spec.get('out') or []],
+            'depends_on': set()
+        }
+    if not steps:
+        raise ValueError("The workflow has no steps")
+    for step in steps.values():
+        for name, binding in step['in'].items():
+            source = binding['source']
+            if source is None:
+                continue
+            if '/' in source:
+                upstream, output = source.split('/', 1)
+                if upstream not in steps or output not in steps[upstream]['out']:
+                    raise ValueError(f"Step {step['id']}: unknown source {source}")
+                step['depends_on'].add(upstream)
+            elif source not in inputs:
+                raise ValueError(f"Step {step['id']}: unknown workflow input {source}")
+    _check_acyclic(steps)
+    return {'inputs': inputs, 'steps': steps, 'requirements': _requirements(document)}
+
+def _check_acyclic(steps):
+    remaining = {step_id: len(step['depends_on']) for step_id, step in steps.items()}
+    ready = [step_id for step_id, count in remaining.items() if count == 0]
+    seen = 0
+    while ready:
+        step_id = ready.pop()
+        seen += 1
+        for other in steps.values():
+            if step_id in other['depends_on']:
+                remaining[other['id']] -= 1
+                if remaining[other['id']] == 0:
+                    ready.append(other['id'])
+    if seen != len(steps):
+        raise ValueError("The workflow steps contain a cycle")
+
+def _output_name(tool, output_id, spec):
+    """File name an output is written to inside the step's working directory"""
+    if _base_type(spec.get('type')) in ('stdout', 'stderr'):
+        return tool.get(spec['type']) or f"{output_id}.{spec['type']}"
+    glob = (spec.get('outputBinding') or {}).get('glob')
+    if not isinstance(glob, str) or any(char in glob for char in '*?[$'):
+        return None
+    return glob
+
+def _file_basename(value):
+    return value.get('basename') or os.path.basename((value.get('location') or value.get('path') or '').rstrip('/'))
+
+def _render(value, attribute=None):
+    if isinstance(value, dict) and value.get('class') in ('File', 'Directory'):
+        if attribute in (None, 'path'):
+            return value['path']
+        basename = _file_basename(value)
+        root, ext = os.path.splitext(basename)
+        return {'basename': basename, 'nameroot': root, 'nameext': ext, 'location': value.get('location')}[attribute]
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+def _substitute(text, values):
+    if not isinstance(text, str):
+        return text
+    return PARAMETER_REFERENCE.sub(lambda match: _render(values.get(match.group(1)), match.group(2)), text)
+
+def _binding_args(binding, value):
+    if value is None or value is False:
+        return []
+    prefix = binding.get('prefix')
+    separate = binding.get('separate', True)
+    if value is True:
+        return [prefix] if prefix else []
+    if isinstance(value, list):
+        items = [_render(item) for item in value]
+        if binding.get('itemSeparator'):
+            items = [binding['itemSeparator'].join(items)]
+    else:
+        items = [_render(value)]
+    if not prefix:
+        return items
+    return [prefix] + items if separate else [prefix + items[0]] + items[1:]
+
+class StepTaskBuilder:
+    """Turns the steps of a parsed workflow into TES tasks for one run.
+
+    Files passed between steps are written to storage_url/<run_id>/<step>/<output>
+    by the producing task and staged in by its consumers, so a workflow whose
+    steps exchange files needs WORKFLOW_STORAGE_URL.
+    """
+
+    def __init__(self, run_id, workflow, job, uploaded_files, storage_url):
+        self.run_id = run_id
+        self.workflow = workflow
+        self.job = job
+        self.uploads = {file['filename']: file for file in uploaded_files}
+        self.storage_url = (storage_url or '').rstrip('/')
+        for step in workflow['steps'].values():
+            if step['depends_on'] and not self.storage_url:
+                raise ValueError("Steps that pass files to each other need WORKFLOW_STORAGE_URL to be configured")
+
+    def _output_location(self, step_id, output_id):
+        return f"{self.storage_url}/{self.run_id}/{step_id}/{output_id}"
+
+    def _step_value(self, step, name):
+        binding = step['in'].get(name)
+        if binding is None:
+            return None
+        source, value = binding['source'], None
+        if source and '/' in source:
+            upstream, output_id = source.split('/', 1)
+            tool = self.workflow['steps'][upstream]['tool']
+            spec = _id_map(tool.get('outputs') or {}).get(output_id, {})
+            basename = _output_name(tool, output_id, spec) or output_id
+            value = {'class': 'File', 'location': self._output_location(upstream, output_id), 'basename': os.path.basename(basename)}
+        elif source:
+            value = self.job.get(source, self.workflow['inputs'].get(source, {}).get('default'))
+        return binding['default'] if value is None else value
+
+    def _stage_file(self, value, input_id, inputs):
+        """Add the TES input for a File value and return it with its path in the container"""
+        value = dict(value)
+        basename = _file_basename(value) or input_id
+        path = f"{INPUTS_DIR}/{input_id}/{basename}"
+        location = value.get('location') or value.get('path') or ''
+        if 'contents' in value:
+            inputs.append({'name': input_id, 'path': path, 'type': 'FILE', 'content': value['contents']})
+        elif '://' in location:
+            inputs.append({'name': input_id, 'path': path, 'url': location,
+                           'type': 'DIRECTORY' if value['class'] == 'Directory' else 'FILE'})
+        elif os.path.basename(location) in self.uploads:
+            upload = self.uploads[os.path.basename(location)]
+            if upload['size'] > INLINE_FILE_MAX_BYTES:
+                raise ValueError(f"{upload['filename']} is larger than {INLINE_FILE_MAX_BYTES} bytes; pass it by URL")
+            with open(object_path(upload['sha256']), 'rb') as f:
+                content = f.read().decode('utf-8', errors='replace')
+            inputs.append({'name': input_id, 'path': path, 'type': 'FILE', 'content': content})
+        else:
+            raise ValueError(f"Input {input_id}: {location or 'file'} is neither a URL nor an uploaded file")
+        value.update(path=path, basename=basename)
+        return value
+
+    def build(self, step_id):
+        step = self.workflow['steps'][step_id]
+        tool = step['tool']
+        requirements = dict(self.workflow['requirements'], **_requirements(tool))
+        inputs, values = [], {}
+        for input_id, spec in _id_map(tool.get('inputs') or {}).items():
+            value = self._step_value(step, input_id)
+            if value is None:
+                value = spec.get('default')
+            if isinstance(value, dict) and value.get('class') in ('File', 'Directory'):
+                value = self._stage_file(value, input_id, inputs)
+            elif isinstance(value, list):
+                value = [self._stage_file(item, f"{input_id}_{index}", inputs)
+                         if isinstance(item, dict) and item.get('class') in ('File', 'Directory') else item
+                         for index, item in enumerate(value)]
+            if value is None and not str(spec.get('type', '')).endswith('?') and 'null' not in (spec.get('type') or []):
+                raise ValueError(f"Step {step_id}: no value for required input {input_id}")
+            values[input_id] = value
+
+        # Command line: baseCommand, then arguments and bound inputs ordered by position
+        base_command = tool.get('baseCommand') or []
+        command = [_substitute(part, values) for part in (base_command if isinstance(base_command, list) else [base_command])]
+        bound = []
+        for argument in tool.get('arguments') or []:
+            if isinstance(argument, dict):
+                argument_value = _substitute(argument.get('valueFrom'), values)
+                bound.append((argument.get('position', 0), len(bound), _binding_args(argument, argument_value)))
+            else:
+                bound.append((0, len(bound), [_substitute(argument, values)]))
+        for input_id, spec in _id_map(tool.get('inputs') or {}).items():
+            binding = spec.get('inputBinding')
+            if binding is not None:
+                bound.append((binding.get('position', 0), len(bound), _binding_args(binding, values[input_id])))
+        for _, _, args in sorted(bound, key=lambda entry: entry[:2]):
+            command.extend(args)
+        if not command:
+            raise ValueError(f"Step {step_id}: the tool has no baseCommand or arguments")
+
+        executor = {
+            'image': (requirements.get('DockerRequirement') or {}).get('dockerPull') or DEFAULT_IMAGE,
+            'command': command,
+            'workdir': OUTPUTS_DIR
+        }
+        env_defs = _id_map((requirements.get('EnvVarRequirement') or {}).get('envDef') or {}, shorthand='envValue', key='envName')
+        env = {name: _substitute(entry.get('envValue'), values) for name, entry in env_defs.items()}
+        if env:
+            executor['env'] = env
+
+        outputs = []
+        for output_id, spec in _id_map(tool.get('outputs') or {}).items():
+            name = _output_name(tool, output_id, spec)
+            output_type = _base_type(spec.get('type'))
+            if output_type in ('stdout', 'stderr'):
+                executor[output_type] = f"{OUTPUTS_DIR}/{name}"
+            if output_id not in step['out'] or not self.storage_url:
+                continue
+            if name is None or output_type not in ('File', 'stdout', 'stderr'):
+                raise ValueError(f"Step {step_id}: output {output_id} needs a File type with a literal glob")
+            outputs.append({'name': output_id, 'path': f"{OUTPUTS_DIR}/{_substitute(name, values)}",
+                            'url': self._output_location(step_id, output_id), 'type': 'FILE'})
+
+        resources = requirements.get('ResourceRequirement') or {}
+        return {
+            'name': f"{tool.get('label') or step_id}-{self.run_id[:8]}",
+            'description': f"Step {step_id} of CWL workflow run {self.run_id}",
+            'inputs': inputs,
+            'outputs': outputs,
+            'resources': {
+                'cpu_cores': int(resources.get('coresMin') or 1),
+                'ram_gb': round(float(resources.get('ramMin') or 2048) / 1024, 2),
+                'disk_gb': 10.0
+            },
+            'executors': [executor],
+            'tags': {'workflow_run_id': self.run_id, 'step': step_id}
+        }
@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import BATCH_DISPATCH_WORKERS
+from services.tes_service import post_task_document
+from services.task_service import add_task
+from services.upload_service import object_path
+
+TES_STATES = {'UNKNOWN', 'QUEUED', 'INITIALIZING', 'RUNNING', 'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+# Workflow files travel inline as TES input content, which servers keep small
+WORKFLOW_INPUT_MAX_BYTES = 128 * 1024
+WORKFLOW_DIR = '/workflow'
+# Finished dispatches kept for progress lookups
+MAX_TRACKED_DISPATCHES = 200
+
+# Engine image and the form key of the file it runs
+WORKFLOW_ENGINES = {
+    'snakemake': {'image': 'snakemake/snakemake:stable', 'main': 'snakefile'},
+    'nextflow': {'image': 'nextflow/nextflow:latest', 'main': 'nextflow_file'},
+    'cwl': {'image': 'quay.io/commonwl/cwltool:latest', 'main': 'cwl_file'},
+}
+
+_pool = ThreadPoolExecutor(max_workers=BATCH_DISPATCH_WORKERS, thread_name_prefix='batch-dispatch')
+_lock = threading.Lock()
+_dispatches = OrderedDict()
+
+def _workflow_command(workflow_type, paths):
+    if workflow_type == 'snakemake':
+        return ['snakemake', '--snakefile', paths['snakefile'], '--cores', '1', '--directory', WORKFLOW_DIR]
+    if workflow_type == 'nextflow':
+        command = ['nextflow', 'run', paths['nextflow_file']]
+        if 'nextflow_config' in paths:
+            command += ['-c', paths['nextflow_config']]
+        if 'nextflow_params' in paths:
+            command += ['-params-file', paths['nextflow_params']]
+        return command
+    command = ['cwltool', '--outdir', f'{WORKFLOW_DIR}/out', paths['cwl_file']]
+    if 'inputs_file' in paths:
+        command.append(paths['inputs_file'])
+    return command
+
+def build_workflow_task(workflow_type, run_id, uploaded_files, params=None):
+    """TES task that runs an uploaded workflow with its engine's container.
+
+    Every uploaded file is passed as an inline input under /workflow; raises
+    ValueError when the main workflow file is missing or a file is too large
+    or not text.
+    """
+    engine = WORKFLOW_ENGINES.get(workflow_type)
+    if engine is None:
+        raise ValueError(f"Unknown workflow type: {workflow_type}")
+    inputs, paths = [], {}
+    for file in uploaded_files:
+        if file['size'] > WORKFLOW_INPUT_MAX_BYTES:
+            raise ValueError(f"{file['filename']} is larger than {WORKFLOW_INPUT_MAX_BYTES} bytes")
+        with open(object_path(file['sha256']), 'rb') as f:
+            try:
+                content = f.read().decode('utf-8')
+            except UnicodeDecodeError:
+                raise ValueError(f"{file['filename']} is not a text file")
+        path = f"{WORKFLOW_DIR}/{os.path.basename(file['filename'])}"
+        paths[file['key']] = path
+        inputs.append({'name': file['key'], 'path': path, 'type': 'FILE', 'content': content})
+    if engine['main'] not in paths:
+        raise ValueError(f"{engine['main']} file is required")
+    if params:
+        paths['nextflow_params'] = f'{WORKFLOW_DIR}/params.json'
+        inputs.append({'name': 'nextflow_params', 'path': paths['nextflow_params'], 'type': 'FILE',
+                       'content': json.dumps(params)})
+    return {
+        'name': f'{workflow_type}-batch-{run_id[:8]}',
+        'description': f'Batch {workflow_type} workflow submitted via TES Dashboard',
+        'inputs': inputs,
+        'outputs': [],
+        'resources': {'cpu_cores': 1, 'ram_gb': 2.0, 'disk_gb': 10.0},
+        'executors': [{
+            'image': engine['image'],
+            'command': _workflow_command(workflow_type, paths),
+            'workdir': WORKFLOW_DIR
+        }],
+        'tags': {'batch_run_id': run_id, 'workflow_type': workflow_type}
+    }
+
+def submit_task_to_instance(tes_url, tes_task, tes_name, submission_method='Batch dispatch', on_created=None):
+    """Create the task on one instance and add it to the task store; returns (local_task, error).
+
+    on_created(local_task), if given, runs before the task is added to the
+    store, so whatever it registers already sees the task's first state change.
+    """
+    response_data, tes_endpoint, error = post_task_document(tes_url, tes_task, tes_name)
+    if error:
+        return None, error
+    task_id = response_data.get('id', str(uuid.uuid4()))
+    initial_state = response_data.get('state', 'QUEUED')
+    if initial_state not in TES_STATES:
+        initial_state = 'QUEUED'
+    executor = tes_task['executors'][0]
+    local_task = {
+        'id': task_id,
+        'task_id': task_id,
+        'name': tes_task['name'],
+        'task_name': tes_task['name'],
+        'description': tes_task.get('description', ''),
+        'state': initial_state,
+        'status': initial_state,
+        'creation_time': response_data.get('creation_time') or datetime.utcnow().isoformat(),
+        'submitted_at': datetime.utcnow().isoformat(),
+        'tes_url': tes_url,
+        'tes_name': tes_name,
+        'tes_endpoint': tes_endpoint,
+        'inputs': tes_task['inputs'],
+        'outputs': tes_task['outputs'],
+        'resources': tes_task['resources'],
+        'executors': tes_task['executors'],
+        'tags': tes_task.get('tags', {}),
+        'docker_image': executor['image'],
+        'command': ' '.join(executor['command']),
+        'response': response_data,
+        'logs': response_data.get('logs', []),
+        'task_log': [],
+        'submitted_by': 'TES Dashboard',
+        'submission_method': submission_method
+    }
+    if on_created is not None:
+        on_created(local_task)
+    add_task(local_task)
+    return local_task, None
+
+class BatchDispatch:
+    """Submission state of one batch run: a result per target instance"""
+
+    def __init__(self, run_id, targets):
+        self.run_id = run_id
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at = None
+        self.lock = threading.Lock()
+        self.results = OrderedDict((target['run_id'], {
+            'run_id': target['run_id'],
+            'tes_name': target['tes_name'],
+            'tes_url': target['tes_url'],
+            'status': 'pending',
+            'task_id': None,
+            'latency_ms': None,
+            'error': None,
+            'started_at': None,
+            'finished_at': None
+        }) for target in targets)
+        self.counts = {'pending': len(self.results), 'submitting': 0, 'accepted': 0, 'rejected': 0}
+
+    def _set_status(self, result, status):
+        # Called with self.lock held
+        self.counts[result['status']] -= 1
+        self.counts[status] += 1
+        result['status'] = status
+
+    def start(self, target_run_id):
+        with self.lock:
+            result = self.results[target_run_id]
+            self._set_status(result, 'submitting')
+            result['started_at'] = datetime.utcnow().isoformat()
+
+    def finish(self, target_run_id, task_id, error, latency_ms):
+        """Record one target's outcome; returns True for the last target to finish"""
+        with self.lock:
+            result = self.results[target_run_id]
+            self._set_status(result, 'rejected' if error else 'accepted')
+            result.update(task_id=task_id, error=error, latency_ms=round(latency_ms, 1),
+                          finished_at=datetime.utcnow().isoformat())
+            if self.counts['pending'] or self.counts['submitting']:
+                return False
+            self.finished_at = result['finished_at']
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            total = len(self.results)
+            completed = self.counts['accepted'] + self.counts['rejected']
+            return {
+                'run_id': self.run_id,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'total': total,
+                'completed': completed,
+                'progress': round(completed / total, 3) if total else 1.0,
+                'counts': dict(self.counts),
+                'results': [dict(result) for result in self.results.values()]
+            }
+
+def _dispatch_one(dispatch, target, tes_task, on_result):
+    dispatch.start(target['run_id'])
+    started = time.monotonic()
+    local_task = None
+    try:
+        task = dict(tes_task, tags=dict(tes_task.get('tags', {}), run_id=target['run_id']))
+        local_task, error = submit_task_to_instance(target['tes_url'], task, target['tes_name'])
+    except Exception as e:
+        error = str(e)
+    latency_ms = (time.monotonic() - started) * 1000
+    last = dispatch.finish(target['run_id'], local_task and local_task['task_id'], error, latency_ms)
+    if on_result is not None:
+        try:
+            on_result(target, local_task, error)
+        except Exception as e:
+            print(f"⚠️ Could not record dispatch result for {target['run_id']}: {str(e)}")
+    if error:
+        print(f"❌ Batch {dispatch.run_id} rejected by {target['tes_name']} after {latency_ms:.0f} ms: {error}")
+    if last:
+        counts = dispatch.snapshot()['counts']
+        print(f"🚀 Batch {dispatch.run_id} dispatched: {counts['accepted']} accepted, {counts['rejected']} rejected")
+
+def dispatch_batch(run_id, tes_task, targets, on_result=None):
+    """Submit tes_task to every target ({run_id, tes_url, tes_name}) through the shared pool.
+
+    Returns the BatchDispatch handle immediately; on_result(target, local_task,
+    error) is called from the pool as each submission finishes.
+    """
+    dispatch = BatchDispatch(run_id, targets)
+    with _lock:
+        _dispatches[run_id] = dispatch
+        while len(_dispatches) > MAX_TRACKED_DISPATCHES:
+            _dispatches.popitem(last=False)
+    for target in targets:
+        _pool.submit(_dispatch_one, dispatch, target, tes_task, on_result)
+    return dispatch
+
+def get_dispatch(run_id):
+    with _lock:
+        return _dispatches.get(run_id)
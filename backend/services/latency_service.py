@@ -0,0 +1,216 @@
+import heapq
+import math
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from config import LATENCY_PROBE_INTERVAL, LATENCY_PROBE_TIMEOUT
+from utils.tes_utils import load_tes_location_data, get_tes_config_version
+
+# Weight of the newest sample in the smoothed RTT
+EWMA_ALPHA = 0.3
+# Round-trip milliseconds per kilometre of great-circle distance, assuming
+# light in fibre (~200 km/ms one way) and a typical 2x routing detour.
+RTT_MS_PER_KM = 0.02
+NAN = float('nan')
+
+_lock = threading.Lock()
+_session = requests.Session()
+_config_version = None
+_instance_ids = []
+_instance_index = {}
+_instances = {}
+_rtt_ms = array('d')
+_last_probe = array('d')
+_failures = array('l')
+_samples = array('l')
+_measurement_version = 0
+_matrix_cache = None
+_adjacency_cache = {}
+
+def _ensure_layout():
+    """Re-index the measurement arrays when the instance configuration changes"""
+    global _config_version, _instance_ids, _instance_index, _instances, _rtt_ms, _last_probe, _failures, _samples
+    global _measurement_version, _matrix_cache
+    version = get_tes_config_version()
+    if version == _config_version:
+        return
+    locations = load_tes_location_data()
+    previous = {instance_id: index for index, instance_id in enumerate(_instance_ids)}
+    ids = [loc['id'] for loc in locations]
+    rtt_ms, last_probe, failures, samples = array('d'), array('d'), array('l'), array('l')
+    for instance_id in ids:
+        old = previous.get(instance_id)
+        rtt_ms.append(_rtt_ms[old] if old is not None else NAN)
+        last_probe.append(_last_probe[old] if old is not None else 0.0)
+        failures.append(_failures[old] if old is not None else 0)
+        samples.append(_samples[old] if old is not None else 0)
+    _instance_ids = ids
+    _instance_index = {instance_id: index for index, instance_id in enumerate(ids)}
+    _instances = {loc['id']: loc for loc in locations}
+    _rtt_ms, _last_probe, _failures, _samples = rtt_ms, last_probe, failures, samples
+    _config_version = version
+    _measurement_version += 1
+    _matrix_cache = None
+    _adjacency_cache.clear()
+
+def _probe(instance):
+    url = instance.get('url', '').rstrip('/')
+    if not url:
+        return None
+    try:
+        # Any HTTP answer proves reachability; elapsed excludes body download
+        response = _session.get(f"{url}/ga4gh/tes/v1/service-info", timeout=LATENCY_PROBE_TIMEOUT)
+        return response.elapsed.total_seconds() * 1000
+    except requests.exceptions.RequestException:
+        return None
+
+def record_rtt(instance_id, rtt_ms):
+    """Fold one backend -> instance RTT sample (None for a failed probe) into the smoothed value"""
+    global _measurement_version, _matrix_cache
+    with _lock:
+        _ensure_layout()
+        index = _instance_index.get(instance_id)
+        if index is None:
+            return
+        _last_probe[index] = time.time()
+        if rtt_ms is None:
+            _failures[index] += 1
+        else:
+            previous = _rtt_ms[index]
+            _rtt_ms[index] = rtt_ms if math.isnan(previous) else EWMA_ALPHA * rtt_ms + (1 - EWMA_ALPHA) * previous
+            _failures[index] = 0
+            _samples[index] += 1
+        _measurement_version += 1
+        _matrix_cache = None
+        _adjacency_cache.clear()
+
+def probe_all_instances():
+    with _lock:
+        _ensure_layout()
+        instances = list(_instances.values())
+    if not instances:
+        return
+    with ThreadPoolExecutor(max_workers=min(16, len(instances))) as pool:
+        for instance, rtt_ms in zip(instances, pool.map(_probe, instances)):
+            record_rtt(instance['id'], rtt_ms)
+
+def _run_latency_monitor():
+    while True:
+        try:
+            probe_all_instances()
+        except Exception as e:
+            print(f"Error in latency monitor loop: {str(e)}")
+        time.sleep(LATENCY_PROBE_INTERVAL)
+
+def start_latency_monitor():
+    if getattr(start_latency_monitor, 'started', False):
+        return None
+    monitor_thread = threading.Thread(target=_run_latency_monitor, daemon=True)
+    monitor_thread.start()
+    start_latency_monitor.started = True
+    print("Started background latency monitor thread")
+    return monitor_thread
+
+def _has_coordinates(instance):
+    return bool(instance.get('lat') or instance.get('lng'))
+
+def _great_circle_km(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (a.get('lat', 0), a.get('lng', 0), b.get('lat', 0), b.get('lng', 0)))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(h)))
+
+def _estimate_pair(rtt_a, rtt_b, instance_a, instance_b):
+    # We only measure backend -> instance. The triangle inequality bounds the
+    # instance <-> instance RTT to [|a - b|, a + b]; within that range the
+    # geographic propagation delay is the best available estimate.
+    if math.isnan(rtt_a) or math.isnan(rtt_b):
+        return NAN
+    lower, upper = abs(rtt_a - rtt_b), rtt_a + rtt_b
+    if _has_coordinates(instance_a) and _has_coordinates(instance_b):
+        estimate = _great_circle_km(instance_a, instance_b) * RTT_MS_PER_KM
+    else:
+        estimate = upper / 2
+    return min(max(estimate, lower), upper)
+
+def _build_matrix():
+    """Return (version, ids, flat n*n array of estimated RTTs), rebuilt only after new measurements"""
+    global _matrix_cache
+    with _lock:
+        _ensure_layout()
+        if _matrix_cache is not None and _matrix_cache[0] == _measurement_version:
+            return _matrix_cache
+        ids = list(_instance_ids)
+        rtts = array('d', _rtt_ms)
+        instances = [_instances[instance_id] for instance_id in ids]
+        version = _measurement_version
+
+    n = len(ids)
+    matrix = array('d', [NAN]) * (n * n)
+    for i in range(n):
+        matrix[i * n + i] = 0.0
+        for j in range(i + 1, n):
+            value = _estimate_pair(rtts[i], rtts[j], instances[i], instances[j])
+            matrix[i * n + j] = value
+            matrix[j * n + i] = value
+
+    with _lock:
+        if version == _measurement_version:
+            _matrix_cache = (version, ids, matrix)
+    return version, ids, matrix
+
+def _rounded(value):
+    return None if math.isnan(value) else round(value, 1)
+
+def get_latency_matrix():
+    version, ids, matrix = _build_matrix()
+    n = len(ids)
+    return {
+        'instances': ids,
+        'matrix': [[_rounded(matrix[i * n + j]) for j in range(n)] for i in range(n)],
+        'version': version
+    }
+
+def get_instance_latencies():
+    with _lock:
+        _ensure_layout()
+        now = time.time()
+        return {
+            instance_id: {
+                'rtt_ms': _rounded(_rtt_ms[index]),
+                'samples': _samples[index],
+                'consecutive_failures': _failures[index],
+                'reachable': _samples[index] > 0 and _failures[index] == 0,
+                'last_probe_age_s': round(now - _last_probe[index], 1) if _last_probe[index] else None
+            }
+            for index, instance_id in enumerate(_instance_ids)
+        }
+
+def get_adjacency(top_k=None):
+    """Cached connection list: every measured pair, or only each instance's top_k nearest neighbours"""
+    version, ids, matrix = _build_matrix()
+    cache_key = (version, top_k)
+    with _lock:
+        cached = _adjacency_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    n = len(ids)
+    connections = []
+    if top_k:
+        for i in range(n):
+            row = ((matrix[i * n + j], j) for j in range(n) if j != i and not math.isnan(matrix[i * n + j]))
+            for value, j in heapq.nsmallest(top_k, row):
+                connections.append({'source': ids[i], 'target': ids[j], 'latency': round(value, 1)})
+    else:
+        for i in range(n):
+            for j in range(i + 1, n):
+                value = matrix[i * n + j]
+                if not math.isnan(value):
+                    connections.append({'source': ids[i], 'target': ids[j], 'latency': round(value, 1)})
+
+    with _lock:
+        if version == _measurement_version:
+            _adjacency_cache[cache_key] = connections
+    return connections
@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import deque
+from config import LOG_FOLLOW_MIN_INTERVAL, LOG_FOLLOW_MAX_INTERVAL, LOG_FOLLOW_IDLE_TIMEOUT, LOG_FOLLOW_MAX_FAILURES
+from services.tes_service import resolve_task_document, TASK_NOT_FOUND_ERROR
+from services.log_service import LOG_STREAMS, LOG_PAGE_BYTES, get_attempt_logs
+from services.log_store_service import BlobReader, add_blob_roots
+
+TERMINAL_STATES = {'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+# Events kept for viewers that fall behind; older ones are replaced by a snapshot
+FOLLOW_BUFFER_EVENTS = 256
+
+class LogFollower:
+    """One upstream poller for a task, fanning new stdout/stderr out to every viewer.
+
+    The poll interval doubles while nothing changes, up to
+    LOG_FOLLOW_MAX_INTERVAL, and drops back to LOG_FOLLOW_MIN_INTERVAL as soon
+    as new output appears. The poller exits once the task reaches a terminal
+    state, nobody has watched it for LOG_FOLLOW_IDLE_TIMEOUT seconds, or the
+    task is gone or LOG_FOLLOW_MAX_FAILURES polls in a row failed; the last
+    two end every viewer's stream with an error event.
+    """
+
+    def __init__(self, tes_url, task_id):
+        self.tes_url = tes_url
+        self.task_id = task_id
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=FOLLOW_BUFFER_EVENTS)
+        self.sequence = 0
+        # (executor, stream) -> {'digest', 'length': bytes seen, 'tail': last LOG_PAGE_BYTES of them}
+        self.streams = {}
+        self.state = None
+        self.error = None
+        self.failures = 0
+        self.finished = False
+        self.viewers = 0
+        self.last_viewer_seen = time.monotonic()
+        self.interval = LOG_FOLLOW_MIN_INTERVAL
+        self.polls = 0
+
+    def _publish(self, event):
+        # Called with self.condition held
+        self.sequence += 1
+        self.events.append((self.sequence, event))
+        self.condition.notify_all()
+
+    def _diff(self, key, digest, size, read):
+        """Event for one stream's new content, or None; read(offset, length=None) returns its bytes.
+
+        Only the byte length and the last LOG_PAGE_BYTES already sent are kept,
+        so the check that the stream grew rather than being rewritten compares
+        that tail, and only the appended range is read from the blob.
+        """
+        seen = self.streams.get(key, {'length': 0, 'tail': b''})
+        length, tail = seen['length'], seen['tail']
+        if size >= length and read(length - len(tail), len(tail)) == tail:
+            if size == length:
+                if key in self.streams:
+                    self.streams[key]['digest'] = digest
+                return None
+            start = length
+            kind = 'append'
+        else:
+            # Instances that only keep the tail of the output rewrite it
+            start = max(size - LOG_PAGE_BYTES, 0)
+            kind = 'reset'
+        if size - start > LOG_PAGE_BYTES:
+            # More output arrived than a viewer is shown at once; skip to its tail
+            start = size - LOG_PAGE_BYTES
+            kind = 'reset'
+        data = read(start)
+        # Hold back a multi-byte character cut off at the end until the rest arrives
+        data = data[:_complete_utf8(data)]
+        if not data:
+            return None
+        end = start + len(data)
+        kept = (tail if kind == 'append' else b'') + data
+        self.streams[key] = {'digest': digest, 'length': end, 'tail': kept[-LOG_PAGE_BYTES:]}
+        return {'type': kind, 'executor': key[0], 'stream': key[1], 'offset': start,
+                'data': data.decode('utf-8', errors='replace')}
+
+    def _apply(self, document):
+        # Only the poller thread writes self.streams, so the blob reads can
+        # happen before taking the lock that viewers wait on.
+        updates = []
+        for executor, executor_log in enumerate(get_attempt_logs(document)):
+            for stream in LOG_STREAMS:
+                key = (executor, stream)
+                # Large output arrives as a log store reference; only read it when it changed
+                digest = executor_log.get(f"{stream}_blob")
+                if digest and self.streams.get(key, {}).get('digest') == digest:
+                    continue
+                if digest:
+                    try:
+                        with BlobReader(digest) as reader:
+                            event = self._diff(key, digest, reader.size, reader.read)
+                    except (OSError, ValueError) as e:
+                        print(f"⚠️ Could not read log blob {digest}: {e}")
+                        continue
+                else:
+                    data = (executor_log.get(stream) or '').encode('utf-8')
+                    event = self._diff(key, None, len(data),
+                                       lambda offset, length=None: data[offset:] if length is None else data[offset:offset + length])
+                if event:
+                    updates.append(event)
+
+        changed = bool(updates)
+        with self.condition:
+            for event in updates:
+                self._publish(event)
+            state = document.get('state')
+            if state != self.state:
+                self.state = state
+                changed = True
+                self._publish({'type': 'state', 'state': state})
+            if state in TERMINAL_STATES:
+                self.finished = True
+                self._publish({'type': 'end', 'state': state})
+        return changed
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.viewers == 0 and time.monotonic() - self.last_viewer_seen > LOG_FOLLOW_IDLE_TIMEOUT:
+                    self.finished = True
+                    self.condition.notify_all()
+                if self.finished:
+                    break
+            result, error = resolve_task_document(self.tes_url, self.task_id, ('FULL',), fresh=True)
+            self.polls += 1
+            self.failures = self.failures + 1 if error else 0
+            if error and (error == TASK_NOT_FOUND_ERROR or self.failures >= LOG_FOLLOW_MAX_FAILURES):
+                print(f"⚠️ Stopped following {self.task_id} on {self.tes_url}: {error}")
+                with self.condition:
+                    self.error = error
+                    self.finished = True
+                    self._publish({'type': 'error', 'error': error})
+                break
+            if result and self._apply(result['task']):
+                self.interval = LOG_FOLLOW_MIN_INTERVAL
+            else:
+                self.interval = min(self.interval * 2, LOG_FOLLOW_MAX_INTERVAL)
+            if self.finished:
+                break
+            with self.condition:
+                # A new viewer wakes the poller so it does not sit out a long backoff
+                self.condition.wait(self.interval)
+        _forget(self)
+
+    def snapshot(self):
+        """Current tail of every stream for a viewer that is joining (or fell behind)"""
+        events = [{'type': 'state', 'state': self.state}] if self.state else []
+        for (executor, stream), seen in sorted(self.streams.items()):
+            tail = seen['tail']
+            start = seen['length'] - len(tail)
+            # The kept tail can begin inside a multi-byte character
+            skip = 0
+            while skip < min(len(tail), 3) and tail[skip] & 0xC0 == 0x80:
+                skip += 1
+            events.append({'type': 'snapshot', 'executor': executor, 'stream': stream, 'offset': start + skip,
+                           'data': tail[skip:].decode('utf-8', errors='replace')})
+        if self.finished and self.state in TERMINAL_STATES:
+            events.append({'type': 'end', 'state': self.state})
+        elif self.finished and self.error:
+            events.append({'type': 'error', 'error': self.error})
+        return events
+
+    def watch(self, heartbeat=15):
+        """Yield events for one viewer, or None as a keep-alive when nothing happened for heartbeat seconds"""
+        with self.condition:
+            self.viewers += 1
+            self.interval = LOG_FOLLOW_MIN_INTERVAL
+            self.condition.notify_all()
+            pending = self.snapshot()
+            last_sequence = self.sequence
+        try:
+            for event in pending:
+                yield event
+            while True:
+                with self.condition:
+                    if self.sequence == last_sequence and not self.finished:
+                        self.condition.wait(heartbeat)
+                    if self.events and self.events[0][0] > last_sequence + 1:
+                        pending = self.snapshot()
+                    else:
+                        pending = [event for sequence, event in self.events if sequence > last_sequence]
+                    last_sequence = self.sequence
+                    done = self.finished
+                if not pending and not done:
+                    yield None
+                for event in pending:
+                    yield event
+                if done:
+                    return
+        finally:
+            with self.condition:
+                self.viewers -= 1
+                self.last_viewer_seen = time.monotonic()
+
+def _complete_utf8(data):
+    """Length of data without a trailing UTF-8 sequence that is still incomplete"""
+    for back in range(1, min(len(data), 4) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:
+            # Lead byte: how many bytes its character needs
+            needed = 1 if byte < 0x80 else 2 if byte >= 0xC0 and byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return len(data) - back if needed > back and byte >= 0xC0 else len(data)
+    return len(data)
+
+_lock = threading.Lock()
+_followers = {}
+
+def _forget(follower):
+    with _lock:
+        key = (follower.tes_url.rstrip('/'), follower.task_id)
+        if _followers.get(key) is follower:
+            del _followers[key]
+
+def follow_task_logs(tes_url, task_id, heartbeat=15):
+    """Attach a viewer to the task's shared follower, starting its poller if needed"""
+    key = (tes_url.rstrip('/'), task_id)
+    with _lock:
+        follower = _followers.get(key)
+        if follower is None or follower.finished:
+            follower = _followers[key] = LogFollower(tes_url, task_id)
+            threading.Thread(target=follower.run, daemon=True).start()
+    return follower.watch(heartbeat)
+
+def _followed_blob_refs():
+    with _lock:
+        followers = list(_followers.values())
+    return [seen['digest'] for follower in followers for seen in list(follower.streams.values()) if seen.get('digest')]
+
+add_blob_roots(_followed_blob_refs)
+
+def get_follow_stats():
+    with _lock:
+        return [
+            {'tes_url': f.tes_url, 'task_id': f.task_id, 'viewers': f.viewers, 'polls': f.polls,
+             'interval': f.interval, 'state': f.state, 'failures': f.failures}
+            for f in _followers.values()
+        ]
@@ -0,0 +1,171 @@
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from services.log_store_service import BlobReader, add_blob_roots
+
+LOG_STREAMS = ('stdout', 'stderr')
+LOG_INDEX_CACHE_SIZE = 32
+# Largest slice returned by a single read, whatever range was asked for
+LOG_PAGE_BYTES = 256 * 1024
+
+class LogText:
+    """UTF-8 bytes of one executor stream plus the byte offset where each line starts"""
+
+    def __init__(self, text):
+        self.data = (text or '').encode('utf-8')
+        self.line_starts = array('q', [0])
+        find = self.data.find
+        position = find(b'\n')
+        while position != -1:
+            self.line_starts.append(position + 1)
+            position = find(b'\n', position + 1)
+        # A trailing newline does not start another line
+        if len(self.line_starts) > 1 and self.line_starts[-1] == len(self.data):
+            self.line_starts.pop()
+        if not self.data:
+            self.line_starts = array('q')
+
+    @property
+    def total_bytes(self):
+        return len(self.data)
+
+    @property
+    def total_lines(self):
+        return len(self.line_starts)
+
+    def byte_range(self, offset, length=None):
+        offset = min(max(offset, 0), len(self.data))
+        end = len(self.data) if length is None else min(offset + max(length, 0), len(self.data))
+        return self.data[offset:end], offset, end
+
+    def _line_offset(self, line):
+        return self.line_starts[line] if line < self.total_lines else len(self.data)
+
+    def line_range(self, start, end=None, max_bytes=None):
+        """Lines [start, end) by zero-based index, cut short after max_bytes (at least one line)"""
+        start = min(max(start, 0), self.total_lines)
+        end = self.total_lines if end is None else min(max(end, start), self.total_lines)
+        byte_start = self._line_offset(start)
+        if max_bytes is not None and self._line_offset(end) - byte_start > max_bytes:
+            end = max(bisect.bisect_right(self.line_starts, byte_start + max_bytes) - 1, start + 1)
+        return self.data[byte_start:self._line_offset(end)], start, end
+
+    def tail(self, lines, max_bytes=None):
+        """The last lines, dropping the oldest of them beyond max_bytes (at least one line)"""
+        end = self.total_lines
+        start = max(end - max(lines, 0), 0)
+        byte_end = len(self.data)
+        if max_bytes is not None and byte_end - self._line_offset(start) > max_bytes:
+            start = min(bisect.bisect_left(self.line_starts, byte_end - max_bytes), max(end - 1, 0))
+        return self.data[self._line_offset(start):byte_end], start, end
+
+class StoredLog:
+    """A stream kept in the log store: byte ranges, line ranges and tails decompress only the frames they touch"""
+
+    def __init__(self, digest, total_bytes, total_lines):
+        self.digest = digest
+        self.total_bytes = total_bytes
+        self.total_lines = total_lines
+
+    def byte_range(self, offset, length=None):
+        offset = min(max(offset, 0), self.total_bytes)
+        end = self.total_bytes if length is None else min(offset + max(length, 0), self.total_bytes)
+        with BlobReader(self.digest) as reader:
+            return reader.read(offset, end - offset), offset, end
+
+    def tail(self, lines, max_bytes=None):
+        with BlobReader(self.digest) as reader:
+            data, _ = reader.tail_lines(lines, max_bytes or self.total_bytes)
+        returned = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+        return data, self.total_lines - returned, self.total_lines
+
+    def line_range(self, start, end=None, max_bytes=None):
+        """Same as LogText.line_range, using the per-frame newline counts of the blob to find the lines"""
+        start = min(max(start, 0), self.total_lines)
+        end = self.total_lines if end is None else min(max(end, start), self.total_lines)
+        with BlobReader(self.digest) as reader:
+            byte_start = reader.line_offset(start)
+            byte_end = reader.line_offset(end)
+            if max_bytes is None or byte_end - byte_start <= max_bytes:
+                return reader.read(byte_start, byte_end - byte_start), start, end
+            # Keep the whole lines that fit, but always return at least one
+            data = reader.read(byte_start, max_bytes)
+            fitting = data.count(b'\n')
+            if fitting:
+                return data[:data.rfind(b'\n') + 1], start, start + fitting
+            return reader.read(byte_start, reader.line_offset(start + 1) - byte_start), start, start + 1
+
+_index_lock = threading.Lock()
+# (tes_url, task_id, attempt, executor, stream, length) -> LogText
+_index_cache = OrderedDict()
+
+def _indexed_blob_refs():
+    with _index_lock:
+        return [log_text.digest for log_text in _index_cache.values() if isinstance(log_text, StoredLog)]
+
+add_blob_roots(_indexed_blob_refs)
+
+def get_attempt_logs(task_document, attempt=-1):
+    """Executor logs of one task attempt (the latest by default)"""
+    task_logs = (task_document or {}).get('logs') or []
+    if not task_logs:
+        return []
+    try:
+        return task_logs[attempt].get('logs') or []
+    except IndexError:
+        return []
+
+def describe_streams(task_document, attempt=-1):
+    """Sizes of every executor stream so a viewer can decide what to page through"""
+    streams = []
+    for index, executor_log in enumerate(get_attempt_logs(task_document, attempt)):
+        entry = {'executor': index, 'exit_code': executor_log.get('exit_code')}
+        for stream in LOG_STREAMS:
+            stored_bytes = executor_log.get(f"{stream}_bytes")
+            entry[f"{stream}_bytes"] = stored_bytes if stored_bytes is not None else len((executor_log.get(stream) or '').encode('utf-8'))
+        streams.append(entry)
+    return streams
+
+def get_log_text(tes_url, task_id, task_document, attempt, executor, stream):
+    """Return a LogText (inline stream) or StoredLog (log store) for one executor stream, or None"""
+    executor_logs = get_attempt_logs(task_document, attempt)
+    if stream not in LOG_STREAMS or not -len(executor_logs) <= executor < len(executor_logs):
+        return None
+    executor_log = executor_logs[executor]
+    digest = executor_log.get(f"{stream}_blob")
+    text = executor_log.get(stream) or ''
+    key = ((tes_url or '').rstrip('/'), task_id, attempt, executor % len(executor_logs), stream, digest or len(text))
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None:
+            _index_cache.move_to_end(key)
+            return cached
+    if digest:
+        log_text = StoredLog(digest, executor_log.get(f"{stream}_bytes", 0), executor_log.get(f"{stream}_lines", 0))
+    else:
+        log_text = LogText(text)
+    with _index_lock:
+        _index_cache[key] = log_text
+        while len(_index_cache) > LOG_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return log_text
+
+def read_log(log_text, offset=None, length=None, start_line=None, end_line=None, tail=None):
+    """Slice a LogText by bytes, lines or tail and describe what was returned"""
+    if tail is not None:
+        data, start, end = log_text.tail(tail, LOG_PAGE_BYTES)
+        unit = 'lines'
+    elif start_line is not None or end_line is not None:
+        data, start, end = log_text.line_range(start_line or 0, end_line, LOG_PAGE_BYTES)
+        unit = 'lines'
+    else:
+        data, start, end = log_text.byte_range(offset or 0, min(length or LOG_PAGE_BYTES, LOG_PAGE_BYTES))
+        unit = 'bytes'
+    return {
+        'content': data.decode('utf-8', errors='replace'),
+        'range': {'unit': unit, 'start': start, 'end': end},
+        'total_bytes': log_text.total_bytes,
+        'total_lines': log_text.total_lines,
+        'has_more': end < (log_text.total_lines if unit == 'lines' else log_text.total_bytes),
+    }
@@ -0,0 +1,429 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from config import LOG_STORE_DIR, LOG_STORE_FRAME_BYTES, LOG_STORE_INLINE_BYTES, LOG_STORE_GC_INTERVAL, LOG_STORE_GC_GRACE
+from utils.json_stream import parse_json_stream
+
+LOG_STREAMS = ('stdout', 'stderr')
+# raw_size, frame_size, frame_count, magic
+FOOTER = struct.Struct('<QII4s')
+# TLB2 blobs also store the newline count of every frame; TLB1 ones are still read
+FOOTER_MAGIC = b'TLB2'
+FOOTER_MAGICS = (b'TLB1', FOOTER_MAGIC)
+
+_lock = threading.Lock()
+_stats = {'blobs_written': 0, 'blobs_deduplicated': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+_gc_totals = {'passes': 0, 'deleted_blobs': 0, 'reclaimed_bytes': 0}
+_last_gc = None
+# Callables returning the digests their module still refers to
+_root_providers = []
+
+def _blob_path(digest):
+    return os.path.join(LOG_STORE_DIR, digest[:2], digest)
+
+def _touch(path):
+    """Mark an existing blob as just used so the collector leaves it alone; False if it is gone"""
+    with _lock:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        _stats['blobs_deduplicated'] += 1
+        return True
+
+class BlobWriter:
+    """Write a blob incrementally, hashing, framing and compressing it as it arrives.
+
+    Layout: compressed frames back to back, then the end offset of every
+    frame and the number of newlines in it (uint64 each) and a fixed footer,
+    so a reader can seek straight to the frames covering a byte or line
+    range. Memory use is about one frame.
+    """
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.pending = bytearray()
+        self.size = 0
+        self.newlines = 0
+        self.last_byte = b''
+        self.frame_ends = array('Q')
+        self.frame_newlines = array('Q')
+        self.written = 0
+        self.handle = None
+        self.temp_path = None
+
+    def _write_frame(self, frame):
+        if self.handle is None:
+            os.makedirs(LOG_STORE_DIR, exist_ok=True)
+            fd, self.temp_path = tempfile.mkstemp(dir=LOG_STORE_DIR, prefix='.tmp-')
+            self.handle = os.fdopen(fd, 'wb')
+        compressed = zlib.compress(frame, 6)
+        self.handle.write(compressed)
+        self.written += len(compressed)
+        self.frame_ends.append(self.written)
+        self.frame_newlines.append(frame.count(b'\n'))
+
+    def write(self, data):
+        if not data:
+            return
+        self.hasher.update(data)
+        self.size += len(data)
+        self.newlines += data.count(b'\n')
+        self.last_byte = data[-1:]
+        self.pending += data
+        while len(self.pending) >= LOG_STORE_FRAME_BYTES:
+            self._write_frame(bytes(self.pending[:LOG_STORE_FRAME_BYTES]))
+            del self.pending[:LOG_STORE_FRAME_BYTES]
+
+    @property
+    def lines(self):
+        return self.newlines + (1 if self.size and self.last_byte != b'\n' else 0)
+
+    def close(self):
+        """Finish the blob and return its sha256; identical content is stored once"""
+        try:
+            if self.pending or self.handle is None:
+                self._write_frame(bytes(self.pending))
+                self.pending.clear()
+            self.handle.write(self.frame_ends.tobytes())
+            self.handle.write(self.frame_newlines.tobytes())
+            self.handle.write(FOOTER.pack(self.size, LOG_STORE_FRAME_BYTES, len(self.frame_ends), FOOTER_MAGIC))
+            self.handle.close()
+            digest = self.hasher.hexdigest()
+            path = _blob_path(digest)
+            if _touch(path):
+                os.remove(self.temp_path)
+                return digest
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Concurrent writers of the same content produce identical files
+            os.replace(self.temp_path, path)
+        except Exception:
+            self.abort()
+            raise
+        with _lock:
+            _stats['blobs_written'] += 1
+            _stats['raw_bytes'] += self.size
+            _stats['stored_bytes'] += self.written + len(self.frame_ends) * 16 + FOOTER.size
+        return digest
+
+    def abort(self):
+        if self.handle is not None and not self.handle.closed:
+            self.handle.close()
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def put_blob(data):
+    """Store bytes in the log store and return their sha256"""
+    digest = hashlib.sha256(data).hexdigest()
+    if _touch(_blob_path(digest)):
+        return digest
+    writer = BlobWriter()
+    writer.write(data)
+    return writer.close()
+
+class BlobReader:
+    """Random access to a stored blob, decompressing only the frames a read touches"""
+
+    def __init__(self, digest):
+        self.digest = digest
+        self.handle = open(_blob_path(digest), 'rb')
+        self.handle.seek(-FOOTER.size, os.SEEK_END)
+        self.size, self.frame_size, frame_count, magic = FOOTER.unpack(self.handle.read(FOOTER.size))
+        if magic not in FOOTER_MAGICS:
+            self.handle.close()
+            raise ValueError(f"Not a log blob: {digest}")
+        tables = 2 if magic == FOOTER_MAGIC else 1
+        self.handle.seek(-FOOTER.size - tables * frame_count * 8, os.SEEK_END)
+        self.frame_ends = array('Q')
+        self.frame_ends.frombytes(self.handle.read(frame_count * 8))
+        self.frame_newlines = None
+        if tables == 2:
+            self.frame_newlines = array('Q')
+            self.frame_newlines.frombytes(self.handle.read(frame_count * 8))
+        self._frame_lines = None
+        self._last_frame = (None, b'')
+
+    def close(self):
+        self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _frame(self, index):
+        # Locating a line and reading from it usually touch the same frame
+        if self._last_frame[0] == index:
+            return self._last_frame[1]
+        start = self.frame_ends[index - 1] if index else 0
+        self.handle.seek(start)
+        data = zlib.decompress(self.handle.read(self.frame_ends[index] - start))
+        self._last_frame = (index, data)
+        return data
+
+    @property
+    def frame_lines(self):
+        """Newlines before each frame, plus the total at the end"""
+        if self._frame_lines is None:
+            newlines = self.frame_newlines
+            if newlines is None:
+                # TLB1 blobs have no counts; count one frame at a time
+                newlines = [self._frame(index).count(b'\n') for index in range(len(self.frame_ends))]
+            self._frame_lines = array('Q', [0])
+            for count in newlines:
+                self._frame_lines.append(self._frame_lines[-1] + count)
+        return self._frame_lines
+
+    def line_offset(self, line):
+        """Byte offset where the zero-based line starts (the blob size past the last line)"""
+        if line <= 0:
+            return 0
+        frame_lines = self.frame_lines
+        if line > frame_lines[-1]:
+            return self.size
+        # The line starts after the line-th newline; find its frame and decompress only that one
+        index = bisect_left(frame_lines, line) - 1
+        data = self._frame(index)
+        position = -1
+        for _ in range(line - frame_lines[index]):
+            position = data.find(b'\n', position + 1)
+        return min(index * self.frame_size + position + 1, self.size)
+
+    def read(self, offset=0, length=None):
+        offset = min(max(offset, 0), self.size)
+        end = self.size if length is None else min(offset + max(length, 0), self.size)
+        if end <= offset:
+            return b''
+        first, last = offset // self.frame_size, (end - 1) // self.frame_size
+        data = b''.join(self._frame(index) for index in range(first, last + 1))
+        base = first * self.frame_size
+        return data[offset - base:end - base]
+
+    def tail_lines(self, lines, max_bytes):
+        """(data, start_offset) holding the last lines, reading frames backwards only as far as needed"""
+        if not self.size or lines <= 0:
+            return b'', self.size
+        data = b''
+        index = len(self.frame_ends) - 1
+        # The first wanted line starts after the lines-th newline from the end,
+        # not counting a newline that terminates the final line
+        while index >= 0 and data.count(b'\n', 0, max(len(data) - 1, 0)) < lines and len(data) < max_bytes:
+            data = self._frame(index) + data
+            index -= 1
+        cut = len(data) - 1
+        for _ in range(lines):
+            cut = data.rfind(b'\n', 0, cut)
+            if cut == -1:
+                break
+        start = max(cut + 1, len(data) - max_bytes)
+        return data[start:], self.size - len(data) + start
+
+def get_blob(digest):
+    with BlobReader(digest) as reader:
+        return reader.read()
+
+def externalize_logs(task_logs):
+    """Copy of TES task logs with large stdout/stderr moved into the blob store.
+
+    Each moved stream is replaced by '<stream>_blob' (the content hash),
+    '<stream>_bytes' and '<stream>_lines'; short streams stay inline.
+    """
+    externalized = []
+    for task_log in task_logs or []:
+        task_log = dict(task_log)
+        executor_logs = []
+        for executor_log in task_log.get('logs') or []:
+            executor_log = dict(executor_log)
+            for stream in LOG_STREAMS:
+                text = executor_log.get(stream)
+                if not text:
+                    continue
+                data = text.encode('utf-8')
+                if len(data) <= LOG_STORE_INLINE_BYTES:
+                    continue
+                del executor_log[stream]
+                executor_log[f"{stream}_blob"] = put_blob(data)
+                executor_log[f"{stream}_bytes"] = len(data)
+                executor_log[f"{stream}_lines"] = data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+            executor_logs.append(executor_log)
+        if 'logs' in task_log:
+            task_log['logs'] = executor_logs
+        externalized.append(task_log)
+    return externalized
+
+class LogStreamSink:
+    """Receives one stdout/stderr value from the streaming parser.
+
+    Short values stay inline; once LOG_STORE_INLINE_BYTES is exceeded the
+    rest goes straight into a BlobWriter.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = bytearray()
+        self.writer = None
+
+    def write(self, data):
+        if self.writer is None:
+            self.buffer += data
+            if len(self.buffer) <= LOG_STORE_INLINE_BYTES:
+                return
+            self.writer = BlobWriter()
+            data = bytes(self.buffer)
+            self.buffer.clear()
+        self.writer.write(data)
+
+    def finish(self):
+        if self.writer is None:
+            return {self.stream: self.buffer.decode('utf-8', errors='replace')}
+        return {
+            f"{self.stream}_blob": self.writer.close(),
+            f"{self.stream}_bytes": self.writer.size,
+            f"{self.stream}_lines": self.writer.lines,
+        }
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+
+TASK_LOG_STREAM_PATHS = {('logs', '*', 'logs', '*', stream) for stream in LOG_STREAMS}
+
+def parse_task_document(chunks):
+    """Parse a TES task document from byte chunks, sending executor stdout/stderr
+    to the log store as it is read instead of building the whole strings.
+
+    The result has the same shape as a document passed through externalize_logs.
+    """
+    return parse_json_stream(chunks, TASK_LOG_STREAM_PATHS, lambda path: LogStreamSink(path[-1]))
+
+def iter_blob_refs(task_logs):
+    """Digests referenced by externalized task logs"""
+    for task_log in task_logs or []:
+        for executor_log in task_log.get('logs') or []:
+            for stream in LOG_STREAMS:
+                digest = executor_log.get(f"{stream}_blob")
+                if digest:
+                    yield digest
+
+def has_blob_refs(task_logs):
+    return next(iter_blob_refs(task_logs), None) is not None
+
+def hydrate_logs(task_logs):
+    """Inverse of externalize_logs: read every referenced stream back into the log entries"""
+    hydrated = []
+    for task_log in task_logs or []:
+        task_log = dict(task_log)
+        executor_logs = []
+        for executor_log in task_log.get('logs') or []:
+            executor_log = dict(executor_log)
+            for stream in LOG_STREAMS:
+                digest = executor_log.pop(f"{stream}_blob", None)
+                executor_log.pop(f"{stream}_bytes", None)
+                executor_log.pop(f"{stream}_lines", None)
+                if digest:
+                    try:
+                        executor_log[stream] = get_blob(digest).decode('utf-8', errors='replace')
+                    except (OSError, ValueError) as e:
+                        print(f"⚠️ Could not read log blob {digest}: {e}")
+                        executor_log[stream] = ''
+            executor_logs.append(executor_log)
+        if 'logs' in task_log:
+            task_log['logs'] = executor_logs
+        hydrated.append(task_log)
+    return hydrated
+
+def hydrate_document(document):
+    """Task document with its log streams read back from the blob store (the document itself is untouched)"""
+    if not isinstance(document, dict) or not has_blob_refs(document.get('logs')):
+        return document
+    return {**document, 'logs': hydrate_logs(document['logs'])}
+
+def add_blob_roots(provider):
+    """Register provider() -> iterable of digests still in use; the collector keeps those blobs"""
+    _root_providers.append(provider)
+
+def collect_log_blobs(grace=None):
+    """Delete blobs no registered root refers to and that are older than grace seconds.
+
+    Every poll of a running task with growing output writes a new blob and
+    drops the task's reference to the previous one. Blobs written or reused
+    within LOG_STORE_GC_GRACE are kept because a document still being parsed
+    or served may refer to them before any root does.
+    """
+    global _last_gc
+    grace = LOG_STORE_GC_GRACE if grace is None else grace
+    started = time.time()
+    live = set()
+    for provider in _root_providers:
+        live.update(provider())
+    blobs, deleted, reclaimed = 0, 0, 0
+    if os.path.isdir(LOG_STORE_DIR):
+        for shard in os.scandir(LOG_STORE_DIR):
+            # Blobs live in two-character fan-out directories; top-level .tmp- files are unfinished writes
+            if shard.is_dir():
+                entries = list(os.scandir(shard.path))
+                blobs += len(entries)
+            else:
+                entries = [shard] if shard.name.startswith('.tmp-') else []
+            for entry in entries:
+                if entry.name in live:
+                    continue
+                with _lock:
+                    try:
+                        stat = entry.stat()
+                        if started - stat.st_mtime <= grace:
+                            continue
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                deleted += 1
+                reclaimed += stat.st_size
+    result = {
+        'started_at': datetime.utcfromtimestamp(started).isoformat(),
+        'duration_ms': round((time.time() - started) * 1000, 1),
+        'blobs': blobs,
+        'referenced_blobs': len(live),
+        'deleted_blobs': deleted,
+        'reclaimed_bytes': reclaimed,
+    }
+    with _lock:
+        _last_gc = result
+        _gc_totals['passes'] += 1
+        _gc_totals['deleted_blobs'] += deleted
+        _gc_totals['reclaimed_bytes'] += reclaimed
+    if deleted:
+        print(f"🧹 Log store collection removed {deleted} blobs, {reclaimed} bytes reclaimed")
+    return result
+
+def _run_log_store_gc():
+    while True:
+        time.sleep(LOG_STORE_GC_INTERVAL)
+        try:
+            collect_log_blobs()
+        except Exception as e:
+            print(f"Error in log store collection loop: {str(e)}")
+
+def start_log_store_gc():
+    if getattr(start_log_store_gc, 'started', False):
+        return None
+    worker_thread = threading.Thread(target=_run_log_store_gc, daemon=True)
+    worker_thread.start()
+    start_log_store_gc.started = True
+    print("Started background log store collection thread")
+    return worker_thread
+
+def get_log_store_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['gc'] = {**_gc_totals, 'last_pass': dict(_last_gc) if _last_gc else None}
+    stats['compression_ratio'] = round(stats['raw_bytes'] / stats['stored_bytes'], 2) if stats['stored_bytes'] else None
+    stats['path'] = LOG_STORE_DIR
+    return stats
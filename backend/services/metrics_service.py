@@ -0,0 +1,186 @@
+import threading
+import time
+from array import array
+from collections import Counter
+from config import METRICS_BUCKET_SECONDS
+
+TES_STATES = ['UNKNOWN', 'QUEUED', 'INITIALIZING', 'RUNNING', 'PAUSED', 'COMPLETE',
+              'EXECUTOR_ERROR', 'SYSTEM_ERROR', 'CANCELED', 'PREEMPTED', 'CANCELING']
+TES_STATE_SET = set(TES_STATES)
+FAILURE_STATES = {'EXECUTOR_ERROR', 'SYSTEM_ERROR', 'PREEMPTED'}
+
+FIELDS = ['submissions', 'submit_requests', 'submit_errors', 'submit_latency_ms',
+          'failures', 'poll_count', 'poll_errors', 'poll_latency_ms'] + [f"entered_{state}" for state in TES_STATES]
+FIELD_INDEX = {name: index for index, name in enumerate(FIELDS)}
+NUM_FIELDS = len(FIELDS)
+
+# Rolling windows kept as running sums, in buckets of METRICS_BUCKET_SECONDS
+WINDOWS = {
+    '5m': max(1, 300 // METRICS_BUCKET_SECONDS),
+    '1h': max(1, 3600 // METRICS_BUCKET_SECONDS),
+    '24h': max(1, 86400 // METRICS_BUCKET_SECONDS),
+}
+RING_SIZE = max(WINDOWS.values())
+
+class InstanceMetrics:
+    """Fixed-size ring of time buckets for one instance, plus a running sum per rolling window.
+
+    Memory is RING_SIZE * NUM_FIELDS doubles per instance no matter how many
+    tasks are recorded; recording and window queries cost O(len(WINDOWS)).
+    """
+
+    def __init__(self):
+        self.buckets = array('d', bytes(8 * RING_SIZE * NUM_FIELDS))
+        self.bucket_ids = array('q', [-1]) * RING_SIZE
+        self.window_sums = {name: array('d', bytes(8 * NUM_FIELDS)) for name in WINDOWS}
+        self.current_bucket = None
+        self.state_counts = Counter()
+
+    def _slot_offset(self, bucket_id):
+        return (bucket_id % RING_SIZE) * NUM_FIELDS
+
+    def _reset(self, bucket_id):
+        self.buckets = array('d', bytes(8 * RING_SIZE * NUM_FIELDS))
+        self.bucket_ids = array('q', [-1]) * RING_SIZE
+        for sums in self.window_sums.values():
+            for i in range(NUM_FIELDS):
+                sums[i] = 0.0
+        self.current_bucket = bucket_id
+        self.bucket_ids[bucket_id % RING_SIZE] = bucket_id
+
+    def advance(self, now=None):
+        bucket_id = int((now or time.time()) // METRICS_BUCKET_SECONDS)
+        if self.current_bucket is None or bucket_id - self.current_bucket >= RING_SIZE:
+            self._reset(bucket_id)
+            return
+        while self.current_bucket < bucket_id:
+            self.current_bucket += 1
+            # Drop the bucket that just slid out of each window
+            for name, length in WINDOWS.items():
+                expired = self.current_bucket - length
+                if self.bucket_ids[expired % RING_SIZE] != expired:
+                    continue
+                offset = self._slot_offset(expired)
+                sums = self.window_sums[name]
+                for i in range(NUM_FIELDS):
+                    sums[i] -= self.buckets[offset + i]
+            offset = self._slot_offset(self.current_bucket)
+            for i in range(NUM_FIELDS):
+                self.buckets[offset + i] = 0.0
+            self.bucket_ids[self.current_bucket % RING_SIZE] = self.current_bucket
+
+    def add(self, field, amount=1.0, now=None):
+        self.advance(now)
+        index = FIELD_INDEX[field]
+        self.buckets[self._slot_offset(self.current_bucket) + index] += amount
+        for sums in self.window_sums.values():
+            sums[index] += amount
+
+    def window(self, name, now=None):
+        self.advance(now)
+        sums = self.window_sums[name]
+        return {field: sums[i] for i, field in enumerate(FIELDS)}
+
+    def series(self, field, buckets, now=None):
+        self.advance(now)
+        index = FIELD_INDEX[field]
+        points = []
+        for bucket_id in range(self.current_bucket - min(buckets, RING_SIZE) + 1, self.current_bucket + 1):
+            value = 0.0
+            if self.bucket_ids[bucket_id % RING_SIZE] == bucket_id:
+                value = self.buckets[self._slot_offset(bucket_id) + index]
+            points.append({'bucket_start': bucket_id * METRICS_BUCKET_SECONDS, 'value': value})
+        return points
+
+_lock = threading.Lock()
+_instances = {}
+
+def _normalize(tes_url):
+    return (tes_url or '').rstrip('/')
+
+def _metrics_for(tes_url):
+    key = _normalize(tes_url)
+    metrics = _instances.get(key)
+    if metrics is None:
+        metrics = _instances[key] = InstanceMetrics()
+    return metrics
+
+def record_task_event(event, task, old_state, new_state, task_data):
+    """Task listener: count submissions and transitions into each state, and keep per-state gauges"""
+    if new_state == old_state:
+        return
+    with _lock:
+        metrics = _metrics_for(task.get('tes_url'))
+        if event == 'submitted':
+            metrics.add('submissions')
+        if old_state:
+            metrics.state_counts[old_state] -= 1
+        metrics.state_counts[new_state] += 1
+        if new_state in TES_STATE_SET:
+            metrics.add(f"entered_{new_state}")
+        if new_state in FAILURE_STATES:
+            metrics.add('failures')
+
+def record_poll(tes_url, latency_ms, ok):
+    with _lock:
+        metrics = _metrics_for(tes_url)
+        metrics.add('poll_count')
+        metrics.add('poll_latency_ms', latency_ms)
+        if not ok:
+            metrics.add('poll_errors')
+
+def record_submit_request(tes_url, latency_ms, ok):
+    with _lock:
+        metrics = _metrics_for(tes_url)
+        metrics.add('submit_requests')
+        metrics.add('submit_latency_ms', latency_ms)
+        if not ok:
+            metrics.add('submit_errors')
+
+def _summarize(values):
+    polls = values['poll_count']
+    submits = values['submit_requests']
+    return {
+        'submissions': int(values['submissions']),
+        'completed': int(values['entered_COMPLETE']),
+        'failed': int(values['failures']),
+        'canceled': int(values['entered_CANCELED']),
+        'transitions': {state: int(values[f"entered_{state}"]) for state in TES_STATES if values[f"entered_{state}"]},
+        'polls': int(polls),
+        'poll_error_rate': round(values['poll_errors'] / polls, 4) if polls else None,
+        'avg_poll_latency_ms': round(values['poll_latency_ms'] / polls, 1) if polls else None,
+        'submit_requests': int(submits),
+        'submit_error_rate': round(values['submit_errors'] / submits, 4) if submits else None,
+        'avg_submit_latency_ms': round(values['submit_latency_ms'] / submits, 1) if submits else None,
+    }
+
+def get_instance_activity(tes_url):
+    """Current per-state gauges plus every rolling window for one instance"""
+    with _lock:
+        metrics = _instances.get(_normalize(tes_url))
+        if metrics is None:
+            metrics = InstanceMetrics()
+        return {
+            'current': {state: count for state, count in metrics.state_counts.items() if count > 0},
+            'windows': {name: _summarize(metrics.window(name)) for name in WINDOWS},
+            'bucket_seconds': METRICS_BUCKET_SECONDS,
+        }
+
+def get_instance_series(tes_url, field, buckets):
+    if field not in FIELD_INDEX:
+        raise ValueError(f"Unknown metric field: {field}")
+    with _lock:
+        metrics = _instances.get(_normalize(tes_url))
+        if metrics is None:
+            return []
+        return metrics.series(field, buckets)
+
+def get_all_activity(window='1h'):
+    with _lock:
+        return {
+            url: {
+                'current': {state: count for state, count in metrics.state_counts.items() if count > 0},
+                'window': _summarize(metrics.window(window)),
+            }
+            for url, metrics in _instances.items()
+        }
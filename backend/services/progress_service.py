@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from config import WORKFLOW_PROGRESS_MAX_RUNS
+
+# Status changes kept per run; a run has only a handful
+MAX_TIMELINE_EVENTS = 50
+
+_lock = threading.Lock()
+# run_id -> progress, in the order runs were started; the newest is last
+_runs = OrderedDict()
+
+def start_run_progress(run_id, kind, step, path, label):
+    """Record a newly submitted run; it becomes the latest run.
+
+    step is the dashboard's workflow-path stage (2 for a single workflow,
+    3-5 for Snakemake, Nextflow and CWL batches) and path the instances it
+    goes through. Only the WORKFLOW_PROGRESS_MAX_RUNS newest runs are kept.
+    """
+    now = datetime.utcnow().isoformat()
+    with _lock:
+        _runs[run_id] = {
+            'run_id': run_id,
+            'kind': kind,
+            'step': step,
+            'path': list(path),
+            'status': 'SUBMITTING',
+            'started_at': now,
+            'updated_at': now,
+            'timeline': [{'status': 'SUBMITTING', 'label': label, 'at': now}]
+        }
+        _runs.move_to_end(run_id)
+        while len(_runs) > WORKFLOW_PROGRESS_MAX_RUNS:
+            _runs.popitem(last=False)
+
+def record_status(run_id, status, label=None):
+    """Append a status change to a run's timeline; unknown runs and repeats are ignored"""
+    with _lock:
+        progress = _runs.get(run_id)
+        if progress is None or progress['status'] == status:
+            return
+        now = datetime.utcnow().isoformat()
+        progress['status'] = status
+        progress['updated_at'] = now
+        progress['timeline'].append({'status': status, 'label': label, 'at': now})
+        if len(progress['timeline']) > MAX_TIMELINE_EVENTS:
+            del progress['timeline'][1]
+
+def _copy(progress):
+    return dict(progress, path=list(progress['path']), timeline=list(progress['timeline']))
+
+def get_latest_progress():
+    """The most recently started run, or None"""
+    with _lock:
+        if not _runs:
+            return None
+        return _copy(_runs[next(reversed(_runs))])
+
+def get_recent_progress(limit=20):
+    """Newest runs first"""
+    with _lock:
+        recent = []
+        for run_id in reversed(_runs):
+            if len(recent) >= limit:
+                break
+            recent.append(_copy(_runs[run_id]))
+        return recent
+
+def get_progress(run_id):
+    with _lock:
+        progress = _runs.get(run_id)
+        return _copy(progress) if progress is not None else None
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from datetime import datetime
+from config import (
+    UPLOAD_FOLDER, UPLOAD_OBJECTS_DIR, UPLOAD_INCOMING_DIR, UPLOAD_RETENTION_INTERVAL,
+    UPLOAD_RETENTION_MAX_AGE, UPLOAD_RETENTION_MAX_FILES, UPLOAD_RETENTION_MAX_BYTES, UPLOAD_SESSION_TTL,
+)
+from services.upload_service import delete_object, list_objects, list_upload_sessions, abort_upload
+from services.workflow_service import get_workflow_runs
+from services.batch_service import get_active_batch_runs
+
+# Run statuses after which a run no longer needs its files; UNKNOWN marks runs interrupted by a restart
+FINISHED_RUN_STATES = {'COMPLETE', 'COMPLETED', 'CANCELED', 'FAILED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED',
+                       'UNKNOWN'}
+# Leftovers of interrupted writes are only removed once they are this old
+TEMP_FILE_GRACE_SECONDS = 3600
+
+_lock = threading.Lock()
+_last_pass = None
+_totals = {'passes': 0, 'deleted_files': 0, 'reclaimed_bytes': 0}
+
+def _protected_files(candidates):
+    """sha256s of objects some run still references, and paths of files saved
+    before uploads were content addressed that unfinished runs use"""
+    protected = {key for kind, key, _, _, _, refs in candidates if kind == 'object' and refs > 0}
+    # Only the unfinished batch runs are read, so the full list stays unloaded
+    active_runs = [run for run in list(get_workflow_runs()) if run.get('status') not in FINISHED_RUN_STATES]
+    for run in active_runs + get_active_batch_runs():
+        for file in run.get('files') or []:
+            if not file.get('sha256'):
+                protected.add(file.get('path'))
+    return protected
+
+def _own_files():
+    """Files the backend keeps its own state in; never candidates"""
+    return {name for name in os.listdir(UPLOAD_FOLDER)
+            if name.startswith(('batch_runs', 'objects.')) or name.endswith('.idx')}
+
+def _scan():
+    """Everything under UPLOAD_FOLDER as candidates: (kind, key, size, last used epoch, token, refs)"""
+    candidates = []
+    own = _own_files()
+    for entry in os.scandir(UPLOAD_FOLDER):
+        # Files saved as <run_id>_<name> before uploads were content addressed
+        if entry.is_file() and entry.name not in own:
+            stat = entry.stat()
+            candidates.append(('file', entry.path, stat.st_size, stat.st_mtime, None, 0))
+    for entry in list_objects():
+        used = datetime.fromisoformat(entry.get('last_used_at') or entry['created_at']).timestamp()
+        candidates.append(('object', entry['sha256'], entry['size'], used, entry.get('last_used_at'), entry['refs']))
+    return candidates
+
+def _directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+def _remove_leftovers(now, dry_run):
+    """Expired chunked-upload sessions and temp files of interrupted writes; returns (files, bytes)"""
+    deleted, reclaimed = 0, 0
+    for session in list_upload_sessions():
+        # Unfinished sessions past their expiry, and committed ones nobody referenced within the TTL
+        if session['status'] == 'open':
+            continue
+        if session['status'] == 'committed' and now - session['committed_at'] < UPLOAD_SESSION_TTL:
+            continue
+        size = _directory_bytes(session['path'])
+        if not dry_run:
+            abort_upload(session['upload_id'])
+        deleted, reclaimed = deleted + 1, reclaimed + size
+    for directory in (UPLOAD_OBJECTS_DIR, UPLOAD_INCOMING_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.name.startswith('.tmp-') and now - entry.stat().st_mtime > TEMP_FILE_GRACE_SECONDS:
+                size = entry.stat().st_size
+                if not dry_run:
+                    os.remove(entry.path)
+                deleted, reclaimed = deleted + 1, reclaimed + size
+    return deleted, reclaimed
+
+def run_retention(dry_run=False):
+    """Apply the age, count and size policies to UPLOAD_FOLDER.
+
+    Objects that runs still reference (refs > 0), and older per-run files of
+    runs that are still active, are never removed. Of the rest, everything
+    older than UPLOAD_RETENTION_MAX_AGE goes first; then the least recently
+    used are removed until the folder is within UPLOAD_RETENTION_MAX_FILES and
+    UPLOAD_RETENTION_MAX_BYTES.
+    """
+    global _last_pass
+    started = time.time()
+    with _lock:
+        candidates = _scan()
+        protected = _protected_files(candidates)
+        total_files = len(candidates)
+        total_bytes = sum(c[2] for c in candidates)
+        protected_bytes = sum(c[2] for c in candidates if c[1] in protected)
+
+        expired, kept = [], []
+        for candidate in sorted((c for c in candidates if c[1] not in protected), key=lambda c: c[3]):
+            (expired if started - candidate[3] > UPLOAD_RETENTION_MAX_AGE else kept).append(candidate)
+        remaining_files = total_files - len(expired)
+        remaining_bytes = total_bytes - sum(c[2] for c in expired)
+        # Oldest first until both limits hold
+        for candidate in kept:
+            if remaining_files <= UPLOAD_RETENTION_MAX_FILES and remaining_bytes <= UPLOAD_RETENTION_MAX_BYTES:
+                break
+            expired.append(candidate)
+            remaining_files -= 1
+            remaining_bytes -= candidate[2]
+
+        deleted, reclaimed = 0, 0
+        for kind, key, size, _, last_used_at, _ in expired:
+            if dry_run:
+                freed = size
+            elif kind == 'object':
+                freed = delete_object(key, last_used_at)
+            else:
+                try:
+                    os.remove(key)
+                    freed = size
+                except FileNotFoundError:
+                    freed = None
+            if freed is not None:
+                deleted += 1
+                reclaimed += freed
+        leftover_files, leftover_bytes = _remove_leftovers(started, dry_run)
+
+        result = {
+            'dry_run': dry_run,
+            'started_at': datetime.utcfromtimestamp(started).isoformat(),
+            'duration_ms': round((time.time() - started) * 1000, 1),
+            'deleted_files': deleted + leftover_files,
+            'reclaimed_bytes': reclaimed + leftover_bytes,
+            'protected_files': sum(1 for c in candidates if c[1] in protected),
+            'protected_bytes': protected_bytes,
+            'files': total_files - (0 if dry_run else deleted),
+            'bytes': total_bytes - (0 if dry_run else reclaimed),
+        }
+        if not dry_run:
+            _last_pass = result
+            _totals['passes'] += 1
+            _totals['deleted_files'] += result['deleted_files']
+            _totals['reclaimed_bytes'] += result['reclaimed_bytes']
+    if result['deleted_files'] and not dry_run:
+        print(f"🧹 Upload retention removed {result['deleted_files']} files, {result['reclaimed_bytes']} bytes reclaimed")
+    return result
+
+def get_upload_usage():
+    """Current usage of UPLOAD_FOLDER against the retention limits, plus the last pass"""
+    with _lock:
+        candidates = _scan()
+        last_pass = dict(_last_pass) if _last_pass else None
+        totals = dict(_totals)
+    total_bytes = sum(c[2] for c in candidates)
+    return {
+        'files': len(candidates),
+        'bytes': total_bytes,
+        'incoming_bytes': _directory_bytes(UPLOAD_INCOMING_DIR),
+        'state_bytes': sum(os.path.getsize(os.path.join(UPLOAD_FOLDER, name)) for name in _own_files()),
+        'limits': {
+            'max_age_s': UPLOAD_RETENTION_MAX_AGE,
+            'max_files': UPLOAD_RETENTION_MAX_FILES,
+            'max_bytes': UPLOAD_RETENTION_MAX_BYTES,
+        },
+        'bytes_used_pct': round(100 * total_bytes / UPLOAD_RETENTION_MAX_BYTES, 1) if UPLOAD_RETENTION_MAX_BYTES else None,
+        'last_pass': last_pass,
+        'totals': totals,
+    }
+
+def _run_retention_worker():
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            print(f"Error in upload retention loop: {str(e)}")
+        time.sleep(UPLOAD_RETENTION_INTERVAL)
+
+def start_retention_worker():
+    if getattr(start_retention_worker, 'started', False):
+        return None
+    worker_thread = threading.Thread(target=_run_retention_worker, daemon=True)
+    worker_thread.start()
+    start_retention_worker.started = True
+    print("Started background upload retention thread")
+    return worker_thread
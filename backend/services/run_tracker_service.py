@@ -0,0 +1,248 @@
+import threading
+from collections import deque
+from datetime import datetime
+from services.task_service import add_task_listener
+from services.batch_service import get_active_batch_runs, update_batch_run
+from services.workflow_service import update_workflow_run
+from services.progress_service import record_status
+from services.upload_service import release_files
+
+# TES state -> progress bucket of a run's child task
+STATE_BUCKETS = {
+    'UNKNOWN': 'queued',
+    'QUEUED': 'queued',
+    'INITIALIZING': 'queued',
+    'RUNNING': 'running',
+    'COMPLETE': 'done',
+    'CANCELED': 'failed',
+    'SYSTEM_ERROR': 'failed',
+    'EXECUTOR_ERROR': 'failed',
+    'PREEMPTED': 'failed',
+}
+# Where a tracked run's status and progress are written back
+RUN_STORES = {'batch': update_batch_run, 'workflow': update_workflow_run}
+# Finished runs kept for progress lookups; stored runs keep their last progress in the record
+MAX_TRACKED_FINISHED_RUNS = 200
+# Status given to stored runs that were still active when the backend stopped
+INTERRUPTED_STATUS = 'UNKNOWN'
+
+_lock = threading.Lock()
+# Held while writing runs to their stores, so writes of a run land in the order they were taken
+_store_lock = threading.Lock()
+# run_id -> (kind, persisted, progress)
+_runs = {}
+# run_id -> (kind, changes) of stored runs whose latest progress is not written yet
+_dirty = {}
+# run_id -> (status, counts) at its last refresh, to skip refreshes that change nothing
+_refreshed = {}
+# (tes_url, task_id) -> [bucket, run_ids]
+_children = {}
+# run_id -> upload records the run holds references to until it finishes
+_files = {}
+# run_id -> keys of its child tasks, to drop them with the run
+_run_children = {}
+# Run ids in the order they finished, oldest first
+_finished = deque()
+
+def _child_key(tes_url, task_id):
+    return ((tes_url or '').rstrip('/'), task_id)
+
+def _derive_status(progress):
+    if progress['pending'] and not (progress['queued'] or progress['running'] or progress['done'] or progress['failed']):
+        return 'SUBMITTING'
+    if progress['pending'] or progress['queued'] or progress['running']:
+        return 'RUNNING' if progress['running'] or progress['done'] or progress['failed'] else 'QUEUED'
+    return 'FAILED' if progress['failed'] else 'COMPLETE'
+
+def _counts(progress):
+    return tuple(progress[bucket] for bucket in ('total', 'pending', 'queued', 'running', 'done', 'failed'))
+
+def _refresh(run_id, now):
+    # Called with _lock held after a run's counts may have changed; queues the
+    # store write for _flush and returns the files to release once it finished
+    kind, persisted, progress = _runs[run_id]
+    status = _derive_status(progress)
+    if _refreshed.get(run_id) == (status, _counts(progress)):
+        return []
+    _refreshed[run_id] = (status, _counts(progress))
+    if progress['running'] and progress['started_at'] is None:
+        progress['started_at'] = now
+    if status in ('COMPLETE', 'FAILED'):
+        if progress['finished_at'] is None:
+            progress['finished_at'] = now
+            _finished.append(run_id)
+            progress['duration_s'] = round((datetime.fromisoformat(now) - datetime.fromisoformat(progress['created_at'])).total_seconds(), 1)
+    else:
+        progress['finished_at'] = progress['duration_s'] = None
+    progress['status'] = status
+    progress['updated_at'] = now
+    record_status(run_id, status, f"{progress['done']}/{progress['total']} tasks done, {progress['failed']} failed")
+    if persisted:
+        _dirty[run_id] = (kind, {'status': status, 'progress': dict(progress)})
+    return _files.pop(run_id, []) if status in ('COMPLETE', 'FAILED') else []
+
+def _prune():
+    # Called with _lock held; forgets the oldest finished runs and child tasks only they had
+    while len(_finished) > MAX_TRACKED_FINISHED_RUNS:
+        run_id = _finished.popleft()
+        run = _runs.get(run_id)
+        if run is None or run[2]['finished_at'] is None:
+            continue
+        del _runs[run_id]
+        _refreshed.pop(run_id, None)
+        for key in _run_children.pop(run_id, []):
+            child = _children.get(key)
+            if child is None or run_id not in child[1]:
+                continue
+            child[1].remove(run_id)
+            if not child[1]:
+                del _children[key]
+
+def _flush(released):
+    # Called without _lock: writes the runs _refresh queued, then releases files.
+    # Each write takes the newest progress under _store_lock, so a slower
+    # thread can never overwrite a run with an older state.
+    with _lock:
+        pending_writes = bool(_dirty)
+    if pending_writes:
+        with _store_lock:
+            with _lock:
+                writes = list(_dirty.items())
+                _dirty.clear()
+            for run_id, (kind, changes) in writes:
+                RUN_STORES[kind](run_id, changes)
+    release_files(released)
+
+def track_run(kind, run_id, expected=0, persisted=True, files=None):
+    """Start aggregating a run that will spawn `expected` child tasks.
+
+    persisted=False keeps the aggregate in memory only, e.g. for the group id
+    of a batch whose per-instance runs are the stored records. The upload
+    references of files are released when the run finishes.
+    """
+    now = datetime.utcnow().isoformat()
+    with _lock:
+        _prune()
+        if files:
+            _files[run_id] = files
+        _runs[run_id] = (kind, persisted, {
+            'status': 'SUBMITTING' if expected else 'QUEUED',
+            'total': expected,
+            'pending': expected,
+            'queued': 0,
+            'running': 0,
+            'done': 0,
+            'failed': 0,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'duration_s': None,
+            'updated_at': now
+        })
+
+def add_child_task(run_ids, task):
+    """Attach a submitted task to runs; its later state changes update their progress"""
+    now = datetime.utcnow().isoformat()
+    key = _child_key(task.get('tes_url'), task.get('task_id') or task.get('id'))
+    released = []
+    with _lock:
+        run_ids = [run_id for run_id in run_ids if run_id in _runs]
+        bucket = STATE_BUCKETS.get(task.get('state') or task.get('status'), 'queued')
+        _children[key] = [bucket, run_ids]
+        for run_id in run_ids:
+            _run_children.setdefault(run_id, []).append(key)
+            progress = _runs[run_id][2]
+            if progress['pending']:
+                progress['pending'] -= 1
+            else:
+                progress['total'] += 1
+            progress[bucket] += 1
+            released += _refresh(run_id, now)
+    _flush(released)
+
+def add_child_failure(run_ids):
+    """Count a child task that could not be submitted as failed"""
+    now = datetime.utcnow().isoformat()
+    released = []
+    with _lock:
+        for run_id in run_ids:
+            if run_id not in _runs:
+                continue
+            progress = _runs[run_id][2]
+            if progress['pending']:
+                progress['pending'] -= 1
+            else:
+                progress['total'] += 1
+            progress['failed'] += 1
+            released += _refresh(run_id, now)
+    _flush(released)
+
+def drop_pending(run_ids, count=1):
+    """Stop waiting for child tasks that will never be submitted, e.g. steps skipped after a failure"""
+    now = datetime.utcnow().isoformat()
+    released = []
+    with _lock:
+        for run_id in run_ids:
+            if run_id not in _runs:
+                continue
+            progress = _runs[run_id][2]
+            dropped = min(count, progress['pending'])
+            progress['pending'] -= dropped
+            progress['total'] -= dropped
+            released += _refresh(run_id, now)
+    _flush(released)
+
+def _on_task_event(event, task, old_state, new_state, task_data):
+    key = _child_key(task.get('tes_url'), task.get('task_id') or task.get('id'))
+    released = []
+    with _lock:
+        child = _children.get(key)
+        if child is None:
+            return
+        bucket = STATE_BUCKETS.get(new_state, 'queued')
+        if bucket == child[0]:
+            return
+        now = datetime.utcnow().isoformat()
+        for run_id in child[1]:
+            progress = _runs[run_id][2]
+            progress[child[0]] -= 1
+            progress[bucket] += 1
+            released += _refresh(run_id, now)
+        child[0] = bucket
+    _flush(released)
+
+add_task_listener(_on_task_event)
+
+def get_run_progress(run_id):
+    """Current aggregate of a tracked run, or None"""
+    with _lock:
+        run = _runs.get(run_id)
+        return dict(run[2]) if run is not None else None
+
+def get_tracker_stats():
+    with _lock:
+        return {'runs': len(_runs), 'finished_runs': len(_finished), 'child_tasks': len(_children),
+                'holding_files': len(_files)}
+
+def mark_interrupted_runs():
+    """Mark stored batch runs that were still active when the backend stopped.
+
+    Tasks and the tracker live in memory, so nothing would ever finish these
+    runs; they get status UNKNOWN and give back their upload references. An
+    'all' mode batch shares one set of references across its per-instance
+    runs, so they are released once per group. Call once at startup, before
+    new runs are submitted.
+    """
+    released_groups = set()
+    interrupted = 0
+    for batch_run in get_active_batch_runs():
+        update_batch_run(batch_run['run_id'], {'status': INTERRUPTED_STATUS,
+                                               'error': 'Run was still active when the backend stopped'})
+        group = batch_run.get('batch_run_id') or batch_run['run_id']
+        if group not in released_groups:
+            released_groups.add(group)
+            release_files(batch_run.get('files'))
+        interrupted += 1
+    if interrupted:
+        print(f"⚠️ Marked {interrupted} batch runs interrupted by a restart as {INTERRUPTED_STATUS}")
+    return interrupted
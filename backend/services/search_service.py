@@ -0,0 +1,182 @@
+import heapq
+import math
+import re
+import sys
+import threading
+from collections import Counter
+from config import SEARCH_LOG_BYTES, SEARCH_MAX_LOG_TOKENS
+from services.task_service import add_task_listener, get_submitted_tasks
+from services.log_store_service import BlobReader
+
+TERMINAL_STATES = {'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+# How much a match in each field counts towards a task's score
+FIELD_WEIGHTS = {
+    'name': 3,
+    'docker_image': 2,
+    'command': 2,
+    'tags': 2,
+    'description': 1,
+    'logs': 1,
+}
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text or '').lower())
+
+def _field_text(task, field):
+    if field == 'tags':
+        tags = task.get('tags') or {}
+        return ' '.join(f"{key} {value}" for key, value in tags.items()) if isinstance(tags, dict) else str(tags)
+    if field == 'command':
+        command = task.get('command')
+        if not command:
+            command = ' '.join(' '.join(e.get('command') or []) for e in task.get('executors') or [] if isinstance(e, dict))
+        return ' '.join(command) if isinstance(command, list) else command
+    if field == 'name':
+        return task.get('name') or task.get('task_name')
+    return task.get(field)
+
+def _stream_text(executor_log, stream):
+    """Inline text, or the head and tail of a stored stream (errors are usually at the end)"""
+    digest = executor_log.get(f"{stream}_blob")
+    if not digest:
+        return executor_log.get(stream) or ''
+    half = SEARCH_LOG_BYTES // 2
+    try:
+        with BlobReader(digest) as reader:
+            if reader.size <= SEARCH_LOG_BYTES:
+                data = reader.read()
+            else:
+                data = reader.read(0, half) + b'\n' + reader.read(reader.size - half, half)
+        return data.decode('utf-8', errors='replace')
+    except (OSError, ValueError):
+        return ''
+
+def _log_tokens(task):
+    tokens = Counter()
+    for task_log in task.get('logs') or []:
+        for executor_log in task_log.get('logs') or []:
+            for stream in ('stdout', 'stderr'):
+                tokens.update(tokenize(_stream_text(executor_log, stream)))
+    if len(tokens) > SEARCH_MAX_LOG_TOKENS:
+        tokens = Counter(dict(tokens.most_common(SEARCH_MAX_LOG_TOKENS)))
+    return tokens
+
+class TaskSearchIndex:
+    """Inverted index from token to {doc: weighted term frequency}, updated one task at a time.
+
+    Re-indexing a task removes only its own postings, so the cost of an
+    update is proportional to that task's text, not to the size of the index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.postings = {}
+        # doc -> Counter of its weighted terms, to undo its postings on re-index
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.doc_ids = {}
+        self.doc_keys = []
+        self.doc_tasks = []
+        self.total_length = 0
+
+    def _doc_for(self, key, task):
+        doc = self.doc_ids.get(key)
+        if doc is None:
+            doc = self.doc_ids[key] = len(self.doc_keys)
+            self.doc_keys.append(key)
+            self.doc_tasks.append(task)
+        else:
+            self.doc_tasks[doc] = task
+        return doc
+
+    def index_task(self, task, include_logs=False):
+        key = ((task.get('tes_url') or '').rstrip('/'), task.get('task_id') or task.get('id'))
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            if field == 'logs':
+                if not include_logs:
+                    continue
+                field_tokens = _log_tokens(task)
+            else:
+                field_tokens = Counter(tokenize(_field_text(task, field)))
+            for token, count in field_tokens.items():
+                terms[token] += weight * count
+
+        with self._lock:
+            doc = self._doc_for(key, task)
+            previous = self.doc_terms.get(doc)
+            if previous == terms:
+                return
+            if previous is not None:
+                for token in previous:
+                    postings = self.postings.get(token)
+                    if postings is not None:
+                        postings.pop(doc, None)
+                        if not postings:
+                            del self.postings[token]
+                self.total_length -= self.doc_lengths[doc]
+            for token, count in terms.items():
+                self.postings.setdefault(token, {})[doc] = count
+            self.doc_terms[doc] = terms
+            self.doc_lengths[doc] = sum(terms.values())
+            self.total_length += self.doc_lengths[doc]
+
+    def search(self, query, offset=0, limit=20, matches=None):
+        """Return (total, [(score, task)]) for tasks containing every query token, best first"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return 0, []
+        with self._lock:
+            posting_lists = [self.postings.get(token) for token in tokens]
+            if not all(posting_lists):
+                return 0, []
+            posting_lists.sort(key=len)
+            # Intersect starting from the rarest token
+            candidates = [doc for doc in posting_lists[0] if all(doc in p for p in posting_lists[1:])]
+            if matches is not None:
+                candidates = [doc for doc in candidates if matches(self.doc_tasks[doc])]
+            doc_count = len(self.doc_lengths)
+            average_length = self.total_length / doc_count if doc_count else 1
+            idf = [math.log(1 + (doc_count - len(p) + 0.5) / (len(p) + 0.5)) for p in posting_lists]
+
+            def score(doc):
+                norm = K1 * (1 - B + B * self.doc_lengths[doc] / average_length)
+                return sum(w * p[doc] * (K1 + 1) / (p[doc] + norm) for w, p in zip(idf, posting_lists))
+
+            ranked = heapq.nlargest(offset + limit, ((score(doc), doc) for doc in candidates))
+            return len(candidates), [(round(s, 4), self.doc_tasks[doc]) for s, doc in ranked[offset:]]
+
+    def stats(self):
+        """Index size, with memory estimated from the sizes of its containers and entries"""
+        with self._lock:
+            postings = sum(len(p) for p in self.postings.values())
+            memory = sys.getsizeof(self.postings) + sum(sys.getsizeof(p) + sys.getsizeof(t) for t, p in self.postings.items())
+            memory += sys.getsizeof(self.doc_terms) + sum(sys.getsizeof(t) for t in self.doc_terms.values())
+            memory += sys.getsizeof(self.doc_lengths) + sys.getsizeof(self.doc_ids) + sys.getsizeof(self.doc_keys) + sys.getsizeof(self.doc_tasks)
+            return {
+                'documents': len(self.doc_keys),
+                'terms': len(self.postings),
+                'postings': postings,
+                'memory_bytes': memory,
+            }
+
+task_search_index = TaskSearchIndex()
+
+def _on_task_event(event, task, old_state, new_state, task_data):
+    # Output is only indexed once a task has finished writing it
+    task_search_index.index_task(task, include_logs=new_state in TERMINAL_STATES)
+
+add_task_listener(_on_task_event)
+
+for _task in list(get_submitted_tasks()):
+    task_search_index.index_task(_task, include_logs=(_task.get('state') in TERMINAL_STATES))
+
+def search_tasks(query, offset=0, limit=20, matches=None):
+    return task_search_index.search(query, offset, limit, matches)
+
+def get_search_stats():
+    return task_search_index.stats()
@@ -0,0 +1,404 @@
+import csv
+import io
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import (
+    BATCH_DISPATCH_WORKERS, BATCH_SHARD_SIZE, BATCH_SHARD_INFLIGHT, BATCH_SHARD_MAX_ATTEMPTS, BATCH_SHARD_FAILURE_LIMIT,
+)
+from services.batch_service import update_batch_run
+from services.dispatch_service import WORKFLOW_DIR, WORKFLOW_INPUT_MAX_BYTES, submit_task_to_instance
+from services.metrics_service import get_instance_activity
+from services.progress_service import record_status
+from services.task_service import add_task_listener
+from services.upload_service import object_path, release_files
+
+ACTIVE_STATES = ('QUEUED', 'INITIALIZING', 'RUNNING')
+TERMINAL_STATES = {'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+# Weight of the newest shard in an instance's smoothed shard duration
+DURATION_EWMA_ALPHA = 0.3
+MAX_TRACKED_BATCHES = 200
+
+_pool = ThreadPoolExecutor(max_workers=BATCH_DISPATCH_WORKERS, thread_name_prefix='batch-shards')
+_lock = threading.Lock()
+_batches = {}
+# (tes_url, task_id) -> (ShardedBatch, shard index)
+_shard_tasks = {}
+
+def read_sample_sheet(file):
+    """(delimiter, header, rows) of an uploaded CSV/TSV sample sheet, one row per sample"""
+    with open(object_path(file['sha256']), 'rb') as f:
+        try:
+            text = f.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError(f"{file['filename']} is not a text file")
+    first_line = text.split('\n', 1)[0]
+    delimiter = '\t' if file['filename'].lower().endswith('.tsv') or '\t' in first_line else ','
+    rows = [row for row in csv.reader(io.StringIO(text), delimiter=delimiter) if any(cell.strip() for cell in row)]
+    if len(rows) < 2:
+        raise ValueError(f"{file['filename']} needs a header row and at least one sample")
+    return delimiter, rows[0], rows[1:]
+
+def instance_capacity(instances):
+    """Measured throughput (completed tasks in the last hour) and queue depth per instance.
+
+    Instances with no completions yet are assumed to be as fast as the
+    median measured instance, or 1 task/hour when nothing has been measured.
+    """
+    capacity = []
+    for inst in instances:
+        activity = get_instance_activity(inst['url'])
+        window = activity['windows']['1h']
+        capacity.append({
+            'name': inst['name'],
+            'url': inst['url'],
+            'throughput_per_hour': window['completed'] * (1 - (window['submit_error_rate'] or 0)),
+            'queue_depth': sum(activity['current'].get(state, 0) for state in ACTIVE_STATES),
+            'measured': window['completed'] > 0
+        })
+    measured = sorted(entry['throughput_per_hour'] for entry in capacity if entry['measured'])
+    default_rate = measured[len(measured) // 2] if measured else 1.0
+    for entry in capacity:
+        if not entry['measured']:
+            entry['throughput_per_hour'] = default_rate
+    return capacity
+
+def plan_shards(shard_count, capacity):
+    """Split shard_count shards so every instance is expected to drain its queue at the same time.
+
+    With throughput r_i and queue depth q_i, instance i gets x_i = T * r_i - q_i
+    shards, where T is the common finish time; instances whose existing
+    queue already outlasts T get none. Returns planned shards per instance name.
+    """
+    active = [entry for entry in capacity if entry['throughput_per_hour'] > 0] or capacity
+    while True:
+        total_rate = sum(entry['throughput_per_hour'] or 1.0 for entry in active)
+        finish = (shard_count + sum(entry['queue_depth'] for entry in active)) / total_rate
+        shares = {entry['name']: finish * (entry['throughput_per_hour'] or 1.0) - entry['queue_depth'] for entry in active}
+        if all(share >= 0 for share in shares.values()):
+            break
+        active = [entry for entry in active if shares[entry['name']] > 0]
+    # Largest remainder rounding
+    planned = {name: int(share) for name, share in shares.items()}
+    for name in sorted(shares, key=lambda name: shares[name] - planned[name], reverse=True)[:shard_count - sum(planned.values())]:
+        planned[name] += 1
+    return {entry['name']: planned.get(entry['name'], 0) for entry in capacity}
+
+class ShardedBatch:
+    """Shards of one sample sheet spread over instances, with work stealing and retries.
+
+    Every instance keeps a local queue of shards it has not submitted yet and
+    runs at most BATCH_SHARD_INFLIGHT at a time. An instance that runs out of
+    work takes unstarted shards from the instance expected to need the
+    longest to reach them; an instance that fails BATCH_SHARD_FAILURE_LIMIT
+    shards in a row is dropped and its queue handed to the others. Failed
+    shards are retried elsewhere up to BATCH_SHARD_MAX_ATTEMPTS times.
+    Shards already submitted to TES are never moved.
+    """
+
+    def __init__(self, run_id, tes_task, sheet_name, delimiter, header, samples, shard_size, capacity):
+        self.run_id = run_id
+        self.tes_task = tes_task
+        self.sheet_path = f"{WORKFLOW_DIR}/{os.path.basename(sheet_name)}"
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at = None
+        self.lock = threading.Lock()
+        # Held while writing the run record, so writes land in the order they were taken
+        self.store_lock = threading.Lock()
+        self.task_ids = []
+        self.reassigned = 0
+        self.started_at = None
+        # Upload records whose references are released once every shard finished
+        self.files = []
+        # Record update waiting to be written outside self.lock, and the last status queued
+        self.unwritten = None
+        self.written_status = None
+        self.shards = []
+        for index, start in enumerate(range(0, len(samples), shard_size)):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, delimiter=delimiter, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(samples[start:start + shard_size])
+            content = buffer.getvalue()
+            if len(content.encode()) > WORKFLOW_INPUT_MAX_BYTES:
+                raise ValueError(f"Shard {index} is larger than {WORKFLOW_INPUT_MAX_BYTES} bytes; use a smaller shard_size")
+            self.shards.append({'index': index, 'samples': min(shard_size, len(samples) - start), 'content': content,
+                                'status': 'pending', 'instance': None, 'task_id': None, 'attempts': 0,
+                                'submitted_at': None, 'finished_at': None, 'error': None})
+        # Shards per progress bucket, kept up to date by _set_status
+        self.counts = {'pending': len(self.shards), 'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        self.plan = plan_shards(len(self.shards), capacity)
+        self.instances = {}
+        next_shard = 0
+        for entry in capacity:
+            planned = self.plan[entry['name']]
+            self.instances[entry['name']] = {
+                'name': entry['name'],
+                'url': entry['url'],
+                'queue': deque(range(next_shard, next_shard + planned)),
+                'inflight': 0,
+                'completed': 0,
+                'failed': 0,
+                'consecutive_failures': 0,
+                'excluded': False,
+                # Expected seconds per shard until one has been measured
+                'avg_seconds': 3600.0 / entry['throughput_per_hour'] if entry['throughput_per_hour'] else None
+            }
+            next_shard += planned
+        self.capacity = capacity
+
+    def _set_status(self, shard, status, **fields):
+        # 'submitting' counts as queued in the progress
+        self.counts['queued' if shard['status'] == 'submitting' else shard['status']] -= 1
+        self.counts['queued' if status == 'submitting' else status] += 1
+        shard.update(fields, status=status)
+
+    def _backlog_seconds(self, inst):
+        # Time until the last shard in the instance's queue would be started
+        return len(inst['queue']) * (inst['avg_seconds'] or 0) / BATCH_SHARD_INFLIGHT
+
+    def _steal_for(self, thief):
+        candidates = [inst for inst in self.instances.values() if inst is not thief and inst['queue']]
+        if not candidates:
+            return None
+        victim = max(candidates, key=self._backlog_seconds)
+        # Only worth it when the thief would finish the shard before the owner does
+        if thief['avg_seconds'] and thief['avg_seconds'] > self._backlog_seconds(victim) + (victim['avg_seconds'] or 0):
+            return None
+        self.reassigned += 1
+        return victim['queue'].pop()
+
+    def _fill(self):
+        """Shards to submit now as (shard, instance); called with self.lock held"""
+        launches = []
+        for inst in self.instances.values():
+            while not inst['excluded'] and inst['inflight'] < BATCH_SHARD_INFLIGHT:
+                index = inst['queue'].popleft() if inst['queue'] else self._steal_for(inst)
+                if index is None:
+                    break
+                shard = self.shards[index]
+                self._set_status(shard, 'submitting', instance=inst['name'], error=None)
+                shard['attempts'] += 1
+                inst['inflight'] += 1
+                launches.append((shard, inst))
+        return launches
+
+    def _least_loaded(self, exclude=None):
+        healthy = [inst for inst in self.instances.values() if not inst['excluded'] and inst['name'] != exclude]
+        if not healthy and exclude is not None:
+            healthy = [inst for inst in self.instances.values() if not inst['excluded']]
+        return min(healthy, key=lambda inst: self._backlog_seconds(inst) + inst['inflight']) if healthy else None
+
+    def _requeue(self, shard, error):
+        """Give a failed shard another attempt elsewhere, or fail it for good"""
+        shard['error'] = error
+        target = self._least_loaded(exclude=shard['instance']) if shard['attempts'] < BATCH_SHARD_MAX_ATTEMPTS else None
+        if target is None:
+            self._set_status(shard, 'failed', finished_at=datetime.utcnow().isoformat())
+            return
+        self._set_status(shard, 'pending', task_id=None)
+        target['queue'].appendleft(shard['index'])
+        self.reassigned += 1
+
+    def _exclude(self, inst):
+        inst['excluded'] = True
+        print(f"⚠️ Sharded batch {self.run_id}: dropping {inst['name']} after {inst['consecutive_failures']} failed shards")
+        while inst['queue']:
+            target = self._least_loaded()
+            if target is None:
+                shard = self.shards[inst['queue'].popleft()]
+                self._set_status(shard, 'failed', error='No healthy instance left', finished_at=datetime.utcnow().isoformat())
+                continue
+            target['queue'].append(inst['queue'].popleft())
+            self.reassigned += 1
+
+    def shard_finished(self, index, ok, error=None):
+        """Record a shard's final state; returns the shards to submit next"""
+        with self.lock:
+            shard = self.shards[index]
+            inst = self.instances[shard['instance']]
+            inst['inflight'] -= 1
+            now = datetime.utcnow()
+            if ok:
+                self._set_status(shard, 'done', finished_at=now.isoformat())
+                inst['completed'] += 1
+                inst['consecutive_failures'] = 0
+                seconds = (now - datetime.fromisoformat(shard['submitted_at'])).total_seconds()
+                inst['avg_seconds'] = seconds if inst['completed'] == 1 else (
+                    DURATION_EWMA_ALPHA * seconds + (1 - DURATION_EWMA_ALPHA) * inst['avg_seconds'])
+            else:
+                inst['failed'] += 1
+                inst['consecutive_failures'] += 1
+                self._requeue(shard, error)
+                if inst['consecutive_failures'] >= BATCH_SHARD_FAILURE_LIMIT and not inst['excluded']:
+                    self._exclude(inst)
+            launches = self._fill()
+            self._persist()
+        self._write()
+        return launches
+
+    def shard_submitted(self, index, task_id):
+        with self.lock:
+            shard = self.shards[index]
+            now = datetime.utcnow().isoformat()
+            self._set_status(shard, 'queued', task_id=task_id, submitted_at=now)
+            self.started_at = self.started_at or now
+            self.task_ids.append(task_id)
+
+    def shard_started(self, index):
+        with self.lock:
+            shard = self.shards[index]
+            if shard['status'] == 'queued':
+                self._set_status(shard, 'running')
+
+    def start(self):
+        with self.lock:
+            launches = self._fill()
+            self._persist()
+        self._write()
+        return launches
+
+    def _progress(self):
+        counts = self.counts
+        if counts['pending'] or counts['queued'] or counts['running']:
+            status = 'RUNNING'
+        else:
+            status = 'FAILED' if counts['failed'] else 'COMPLETE'
+            self.finished_at = self.finished_at or datetime.utcnow().isoformat()
+        return dict(counts, status=status, total=len(self.shards), created_at=self.created_at,
+                    started_at=self.started_at, finished_at=self.finished_at, reassigned=self.reassigned)
+
+    def progress(self):
+        with self.lock:
+            return self._progress()
+
+    def _persist(self):
+        # Called with self.lock held. The run record is only rewritten when the
+        # batch's status changes (it starts, then finishes); live progress is
+        # served from memory. _write does the journal write after the lock is released.
+        progress = self._progress()
+        if progress['status'] == self.written_status:
+            return
+        self.written_status = progress['status']
+        record_status(self.run_id, progress['status'], f"{progress['done']}/{progress['total']} shards done, {progress['failed']} failed")
+        self.unwritten = {'status': progress['status'], 'progress': progress, 'task_ids': list(self.task_ids)}
+
+    def _write(self):
+        # Called without self.lock; the newest update is taken under store_lock,
+        # so a slower thread cannot overwrite the record with an older one
+        with self.store_lock:
+            with self.lock:
+                changes, self.unwritten = self.unwritten, None
+                finished = self.finished_at is not None
+                files, self.files = (self.files, []) if finished else ([], self.files)
+            if changes is not None:
+                update_batch_run(self.run_id, changes)
+        release_files(files)
+
+    def snapshot(self):
+        with self.lock:
+            progress = self._progress()
+            return {
+                'run_id': self.run_id,
+                'mode': 'sharded',
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'progress': progress,
+                'instances': [{
+                    'name': inst['name'],
+                    'url': inst['url'],
+                    'planned_shards': self.plan[inst['name']],
+                    'queued_shards': len(inst['queue']),
+                    'inflight': inst['inflight'],
+                    'completed': inst['completed'],
+                    'failed': inst['failed'],
+                    'excluded': inst['excluded'],
+                    'avg_shard_seconds': round(inst['avg_seconds'], 1) if inst['avg_seconds'] else None
+                } for inst in self.instances.values()],
+                'shards': [{key: value for key, value in shard.items() if key != 'content'} for shard in self.shards]
+            }
+
+def _shard_task(batch, shard):
+    inputs = [entry for entry in batch.tes_task['inputs'] if entry['path'] != batch.sheet_path]
+    inputs.append({'name': 'sample_sheet', 'path': batch.sheet_path, 'type': 'FILE', 'content': shard['content']})
+    executors = [dict(executor, env=dict(executor.get('env', {}), SAMPLE_SHEET=batch.sheet_path, SHARD_INDEX=str(shard['index'])))
+                 for executor in batch.tes_task['executors']]
+    return dict(batch.tes_task, name=f"{batch.tes_task['name']}-shard-{shard['index']}", inputs=inputs, executors=executors,
+                tags=dict(batch.tes_task.get('tags', {}), run_id=batch.run_id, shard=str(shard['index'])))
+
+def _submit_shard(batch, shard, inst):
+    def register(local_task):
+        # Before the task reaches the store, so no state change of it is missed
+        batch.shard_submitted(shard['index'], local_task['task_id'])
+        with _lock:
+            _shard_tasks[((inst['url'] or '').rstrip('/'), local_task['task_id'])] = (batch, shard['index'])
+
+    try:
+        local_task, error = submit_task_to_instance(inst['url'], _shard_task(batch, shard), inst['name'],
+                                                    submission_method='Sharded batch', on_created=register)
+    except Exception as e:
+        local_task, error = None, str(e)
+    if error:
+        _launch(batch, batch.shard_finished(shard['index'], False, error))
+
+def _launch(batch, launches):
+    for shard, inst in launches:
+        _pool.submit(_submit_shard, batch, shard, inst)
+
+def _on_task_event(event, task, old_state, new_state, task_data):
+    key = ((task.get('tes_url') or '').rstrip('/'), task.get('task_id') or task.get('id'))
+    with _lock:
+        entry = _shard_tasks.get(key)
+        if entry is not None and new_state in TERMINAL_STATES:
+            del _shard_tasks[key]
+    if entry is None:
+        return
+    batch, index = entry
+    if new_state in TERMINAL_STATES:
+        _launch(batch, batch.shard_finished(index, new_state == 'COMPLETE', None if new_state == 'COMPLETE' else new_state))
+    elif new_state in ('INITIALIZING', 'RUNNING'):
+        batch.shard_started(index)
+
+add_task_listener(_on_task_event)
+
+def create_sharded_batch(run_id, tes_task, sample_sheet, instances, shard_size=None):
+    """Split sample_sheet into shards and plan them over instances; raises ValueError for an unusable sheet"""
+    delimiter, header, samples = read_sample_sheet(sample_sheet)
+    shard_size = shard_size or BATCH_SHARD_SIZE
+    if shard_size < 1:
+        raise ValueError("shard_size must be at least 1")
+    if not instances:
+        raise ValueError("No TES instances configured")
+    return ShardedBatch(run_id, tes_task, sample_sheet['filename'], delimiter, header, samples, shard_size,
+                        instance_capacity(instances))
+
+def start_sharded_batch(batch, files=None):
+    """Start submitting a planned batch; its run record must already exist.
+    The upload references of files are released when the batch finishes."""
+    batch.files = files or []
+    with _lock:
+        _batches[batch.run_id] = batch
+        if len(_batches) > MAX_TRACKED_BATCHES:
+            for old_run_id in [key for key, old in _batches.items() if old.finished_at][:len(_batches) - MAX_TRACKED_BATCHES]:
+                del _batches[old_run_id]
+    print(f"🧩 Sharded batch {batch.run_id}: {sum(shard['samples'] for shard in batch.shards)} samples in {len(batch.shards)} shards, plan {batch.plan}")
+    _launch(batch, batch.start())
+
+def get_sharded_batch(run_id):
+    with _lock:
+        return _batches.get(run_id)
+
+def preview_plan(instances, samples, shard_size=None):
+    """The split create_sharded_batch would make right now for a sheet of `samples` rows"""
+    shard_size = shard_size or BATCH_SHARD_SIZE
+    shard_count = -(-samples // shard_size)
+    capacity = instance_capacity(instances)
+    plan = plan_shards(shard_count, capacity) if capacity and shard_count else {}
+    return {
+        'samples': samples,
+        'shard_size': shard_size,
+        'shards': shard_count,
+        'instances': [dict(entry, planned_shards=plan.get(entry['name'], 0)) for entry in capacity]
+    }
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict
+from config import TASK_CACHE_MAX_BYTES, TASK_CACHE_TTL, TASK_NOT_FOUND_TTL
+from services.task_service import add_task_listener
+from services.log_store_service import externalize_logs, add_blob_roots, iter_blob_refs
+from utils.json_utils import dumps_bytes
+
+TERMINAL_STATES = {'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+
+# Most "not found" answers remembered at once
+NOT_FOUND_MAX_ENTRIES = 10000
+
+class TaskDocumentCache:
+    """LRU cache of TES task documents keyed by (tes_url, task_id, view), bounded by bytes.
+
+    Documents of tasks in a terminal state never change again and are kept
+    until evicted for space; anything else expires after ttl seconds.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (document, endpoint, size, expires_at or None when pinned)
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def make_key(tes_url, task_id, view):
+        return ((tes_url or '').rstrip('/'), task_id, (view or 'FULL').upper())
+
+    def get(self, tes_url, task_id, view):
+        """Return (document, endpoint) or None"""
+        key = self.make_key(tes_url, task_id, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] is not None and entry[3] <= time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += entry[2]
+            return entry[0], entry[1]
+
+    def put(self, tes_url, task_id, view, document, endpoint=None, pin=None):
+        """Store a document; pin defaults to whether the task has reached a terminal state"""
+        if not isinstance(document, dict):
+            return
+        if pin is None:
+            pin = document.get('state') in TERMINAL_STATES
+        # Cached copies keep log references only; readers hydrate on demand
+        if document.get('logs'):
+            document = {**document, 'logs': externalize_logs(document['logs'])}
+        size = len(dumps_bytes(document))
+        if size > self.max_bytes:
+            return
+        key = self.make_key(tes_url, task_id, view)
+        expires_at = None if pin else time.monotonic() + self.ttl
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (document, endpoint, size, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def blob_refs(self):
+        """Log store digests referenced by cached documents"""
+        with self._lock:
+            documents = [entry[0] for entry in self._entries.values()]
+        return [digest for document in documents for digest in iter_blob_refs(document.get('logs'))]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'pinned': sum(1 for entry in self._entries.values() if entry[3] is None),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'bytes_saved': self.bytes_saved,
+                'expired': self.expired,
+                'evictions': self.evictions
+            }
+
+class NotFoundCache:
+    """Short-lived memory of tasks an instance answered 404 for, so retries skip the remote walk.
+
+    Only definitive 404s are recorded; timeouts and server errors are not,
+    so an unreachable instance is always asked again.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (tes_url, task_id) -> expires_at, oldest first
+        self._entries = OrderedDict()
+        self.hits = 0
+
+    def add(self, tes_url, task_id):
+        key = ((tes_url or '').rstrip('/'), task_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = time.monotonic() + self.ttl
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def contains(self, tes_url, task_id):
+        key = ((tes_url or '').rstrip('/'), task_id)
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False
+            self.hits += 1
+            return True
+
+    def discard(self, tes_url, task_id):
+        with self._lock:
+            self._entries.pop(((tes_url or '').rstrip('/'), task_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'ttl': self.ttl}
+
+task_document_cache = TaskDocumentCache(TASK_CACHE_MAX_BYTES, TASK_CACHE_TTL)
+not_found_cache = NotFoundCache(TASK_NOT_FOUND_TTL, NOT_FOUND_MAX_ENTRIES)
+
+def _on_task_event(event, task, old_state, new_state, task_data):
+    # The status poller already fetches the FULL view, so its documents prime
+    # the cache and replace any stale copy of a task that just changed.
+    task_id = task.get('task_id') or task.get('id')
+    tes_url = (task.get('tes_url') or '').rstrip('/')
+    not_found_cache.discard(tes_url, task_id)
+    if event != 'updated' or not isinstance(task_data, dict):
+        return
+    endpoint = f"{tes_url}/ga4gh/tes/v1/tasks/{task_id}?view=FULL"
+    task_document_cache.put(tes_url, task_id, 'FULL', task_data, endpoint)
+
+add_task_listener(_on_task_event)
+add_blob_roots(task_document_cache.blob_refs)
+
+def get_cached_task(tes_url, task_id, view):
+    return task_document_cache.get(tes_url, task_id, view)
+
+def cache_task(tes_url, task_id, view, document, endpoint=None, pin=None):
+    task_document_cache.put(tes_url, task_id, view, document, endpoint, pin)
+
+def is_known_missing(tes_url, task_id):
+    return not_found_cache.contains(tes_url, task_id)
+
+def remember_missing(tes_url, task_id):
+    not_found_cache.add(tes_url, task_id)
+
+def get_task_cache_stats():
+    return {**task_document_cache.stats(), 'not_found': not_found_cache.stats()}
@@ -3,9 +3,36 @@ import time
 import threading
 from datetime import datetime, timezone
 from utils.auth_utils import get_instance_credentials
+from services import metrics_service
+from services.log_store_service import externalize_logs, parse_task_document, add_blob_roots, iter_blob_refs
+
+TASK_STREAM_CHUNK_BYTES = 64 * 1024
 
 task_update_lock = threading.Lock()
 submitted_tasks = []
+tasks_version = 0
+task_listeners = []
+
+def _bump_tasks_version():
+    # Called with task_update_lock held whenever a task record changes, so
+    # readers can tell whether a cached encoding of the store is still valid.
+    global tasks_version
+    tasks_version += 1
+
+def add_task_listener(listener):
+    """Register listener(event, task, old_state, new_state, task_data) for task changes.
+
+    event is 'submitted' when a task is added and 'updated' when the poller
+    changes a stored task; task_data is the TES document that caused it.
+    """
+    task_listeners.append(listener)
+
+def _notify_task_listeners(event, task, old_state, new_state, task_data=None):
+    for listener in task_listeners:
+        try:
+            listener(event, task, old_state, new_state, task_data)
+        except Exception as e:
+            print(f"Task listener {getattr(listener, '__name__', listener)} failed: {str(e)}")
 
 def fetch_task_status_from_tes(task_id, tes_url, tes_name='Unknown'):
     if not task_id or not tes_url:
@@ -22,14 +49,25 @@ def fetch_task_status_from_tes(task_id, tes_url, tes_name='Unknown'):
         elif credentials.get('user') and credentials.get('password'):
             auth = (credentials['user'], credentials['password'])
         
-        response = requests.get(tes_endpoint, headers=headers, auth=auth, timeout=10)
+        poll_started = time.monotonic()
+        try:
+            response = requests.get(tes_endpoint, headers=headers, auth=auth, timeout=10, stream=True)
+        except requests.exceptions.RequestException:
+            metrics_service.record_poll(tes_url, (time.monotonic() - poll_started) * 1000, False)
+            raise
+        # A 404 is a valid answer about the task, not an instance error
+        metrics_service.record_poll(tes_url, (time.monotonic() - poll_started) * 1000, response.status_code in (200, 404))
         
         if response.status_code == 200:
-            task_data = response.json()
+            # FULL views can carry huge stdout/stderr; parse incrementally and
+            # send those straight to the log store instead of response.json()
+            with response:
+                task_data = parse_task_document(response.iter_content(TASK_STREAM_CHUNK_BYTES))
             return True, task_data, None
         elif response.status_code == 404:
             return False, None, f"Task {task_id} not found on TES instance {tes_url}"
         else:
+            response.close()
             return False, None, f"HTTP {response.status_code} error from TES instance"
     
     except requests.exceptions.Timeout:
@@ -55,34 +93,43 @@ def update_single_task_status(task):
         return False
     
     new_state = task_data.get('state', 'UNKNOWN')
+    # Large stdout/stderr go to the on-disk log store; the record keeps references
+    if task_data.get('logs'):
+        task_data = {**task_data, 'logs': externalize_logs(task_data['logs'])}
     
+    updated_task = None
     with task_update_lock:
         for t in submitted_tasks:
             if (t.get('task_id') == task_id or t.get('id') == task_id) and t.get('tes_url') == tes_url:
                 old_state = t.get('state') or t.get('status', 'UNKNOWN')
+                changed = t.get('state') != new_state or t.get('status') != new_state
                 
                 t['state'] = new_state
                 t['status'] = new_state
                 
-                if task_data.get('creation_time'):
-                    t['creation_time'] = task_data['creation_time']
-                if task_data.get('start_time'):
-                    t['start_time'] = task_data['start_time']
-                if task_data.get('end_time'):
-                    t['end_time'] = task_data['end_time']
-                
-                if task_data.get('logs'):
-                    t['logs'] = task_data['logs']
-                
-                if new_state != old_state:
-                    print(f"Updated task {task_id}: {old_state} -> {new_state}")
-                    return True
-                elif new_state in ['COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED']:
-                    print(f"Verified task {task_id} in terminal state: {new_state}")
-                    return True
-                
-                return False
+                for field in ('creation_time', 'start_time', 'end_time', 'logs'):
+                    if task_data.get(field) and t.get(field) != task_data[field]:
+                        t[field] = task_data[field]
+                        changed = True
                 
+                if changed:
+                    _bump_tasks_version()
+                    updated_task = t
+                break
+        else:
+            return False
+    
+    # Listeners run outside the lock so they may read the store themselves
+    if updated_task is not None:
+        _notify_task_listeners('updated', updated_task, old_state, new_state, task_data)
+    
+    if new_state != old_state:
+        print(f"Updated task {task_id}: {old_state} -> {new_state}")
+        return True
+    elif new_state in ['COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED']:
+        print(f"Verified task {task_id} in terminal state: {new_state}")
+        return True
+    
     return False
 
 def update_task_statuses():
@@ -132,8 +179,25 @@ def start_task_status_updater():
     print("Started background task status updater thread")
     return updater_thread
 
+add_task_listener(metrics_service.record_task_event)
+
 def get_submitted_tasks():
     return submitted_tasks
 
+def get_tasks_version():
+    return tasks_version
+
+def _stored_blob_refs():
+    # Records replace their logs list rather than mutating it, so it can be read outside the lock
+    with task_update_lock:
+        task_logs = [t.get('logs') for t in submitted_tasks if t.get('logs')]
+    return [digest for logs in task_logs for digest in iter_blob_refs(logs)]
+
+add_blob_roots(_stored_blob_refs)
+
 def add_task(task):
-    submitted_tasks.append(task)
+    with task_update_lock:
+        submitted_tasks.append(task)
+        _bump_tasks_version()
+    state = task.get('state') or task.get('status', 'UNKNOWN')
+    _notify_task_listeners('submitted', task, None, state, task.get('response'))
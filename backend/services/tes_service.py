@@ -1,9 +1,27 @@
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
+from config import TASK_RESOLVE_DEADLINE
 from utils.tes_utils import load_tes_instances, load_tes_location_data
 from utils.auth_utils import get_instance_credentials
-from services.task_service import get_submitted_tasks
+from services.task_service import get_submitted_tasks, TASK_STREAM_CHUNK_BYTES
+from services.log_store_service import parse_task_document
+from services.task_cache_service import get_cached_task, cache_task, is_known_missing, remember_missing
+from services.metrics_service import record_submit_request
+
+TASK_ENDPOINT_PATTERNS = [
+    "{base_url}/v1/tasks/{task_id}",
+    "{base_url}/ga4gh/tes/v1/tasks/{task_id}",
+    "{base_url}/tasks/{task_id}",
+]
+
+_resolver_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='tes-resolver')
+_resolver_session = requests.Session()
+_working_patterns = {}
+_working_patterns_lock = threading.Lock()
+TASK_NOT_FOUND_ERROR = "Task not found (404)"
 
 def get_healthy_instances():
     from datetime import datetime, timezone
@@ -192,3 +210,176 @@ def get_service_info(tes_url):
             'error_type': 'server_error',
             'timestamp': datetime.now(timezone.utc).isoformat()
         }, 500
+
+def get_auth_for_instance(tes_url, tes_name=None):
+    """Return (headers, auth) for requests to a TES instance"""
+    if tes_name is None:
+        tes_name = next((inst['name'] for inst in load_tes_instances() if inst['url'] in tes_url), 'unknown')
+    credentials = get_instance_credentials(tes_name, tes_url)
+    headers = {'Accept': 'application/json'}
+    auth = None
+    if credentials.get('token'):
+        headers['Authorization'] = f"Bearer {credentials['token']}"
+    elif credentials.get('user') and credentials.get('password'):
+        auth = (credentials['user'], credentials['password'])
+    return headers, auth
+
+def _fetch_task_document(endpoint, headers, auth, timeout):
+    """Return (document, error) for one candidate endpoint"""
+    try:
+        with _resolver_session.get(endpoint, headers=headers, auth=auth, timeout=timeout, stream=True) as response:
+            if response.status_code == 200:
+                return parse_task_document(response.iter_content(TASK_STREAM_CHUNK_BYTES)), None
+            if response.status_code == 404:
+                return None, TASK_NOT_FOUND_ERROR
+            return None, f"HTTP {response.status_code}"
+    except requests.exceptions.Timeout:
+        return None, "Connection timeout"
+    except requests.exceptions.ConnectionError:
+        return None, "Connection failed"
+    except ValueError:
+        return None, "Invalid JSON response"
+    except Exception as e:
+        return None, str(e)
+
+def _probe_candidates(candidates, headers, auth, deadline, preferred_view):
+    """Probe (pattern_index, view, endpoint) candidates concurrently until deadline.
+
+    Returns (found, last_error, not_found). found is the first document for
+    preferred_view as soon as it arrives; a document for a fallback view is
+    only used once every preferred_view probe has failed or the deadline has
+    passed. not_found is True only when every probe answered 404.
+    """
+    futures = {}
+    for candidate in candidates:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        futures[_resolver_pool.submit(_fetch_task_document, candidate[2], headers, auth, remaining)] = candidate
+
+    fallback = None
+    last_error = None
+    not_found = len(futures) == len(candidates) and bool(futures)
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            last_error = last_error or "Connection timeout"
+            not_found = False
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            candidate = futures[future]
+            document, error = future.result()
+            if document is None:
+                last_error = error
+                not_found = not_found and error == TASK_NOT_FOUND_ERROR
+                continue
+            if candidate[1] == preferred_view:
+                return (candidate, document), None, False
+            if fallback is None:
+                fallback = (candidate, document)
+        if fallback and not any(futures[f][1] == preferred_view for f in pending):
+            break
+    if fallback:
+        return fallback, None, False
+    return None, last_error, not_found
+
+def resolve_task_document(tes_url, task_id, views=('FULL', 'MINIMAL'), tes_name=None, deadline=None, fresh=False):
+    """Fetch a task document from a TES instance, trying every known URL pattern and view concurrently.
+
+    Returns (result, error) where result has 'task', 'endpoint', 'view' and
+    'cached'. The URL pattern that answers is remembered per instance and
+    tried alone first next time. fresh=True skips the document cache; a
+    recent 404 is still answered from the not-found cache.
+    """
+    base_url = tes_url.rstrip('/')
+    views = [view.upper() for view in views]
+    for view in views if not fresh else ():
+        cached = get_cached_task(base_url, task_id, view)
+        if cached:
+            return {'task': cached[0], 'endpoint': cached[1], 'view': view, 'cached': True}, None
+    if is_known_missing(base_url, task_id):
+        return None, TASK_NOT_FOUND_ERROR
+
+    headers, auth = get_auth_for_instance(tes_url, tes_name)
+    deadline = time.monotonic() + (deadline or TASK_RESOLVE_DEADLINE)
+    all_candidates = [
+        (index, view, f"{pattern.format(base_url=base_url, task_id=task_id)}?view={view}")
+        for view in views
+        for index, pattern in enumerate(TASK_ENDPOINT_PATTERNS)
+    ]
+
+    with _working_patterns_lock:
+        known_pattern = _working_patterns.get(base_url)
+    found, error, not_found = None, None, False
+    if known_pattern is not None:
+        found, error, not_found = _probe_candidates([c for c in all_candidates if c[0] == known_pattern], headers, auth, deadline, views[0])
+    # A 404 from the pattern this instance is known to serve is definitive;
+    # anything else (unknown instance, timeouts, 5xx) widens the search.
+    if found is None and not not_found:
+        others = [c for c in all_candidates if c[0] != known_pattern] if known_pattern is not None else all_candidates
+        found, other_error, not_found = _probe_candidates(others, headers, auth, deadline, views[0])
+        error = other_error or error
+    if found is None:
+        if not_found:
+            remember_missing(base_url, task_id)
+        return None, error or "No endpoint answered"
+
+    (pattern_index, view, endpoint), document = found
+    with _working_patterns_lock:
+        _working_patterns[base_url] = pattern_index
+    # A fallback view is only kept briefly so the requested view is retried soon
+    cache_task(base_url, task_id, view, document, endpoint, pin=None if view == views[0] else False)
+    return {'task': document, 'endpoint': endpoint, 'view': view, 'cached': False}, None
+
+def _task_collection_urls(base_url):
+    """(pattern index, URL) candidates for creating tasks, the instance's known pattern first"""
+    urls = [(index, pattern.replace('/{task_id}', '').format(base_url=base_url))
+            for index, pattern in enumerate(TASK_ENDPOINT_PATTERNS)]
+    with _working_patterns_lock:
+        known_pattern = _working_patterns.get(base_url)
+    if known_pattern is not None:
+        urls.insert(0, urls.pop(known_pattern))
+    return urls
+
+def post_task_document(tes_url, tes_task, tes_name=None, timeout=30):
+    """Create a task on a TES instance without a separate connectivity probe.
+
+    URL patterns that answer 404/405 are skipped; the one that accepts the
+    task is remembered for later submissions and lookups. Returns
+    (response_data, endpoint, error).
+    """
+    base_url = tes_url.rstrip('/')
+    headers, auth = get_auth_for_instance(tes_url, tes_name)
+    headers = dict(headers, **{'Content-Type': 'application/json'})
+    error = None
+    for pattern_index, endpoint in _task_collection_urls(base_url):
+        started = time.monotonic()
+        try:
+            response = _resolver_session.post(endpoint, json=tes_task, headers=headers, auth=auth, timeout=timeout)
+        except requests.exceptions.Timeout:
+            record_submit_request(tes_url, (time.monotonic() - started) * 1000, False)
+            return None, endpoint, "Connection timeout"
+        except requests.exceptions.RequestException:
+            record_submit_request(tes_url, (time.monotonic() - started) * 1000, False)
+            return None, endpoint, "Connection failed"
+        accepted = response.status_code in (200, 201)
+        record_submit_request(tes_url, (time.monotonic() - started) * 1000, accepted)
+        if accepted:
+            try:
+                response_data = response.json()
+            except ValueError:
+                response_data = {}
+            with _working_patterns_lock:
+                _working_patterns[base_url] = pattern_index
+            return response_data, endpoint, None
+        error = f"HTTP {response.status_code}"
+        if response.status_code not in (404, 405):
+            try:
+                details = response.json()
+                error = details.get('message') or details.get('error') or error
+            except (ValueError, AttributeError):
+                pass
+            return None, endpoint, error
+    return None, None, error or "No task endpoint accepted the task"
@@ -0,0 +1,248 @@
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from urllib.parse import urlparse
+from config import TRANSFER_BUCKET_SECONDS, TRANSFER_RETENTION_SECONDS, TRANSFER_HISTORY_LIMIT
+from services.task_service import add_task_listener
+from utils.time_utils import to_epoch
+
+TERMINAL_STATES = {'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+ACTIVE_STATES = {'INITIALIZING', 'RUNNING'}
+
+_lock = threading.Lock()
+_ids = itertools.count(1)
+# transfer_id -> record, oldest first, capped at TRANSFER_HISTORY_LIMIT
+_transfers = OrderedDict()
+_by_task = defaultdict(list)
+_by_instance = defaultdict(set)
+_by_storage = defaultdict(set)
+_status_counts = Counter()
+# bucket start epoch -> {(tes_url, storage_host, direction): [bytes, transfers, seconds_with_bytes, bytes_with_seconds]}
+_buckets = OrderedDict()
+
+def storage_host(url):
+    """Group storage URLs by endpoint: scheme plus host or bucket (s3://bucket, https://host)"""
+    parsed = urlparse(url or '')
+    if parsed.scheme and parsed.netloc:
+        return f"{parsed.scheme}://{parsed.netloc}"
+    if parsed.scheme:
+        return f"{parsed.scheme}://"
+    return 'local'
+
+def _parse_size(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _new_transfer(task, direction, file_spec):
+    return {
+        'id': f"transfer-{next(_ids)}",
+        'task_id': task.get('task_id') or task.get('id'),
+        'task_name': task.get('name') or task.get('task_name'),
+        'tes_url': (task.get('tes_url') or '').rstrip('/'),
+        'tes_name': task.get('tes_name', 'Unknown'),
+        'direction': direction,
+        'url': file_spec.get('url'),
+        'path': file_spec.get('path'),
+        'storage_host': storage_host(file_spec.get('url')),
+        'status': 'pending',
+        'size_bytes': _parse_size(file_spec.get('size_bytes')),
+        'start_time': None,
+        'end_time': None,
+        'duration_s': None,
+        'throughput_bps': None,
+    }
+
+def _set_status(transfer, status):
+    _status_counts[transfer['status']] -= 1
+    _status_counts[status] += 1
+    transfer['status'] = status
+
+def _index(transfer):
+    transfer_id = transfer['id']
+    _status_counts[transfer['status']] += 1
+    _transfers[transfer_id] = transfer
+    _by_task[(transfer['tes_url'], transfer['task_id'])].append(transfer_id)
+    _by_instance[transfer['tes_url']].add(transfer_id)
+    _by_storage[transfer['storage_host']].add(transfer_id)
+    while len(_transfers) > TRANSFER_HISTORY_LIMIT:
+        _, evicted = _transfers.popitem(last=False)
+        _status_counts[evicted['status']] -= 1
+        task_key = (evicted['tes_url'], evicted['task_id'])
+        _by_task[task_key] = [t for t in _by_task[task_key] if t != evicted['id']]
+        if not _by_task[task_key]:
+            del _by_task[task_key]
+        for index, key in ((_by_instance, evicted['tes_url']), (_by_storage, evicted['storage_host'])):
+            index[key].discard(evicted['id'])
+            if not index[key]:
+                del index[key]
+
+def _record_in_bucket(transfer):
+    finished = transfer['end_time'] or time.time()
+    bucket_start = int(finished // TRANSFER_BUCKET_SECONDS) * TRANSFER_BUCKET_SECONDS
+    cutoff = time.time() - TRANSFER_RETENTION_SECONDS
+    if bucket_start < cutoff:
+        # TES end times can be old; a bucket already past retention would never be trimmed
+        return
+    bucket = _buckets.get(bucket_start)
+    if bucket is None:
+        bucket = _buckets[bucket_start] = {}
+        # Keep buckets sorted by start so trimming from the front is enough; a
+        # late task can open a bucket older than the newest one
+        for later in [start for start in _buckets if start > bucket_start]:
+            _buckets.move_to_end(later)
+        while _buckets and next(iter(_buckets)) < cutoff:
+            _buckets.popitem(last=False)
+    stats = bucket.setdefault((transfer['tes_url'], transfer['storage_host'], transfer['direction']), [0, 0, 0.0, 0])
+    size = transfer['size_bytes'] or 0
+    stats[0] += size
+    stats[1] += 1
+    if size and transfer['duration_s']:
+        stats[2] += transfer['duration_s']
+        stats[3] += size
+
+def _finish(transfer, status, start_time, end_time):
+    _set_status(transfer, status)
+    transfer['start_time'] = transfer['start_time'] or start_time
+    transfer['end_time'] = end_time or time.time()
+    if transfer['start_time'] and transfer['end_time'] > transfer['start_time']:
+        transfer['duration_s'] = round(transfer['end_time'] - transfer['start_time'], 3)
+        if transfer['size_bytes']:
+            transfer['throughput_bps'] = round(transfer['size_bytes'] / transfer['duration_s'], 1)
+    _record_in_bucket(transfer)
+
+def _task_log_windows(task_data):
+    """Derive (stage-in start, stage-in end, stage-out start, stage-out end) epochs from TES task logs"""
+    task_logs = (task_data or {}).get('logs') or []
+    if not task_logs:
+        return None, None, None, None
+    task_log = task_logs[-1]
+    executor_logs = task_log.get('logs') or []
+    first_executor_start = to_epoch(executor_logs[0].get('start_time')) if executor_logs else None
+    last_executor_end = to_epoch(executor_logs[-1].get('end_time')) if executor_logs else None
+    return to_epoch(task_log.get('start_time')), first_executor_start, last_executor_end, to_epoch(task_log.get('end_time'))
+
+def _output_logs(task_data):
+    outputs = []
+    for task_log in (task_data or {}).get('logs') or []:
+        outputs.extend(task_log.get('outputs') or [])
+    return outputs
+
+def _on_task_event(event, task, old_state, new_state, task_data):
+    task_key = ((task.get('tes_url') or '').rstrip('/'), task.get('task_id') or task.get('id'))
+    with _lock:
+        if event == 'submitted':
+            for direction, specs in (('input', task.get('inputs') or []), ('output', task.get('outputs') or [])):
+                for spec in specs:
+                    if spec.get('url'):
+                        _index(_new_transfer(task, direction, spec))
+            return
+
+        transfers = [_transfers[t] for t in _by_task.get(task_key, []) if t in _transfers]
+        if not transfers:
+            return
+        stage_in_start, stage_in_end, stage_out_start, stage_out_end = _task_log_windows(task_data)
+        now = time.time()
+
+        if new_state in ACTIVE_STATES:
+            for transfer in transfers:
+                if transfer['direction'] == 'input' and transfer['status'] == 'pending':
+                    _set_status(transfer, 'active')
+                    transfer['start_time'] = stage_in_start or now
+                    # Executors only start once every input is staged in
+                    if stage_in_end:
+                        _finish(transfer, 'completed', stage_in_start, stage_in_end)
+
+        elif new_state == 'COMPLETE':
+            output_logs = _output_logs(task_data)
+            for transfer in transfers:
+                if transfer['status'] in ('completed', 'failed'):
+                    continue
+                if transfer['direction'] == 'input':
+                    _finish(transfer, 'completed', stage_in_start, stage_in_end or stage_out_start)
+                else:
+                    # Directory outputs are reported file by file under the output URL
+                    prefix = transfer['url'].rstrip('/') + '/'
+                    matched = [o for o in output_logs if o.get('url') == transfer['url'] or (o.get('url') or '').startswith(prefix)]
+                    if matched:
+                        transfer['size_bytes'] = sum(_parse_size(o.get('size_bytes')) or 0 for o in matched)
+                    _finish(transfer, 'completed', stage_out_start, stage_out_end)
+
+        elif new_state in TERMINAL_STATES:
+            for transfer in transfers:
+                if transfer['status'] in ('pending', 'active'):
+                    _finish(transfer, 'failed', transfer['start_time'], stage_out_end or now)
+
+add_task_listener(_on_task_event)
+
+def get_transfers(tes_url=None, storage=None, status=None, limit=100):
+    """Most recent transfers first, optionally narrowed through the instance/storage indexes"""
+    with _lock:
+        candidate_ids = None
+        if tes_url:
+            candidate_ids = set(_by_instance.get(tes_url.rstrip('/'), ()))
+        if storage:
+            storage_ids = _by_storage.get(storage, set())
+            candidate_ids = set(storage_ids) if candidate_ids is None else candidate_ids & storage_ids
+        if candidate_ids is None:
+            ordered = reversed(_transfers.values())
+        else:
+            ordered = (_transfers[t] for t in reversed(_transfers) if t in candidate_ids)
+        result = []
+        for transfer in ordered:
+            if status and transfer['status'] != status:
+                continue
+            result.append(dict(transfer))
+            if len(result) >= limit:
+                break
+        return result
+
+def count_transfers(status):
+    with _lock:
+        return _status_counts[status]
+
+def get_transfer_aggregates(window_seconds=3600):
+    """Bytes moved, transfer counts and throughput per (instance, storage, direction) over a time window"""
+    cutoff = time.time() - window_seconds
+    pairs = {}
+    with _lock:
+        for bucket_start, bucket in _buckets.items():
+            if bucket_start + TRANSFER_BUCKET_SECONDS < cutoff:
+                continue
+            for key, stats in bucket.items():
+                totals = pairs.setdefault(key, [0, 0, 0.0, 0])
+                for i in range(4):
+                    totals[i] += stats[i]
+
+    aggregates = []
+    for (tes_url, host, direction), (total_bytes, transfers, seconds, timed_bytes) in pairs.items():
+        aggregates.append({
+            'tes_url': tes_url,
+            'storage_host': host,
+            'direction': direction,
+            'bytes': total_bytes,
+            'transfers': transfers,
+            'throughput_bps': round(timed_bytes / seconds, 1) if seconds else None,
+        })
+    # Slowest measured pairs first: those are the bandwidth bottlenecks
+    aggregates.sort(key=lambda a: (a['throughput_bps'] is None, a['throughput_bps'] or 0))
+    return aggregates
+
+def get_transfer_timeseries(window_seconds=3600, tes_url=None, storage=None):
+    """Bytes moved per bucket, optionally restricted to one instance and/or storage host"""
+    cutoff = time.time() - window_seconds
+    series = []
+    with _lock:
+        for bucket_start, bucket in _buckets.items():
+            if bucket_start + TRANSFER_BUCKET_SECONDS < cutoff:
+                continue
+            total_bytes = transfers = 0
+            for (bucket_url, host, _), stats in bucket.items():
+                if (tes_url and bucket_url != tes_url.rstrip('/')) or (storage and host != storage):
+                    continue
+                total_bytes += stats[0]
+                transfers += stats[1]
+            series.append({'bucket_start': bucket_start, 'bytes': total_bytes, 'transfers': transfers})
+    return series
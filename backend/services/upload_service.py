@@ -0,0 +1,413 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from config import (
+    UPLOAD_OBJECTS_DIR, UPLOAD_INDEX_JOURNAL, UPLOAD_INDEX_SNAPSHOT, UPLOAD_INDEX_COMPACT_RECORDS,
+    UPLOAD_INCOMING_DIR, UPLOAD_PART_BYTES, UPLOAD_PART_MAX_BYTES, UPLOAD_MAX_PARTS, UPLOAD_SESSION_TTL,
+)
+from utils.journal import Journal
+
+UPLOAD_READ_BYTES = 1024 * 1024
+# Original names remembered per object, for the storage report
+MAX_OBJECT_NAMES = 5
+
+# sha256 -> {size, refs, uploads, names, created_at, last_used_at}, persisted through the journal
+_index = Journal(UPLOAD_INDEX_JOURNAL, UPLOAD_INDEX_SNAPSHOT, UPLOAD_INDEX_COMPACT_RECORDS)
+_index.open()
+_lock = threading.Lock()
+_objects = {entry['sha256']: entry for entry in _index.values()}
+_stats = {'uploads': 0, 'bytes_received': 0, 'bytes_written': 0, 'deduplicated': 0}
+
+def object_path(sha256):
+    return os.path.join(UPLOAD_OBJECTS_DIR, sha256[:2], sha256)
+
+def _read_chunks(stream):
+    return iter(lambda: stream.read(UPLOAD_READ_BYTES), b'')
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _write_object(chunks, expected_sha256=None):
+    """Copy byte chunks into the object store, hashing them on the way; returns (sha256, size, written).
+
+    With expected_sha256, content that hashes differently is discarded before
+    it reaches the store and ValueError is raised.
+    """
+    os.makedirs(UPLOAD_OBJECTS_DIR, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_OBJECTS_DIR, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha256 = hasher.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256:
+            raise ValueError(f"File checksum mismatch: assembled {sha256}")
+        path = object_path(sha256)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return sha256, size, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return sha256, size, True
+    except Exception:
+        _remove_file(temp_path)
+        raise
+
+def _reference(sha256, size, filename, written, refs=1):
+    # Called with _lock held
+    now = datetime.utcnow().isoformat()
+    entry = _objects.get(sha256)
+    if entry is None:
+        entry = _objects[sha256] = {'sha256': sha256, 'size': size, 'refs': 0, 'uploads': 0,
+                                    'names': [], 'created_at': now}
+    entry['refs'] += refs
+    entry['uploads'] += 1
+    entry['last_used_at'] = now
+    if filename not in entry['names']:
+        entry['names'] = (entry['names'] + [filename])[-MAX_OBJECT_NAMES:]
+    _stats['uploads'] += 1
+    _stats['bytes_received'] += size
+    if written:
+        _stats['bytes_written'] += size
+    else:
+        _stats['deduplicated'] += 1
+    _index.put(sha256, entry)
+
+def store_upload(stream, filename):
+    """Store an uploaded file once per distinct content and take a reference to it"""
+    sha256, size, written = _write_object(_read_chunks(stream))
+    with _lock:
+        _reference(sha256, size, filename, written)
+    return {'filename': filename, 'sha256': sha256, 'size': size, 'path': object_path(sha256)}
+
+# Chunked uploads: uploads/incoming/<upload_id>/ holds session.json and one
+# file per received part, named <part>-<sha256> so listing the directory is
+# enough to know what arrived. Sessions live on disk, so a client can resume
+# after a restart of the backend too.
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+UPLOAD_NOT_FOUND_ERROR = 'Upload not found'
+
+_session_locks = {}
+
+def _session_dir(upload_id):
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id or ''):
+        raise ValueError("Invalid upload id")
+    return os.path.join(UPLOAD_INCOMING_DIR, upload_id)
+
+def _session_lock(upload_id):
+    with _lock:
+        return _session_locks.setdefault(upload_id, threading.Lock())
+
+def _save_session(session):
+    path = os.path.join(_session_dir(session['upload_id']), 'session.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(session, f)
+    os.replace(path + '.tmp', path)
+
+def _list_parts(directory):
+    """{part number: (sha256, size, path)} of the parts on disk"""
+    parts = {}
+    for name in os.listdir(directory):
+        number, _, sha256 = name.partition('-')
+        if number.isdigit() and SHA256_PATTERN.fullmatch(sha256):
+            path = os.path.join(directory, name)
+            parts[int(number)] = (sha256, os.path.getsize(path), path)
+    return parts
+
+def create_upload_session(filename, size=None, sha256=None):
+    """Start a chunked upload; size and sha256 of the whole file are checked at commit when given"""
+    if sha256 is not None and not SHA256_PATTERN.fullmatch(sha256):
+        raise ValueError("sha256 must be 64 lowercase hex digits")
+    if size is not None and size < 0:
+        raise ValueError("size must not be negative")
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_session_dir(upload_id))
+    now = time.time()
+    session = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'expected_size': size,
+        'expected_sha256': sha256,
+        'part_size': UPLOAD_PART_BYTES,
+        'max_part_size': UPLOAD_PART_MAX_BYTES,
+        'status': 'open',
+        'created_at': now,
+        'expires_at': now + UPLOAD_SESSION_TTL,
+    }
+    _save_session(session)
+    return session
+
+def get_upload_session(upload_id):
+    """Session state with the parts received so far, or None"""
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id or ''):
+        return None
+    directory = _session_dir(upload_id)
+    try:
+        with open(os.path.join(directory, 'session.json'), 'r') as f:
+            session = json.load(f)
+    except FileNotFoundError:
+        return None
+    if session['status'] == 'open' and time.time() > session['expires_at']:
+        session['status'] = 'expired'
+    if session['status'] == 'open':
+        parts = _list_parts(directory)
+        session['parts'] = [{'part': n, 'sha256': sha, 'size': size} for n, (sha, size, _) in sorted(parts.items())]
+        session['received_bytes'] = sum(size for _, size, _ in parts.values())
+    return session
+
+def upload_part(upload_id, part_number, stream, checksum=None):
+    """Write one part straight to disk, hashing it on the way.
+
+    Re-sending a part is safe: if a part with the same number and the
+    announced checksum is already stored, the body is not read at all.
+    The body is streamed without holding the session lock; the part only
+    becomes visible under it, and not at all if the upload was committed or
+    aborted in the meantime. Returns (part info, error message).
+    """
+    session = get_upload_session(upload_id)
+    if session is None:
+        return None, UPLOAD_NOT_FOUND_ERROR
+    if session['status'] != 'open':
+        return None, f"Upload is {session['status']}"
+    directory = _session_dir(upload_id)
+    if part_number < 1 or part_number > UPLOAD_MAX_PARTS:
+        return None, f"Part number must be between 1 and {UPLOAD_MAX_PARTS}"
+    existing = _list_parts(directory).get(part_number)
+    if checksum and existing and existing[0] == checksum:
+        return {'part': part_number, 'sha256': checksum, 'size': existing[1], 'duplicate': True}, None
+
+    hasher = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in _read_chunks(stream):
+                size += len(chunk)
+                if size > UPLOAD_PART_MAX_BYTES:
+                    raise ValueError(f"Part exceeds {UPLOAD_PART_MAX_BYTES} bytes")
+                hasher.update(chunk)
+                f.write(chunk)
+        sha256 = hasher.hexdigest()
+        if checksum and checksum != sha256:
+            raise ValueError(f"Checksum mismatch: received {sha256}")
+    except ValueError as e:
+        _remove_file(temp_path)
+        return None, str(e)
+    except Exception:
+        _remove_file(temp_path)
+        raise
+
+    with _session_lock(upload_id):
+        session = get_upload_session(upload_id)
+        if session is None or session['status'] != 'open':
+            _remove_file(temp_path)
+            return None, UPLOAD_NOT_FOUND_ERROR if session is None else f"Upload is {session['status']}"
+        # Another request may have stored this part while the body was read
+        existing = _list_parts(directory).get(part_number)
+        path = os.path.join(directory, f"{part_number}-{sha256}")
+        os.replace(temp_path, path)
+        if existing and existing[2] != path:
+            # A retry with different content replaces the earlier attempt
+            _remove_file(existing[2])
+    return {'part': part_number, 'sha256': sha256, 'size': size, 'duplicate': existing is not None and existing[2] == path}, None
+
+def _part_chunks(paths):
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield from _read_chunks(f)
+
+def commit_upload(upload_id, parts=None):
+    """Assemble parts 1..N into the object store.
+
+    parts, if given, is the client's list of {'part', 'sha256'} and must match
+    what was received. Committing again returns the same result. Returns
+    (session, error message).
+    """
+    if get_upload_session(upload_id) is None:
+        return None, UPLOAD_NOT_FOUND_ERROR
+    with _session_lock(upload_id):
+        session = get_upload_session(upload_id)
+        if session is None:
+            return None, UPLOAD_NOT_FOUND_ERROR
+        if session['status'] == 'committed':
+            return session, None
+        if session['status'] != 'open':
+            return None, f"Upload is {session['status']}"
+        directory = _session_dir(upload_id)
+        received = _list_parts(directory)
+        numbers = sorted(received)
+        if not numbers:
+            return None, "No parts received"
+        if numbers != list(range(1, len(numbers) + 1)):
+            return None, f"Missing parts: {sorted(set(range(1, numbers[-1] + 1)) - set(numbers))}"
+        if parts is not None:
+            expected = {int(p['part']): p.get('sha256') for p in parts}
+            if sorted(expected) != numbers:
+                return None, f"Parts listed ({len(expected)}) do not match parts received ({len(numbers)})"
+            mismatched = [n for n in numbers if expected[n] and expected[n] != received[n][0]]
+            if mismatched:
+                return None, f"Checksum mismatch for parts {mismatched}"
+        total = sum(received[n][1] for n in numbers)
+        if session['expected_size'] is not None and total != session['expected_size']:
+            return None, f"Received {total} bytes, expected {session['expected_size']}"
+
+        try:
+            sha256, size, written = _write_object(_part_chunks(received[n][2] for n in numbers),
+                                                  session['expected_sha256'])
+        except ValueError as e:
+            return None, str(e)
+        with _lock:
+            # Runs take references when they use the upload
+            _reference(sha256, size, session['filename'], written, refs=0)
+        for _, _, path in received.values():
+            _remove_file(path)
+        session.pop('parts', None)
+        session.pop('received_bytes', None)
+        session.update({'status': 'committed', 'sha256': sha256, 'size': size, 'part_count': len(numbers),
+                        'committed_at': time.time()})
+        _save_session(session)
+        return session, None
+
+def abort_upload(upload_id):
+    """Delete a session and its parts; False if it did not exist"""
+    if get_upload_session(upload_id) is None:
+        return False
+    with _session_lock(upload_id):
+        shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+    with _lock:
+        _session_locks.pop(upload_id, None)
+    return True
+
+def reference_upload(upload_id):
+    """Take a reference to the file of a committed chunked upload, for a run that uses it"""
+    session = get_upload_session(upload_id)
+    if session is None or session['status'] != 'committed':
+        raise ValueError(f"Upload {upload_id} is not committed")
+    sha256 = session['sha256']
+    with _lock:
+        entry = _objects.get(sha256)
+        if entry is None or not os.path.exists(object_path(sha256)):
+            raise ValueError(f"Upload {upload_id} is no longer stored")
+        entry['refs'] += 1
+        entry['last_used_at'] = datetime.utcnow().isoformat()
+        _index.put(sha256, entry)
+    return {'filename': session['filename'], 'sha256': sha256, 'size': session['size'],
+            'path': object_path(sha256), 'upload_id': upload_id}
+
+def save_request_files(files, upload_ids=None):
+    """Store every file of a multipart request and reference the committed chunked
+    uploads named in upload_ids ({form key: upload id}, or that object as a JSON
+    string); returns the file records a run keeps"""
+    if isinstance(upload_ids, str):
+        upload_ids = json.loads(upload_ids)
+    if upload_ids and not isinstance(upload_ids, dict):
+        raise ValueError("upload_ids must map form keys to upload ids")
+    uploaded_files = []
+    try:
+        for file_key, upload_id in (upload_ids or {}).items():
+            record = reference_upload(upload_id)
+            record['key'] = file_key
+            uploaded_files.append(record)
+        for file_key in files:
+            file = files[file_key]
+            if file and file.filename:
+                record = store_upload(file.stream, file.filename)
+                record['key'] = file_key
+                uploaded_files.append(record)
+    except Exception:
+        release_files(uploaded_files)
+        raise
+    return uploaded_files
+
+def release_upload(sha256):
+    """Drop one reference; objects nobody references are left for garbage collection"""
+    with _lock:
+        entry = _objects.get(sha256)
+        if entry is None or entry['refs'] <= 0:
+            return
+        entry['refs'] -= 1
+        _index.put(sha256, entry)
+
+def release_files(files):
+    """Drop the references save_request_files took for a run that no longer needs its files"""
+    for file in files or []:
+        if file.get('sha256'):
+            release_upload(file['sha256'])
+
+def delete_object(sha256, last_used_at=None):
+    """Remove a stored file and its metadata; returns the bytes freed.
+
+    With last_used_at, the object is kept (and None returned) if it was used
+    again since then or is referenced, e.g. re-uploaded while a retention pass
+    was deciding.
+    """
+    path = object_path(sha256)
+    with _lock:
+        entry = _objects.get(sha256)
+        if entry is not None:
+            if last_used_at is not None and (entry.get('last_used_at') != last_used_at or entry['refs'] > 0):
+                return None
+            del _objects[sha256]
+            _index.delete(sha256)
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+def list_objects():
+    with _lock:
+        return [dict(entry) for entry in _objects.values()]
+
+def list_upload_sessions():
+    """Every chunked upload session on disk, with its directory"""
+    if not os.path.isdir(UPLOAD_INCOMING_DIR):
+        return []
+    sessions = []
+    for upload_id in os.listdir(UPLOAD_INCOMING_DIR):
+        session = get_upload_session(upload_id)
+        if session is not None:
+            session['path'] = _session_dir(upload_id)
+            sessions.append(session)
+    return sessions
+
+def get_upload(sha256):
+    with _lock:
+        entry = _objects.get(sha256)
+        return dict(entry) if entry else None
+
+def get_upload_storage_report(top=10):
+    with _lock:
+        entries = list(_objects.values())
+        stats = dict(_stats)
+    stored_bytes = sum(e['size'] for e in entries)
+    logical_bytes = sum(e['size'] * e['uploads'] for e in entries)
+    unreferenced = [e for e in entries if e['refs'] <= 0]
+    return {
+        'objects': len(entries),
+        'stored_bytes': stored_bytes,
+        'logical_bytes': logical_bytes,
+        'dedup_ratio': round(logical_bytes / stored_bytes, 2) if stored_bytes else None,
+        'unreferenced_objects': len(unreferenced),
+        'unreferenced_bytes': sum(e['size'] for e in unreferenced),
+        'most_shared': sorted(entries, key=lambda e: e['uploads'], reverse=True)[:top],
+        'session': stats,
+        'index': _index.get_stats(),
+        'path': UPLOAD_OBJECTS_DIR,
+    }
@@ -0,0 +1,224 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import WORKFLOW_MAX_PARALLEL_STEPS, WORKFLOW_STORAGE_URL
+from services.cwl_service import load_document, parse_workflow, StepTaskBuilder
+from services.dispatch_service import submit_task_to_instance
+from services.run_tracker_service import track_run, add_child_task, add_child_failure, drop_pending
+from services.task_service import add_task_listener
+from services.upload_service import object_path
+from services.workflow_service import update_workflow_steps
+
+TERMINAL_STATES = {'COMPLETE', 'CANCELED', 'SYSTEM_ERROR', 'EXECUTOR_ERROR', 'PREEMPTED'}
+MAX_TRACKED_EXECUTIONS = 200
+
+_pool = ThreadPoolExecutor(max_workers=WORKFLOW_MAX_PARALLEL_STEPS, thread_name_prefix='workflow-steps')
+_lock = threading.Lock()
+_executions = {}
+# (tes_url, task_id) -> (WorkflowExecution, step id)
+_step_tasks = {}
+
+class WorkflowExecution:
+    """One run of a CWL workflow: steps are submitted as TES tasks as soon as their inputs exist.
+
+    A step becomes ready when every step it takes files from has completed,
+    which the task status poller reports through the task listener. Up to
+    WORKFLOW_MAX_PARALLEL_STEPS steps of a run are in TES at once, so
+    independent branches run side by side. When a step fails, everything
+    downstream of it is skipped and the rest of the DAG runs to completion.
+    """
+
+    def __init__(self, run_id, workflow, builder, tes_url, tes_name):
+        self.run_id = run_id
+        self.steps = workflow['steps']
+        self.builder = builder
+        self.tes_url = tes_url
+        self.tes_name = tes_name
+        self.lock = threading.Lock()
+        self.waiting_on = {step_id: len(step['depends_on']) for step_id, step in self.steps.items()}
+        self.dependents = {step_id: [] for step_id in self.steps}
+        for step_id, step in self.steps.items():
+            for upstream in step['depends_on']:
+                self.dependents[upstream].append(step_id)
+        self.ready = deque(step_id for step_id, count in self.waiting_on.items() if count == 0)
+        self.inflight = 0
+        self.max_inflight = 0
+        self.state = {step_id: {'status': 'ready' if self.waiting_on[step_id] == 0 else 'waiting', 'task_id': None,
+                                'submitted_at': None, 'finished_at': None, 'error': None} for step_id in self.steps}
+        self.task_ids = []
+        # Held while writing to the run record, so writes land in the order they were taken
+        self.store_lock = threading.Lock()
+        # Steps and task ids not written to the run record yet; the first write has every step
+        self.changed = set(self.steps)
+        self.unwritten_task_ids = []
+
+    def _fill(self):
+        """Steps to submit now; called with self.lock held"""
+        launches = []
+        while self.ready and self.inflight < WORKFLOW_MAX_PARALLEL_STEPS:
+            step_id = self.ready.popleft()
+            self._set(step_id, status='submitting')
+            self.inflight += 1
+            launches.append(step_id)
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        return launches
+
+    def _skip_downstream(self, step_id):
+        skipped = 0
+        stack = list(self.dependents[step_id])
+        while stack:
+            other = stack.pop()
+            if self.state[other]['status'] == 'waiting':
+                self._set(other, status='skipped')
+                skipped += 1
+                stack.extend(self.dependents[other])
+        return skipped
+
+    def _set(self, step_id, **fields):
+        # Called with self.lock held; _write copies the step into the run record later
+        self.state[step_id].update(fields)
+        self.changed.add(step_id)
+
+    def start(self):
+        with self.lock:
+            launches = self._fill()
+        self._write()
+        return launches
+
+    def step_submitted(self, step_id, task_id):
+        with self.lock:
+            self._set(step_id, status='queued', task_id=task_id, submitted_at=datetime.utcnow().isoformat())
+            self.task_ids.append(task_id)
+            self.unwritten_task_ids.append(task_id)
+        self._write()
+
+    def step_started(self, step_id):
+        with self.lock:
+            if self.state[step_id]['status'] == 'queued':
+                self._set(step_id, status='running')
+        self._write()
+
+    def step_finished(self, step_id, ok, error=None):
+        """Record a step's final state; returns the steps that can be submitted next"""
+        with self.lock:
+            self.inflight -= 1
+            self._set(step_id, status='done' if ok else 'failed', error=error, finished_at=datetime.utcnow().isoformat())
+            skipped = 0
+            if ok:
+                for other in self.dependents[step_id]:
+                    self.waiting_on[other] -= 1
+                    if self.waiting_on[other] == 0 and self.state[other]['status'] == 'waiting':
+                        self._set(other, status='ready')
+                        self.ready.append(other)
+            else:
+                skipped = self._skip_downstream(step_id)
+            launches = self._fill()
+        self._write()
+        if skipped:
+            drop_pending([self.run_id], skipped)
+        return launches
+
+    def _write(self):
+        # Called without self.lock: copies only the steps that changed. Taking
+        # them under store_lock means a slower thread cannot write older states.
+        with self.store_lock:
+            with self.lock:
+                steps = {step_id: dict(self.state[step_id]) for step_id in self.changed}
+                task_ids, self.unwritten_task_ids = self.unwritten_task_ids, []
+                self.changed = set()
+            if steps or task_ids:
+                update_workflow_steps(self.run_id, steps, task_ids)
+
+    def snapshot(self):
+        with self.lock:
+            counts = {}
+            for state in self.state.values():
+                counts[state['status']] = counts.get(state['status'], 0) + 1
+            return {
+                'run_id': self.run_id,
+                'tes_url': self.tes_url,
+                'steps': {step_id: dict(state, depends_on=sorted(self.steps[step_id]['depends_on']))
+                          for step_id, state in self.state.items()},
+                'counts': counts,
+                'inflight': self.inflight,
+                'max_inflight': self.max_inflight,
+                'max_parallel_steps': WORKFLOW_MAX_PARALLEL_STEPS
+            }
+
+def _submit_step(execution, step_id):
+    def register(local_task):
+        # Before the task reaches the store, so no state change of it is missed
+        execution.step_submitted(step_id, local_task['task_id'])
+        with _lock:
+            _step_tasks[((execution.tes_url or '').rstrip('/'), local_task['task_id'])] = (execution, step_id)
+        add_child_task([execution.run_id], local_task)
+
+    try:
+        local_task, error = submit_task_to_instance(execution.tes_url, execution.builder.build(step_id),
+                                                    execution.tes_name, submission_method='CWL workflow',
+                                                    on_created=register)
+    except Exception as e:
+        local_task, error = None, str(e)
+    if error:
+        print(f"❌ Workflow {execution.run_id}: step {step_id} was not accepted: {error}")
+        add_child_failure([execution.run_id])
+        _launch(execution, execution.step_finished(step_id, False, error))
+
+def _launch(execution, step_ids):
+    for step_id in step_ids:
+        _pool.submit(_submit_step, execution, step_id)
+
+def _on_task_event(event, task, old_state, new_state, task_data):
+    key = ((task.get('tes_url') or '').rstrip('/'), task.get('task_id') or task.get('id'))
+    with _lock:
+        entry = _step_tasks.get(key)
+        if entry is not None and new_state in TERMINAL_STATES:
+            del _step_tasks[key]
+    if entry is None:
+        return
+    execution, step_id = entry
+    if new_state in TERMINAL_STATES:
+        ok = new_state == 'COMPLETE'
+        _launch(execution, execution.step_finished(step_id, ok, None if ok else new_state))
+    elif new_state in ('INITIALIZING', 'RUNNING'):
+        execution.step_started(step_id)
+
+add_task_listener(_on_task_event)
+
+def _read_text(file):
+    with open(object_path(file['sha256']), 'rb') as f:
+        return f.read().decode('utf-8', errors='replace')
+
+def prepare_cwl_execution(run_id, uploaded_files, tes_url, tes_name):
+    """Parse the uploaded workflow (cwl_file), its job (cwl_input) and any tool files,
+    and check every step can be turned into a task; raises ValueError otherwise"""
+    if not tes_url:
+        raise ValueError("wf_tes_instance is required")
+    by_key = {file['key']: file for file in uploaded_files}
+    if 'cwl_file' not in by_key:
+        raise ValueError("cwl_file is required")
+    documents = {file['filename']: load_document(_read_text(file), file['filename'])
+                 for file in uploaded_files if file['key'] not in ('cwl_file', 'cwl_input')
+                 and file['filename'].endswith(('.cwl', '.yml', '.yaml', '.json'))}
+    workflow = parse_workflow(load_document(_read_text(by_key['cwl_file']), by_key['cwl_file']['filename']), documents)
+    job = load_document(_read_text(by_key['cwl_input']), by_key['cwl_input']['filename']) if 'cwl_input' in by_key else {}
+    builder = StepTaskBuilder(run_id, workflow, job, uploaded_files, WORKFLOW_STORAGE_URL)
+    for step_id in workflow['steps']:
+        builder.build(step_id)
+    return WorkflowExecution(run_id, workflow, builder, tes_url, tes_name)
+
+def start_cwl_execution(execution, files=None):
+    """Submit the first ready steps; the run record must already exist.
+    The upload references of files are released when the run finishes."""
+    track_run('workflow', execution.run_id, expected=len(execution.steps), files=files)
+    with _lock:
+        _executions[execution.run_id] = execution
+        if len(_executions) > MAX_TRACKED_EXECUTIONS:
+            del _executions[next(iter(_executions))]
+    print(f"🧬 Workflow {execution.run_id}: {len(execution.steps)} steps, {len(execution.ready)} ready")
+    _launch(execution, execution.start())
+
+def get_cwl_execution(run_id):
+    with _lock:
+        return _executions.get(run_id)
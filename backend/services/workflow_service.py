@@ -1,7 +1,44 @@
 workflow_runs = []
+# run_id -> position in workflow_runs
+_positions = {}
+workflow_runs_version = 0
 
 def get_workflow_runs():
     return workflow_runs
 
+def get_workflow_runs_version():
+    return workflow_runs_version
+
+def get_workflow_run(run_id):
+    position = _positions.get(run_id)
+    return workflow_runs[position] if position is not None else None
+
 def add_workflow_run(workflow):
+    global workflow_runs_version
+    _positions[workflow['run_id']] = len(workflow_runs)
     workflow_runs.append(workflow)
+    workflow_runs_version += 1
+
+def update_workflow_run(run_id, changes):
+    """Apply changes to a stored run; returns the updated run, or None if there is no such run"""
+    global workflow_runs_version
+    workflow = get_workflow_run(run_id)
+    if workflow is None:
+        return None
+    workflow.update(changes)
+    workflow_runs_version += 1
+    return workflow
+
+def update_workflow_steps(run_id, steps, task_ids=()):
+    """Replace the state of the given steps and append new task ids, leaving the other steps alone"""
+    global workflow_runs_version
+    workflow = get_workflow_run(run_id)
+    if workflow is None:
+        return None
+    if 'steps' in workflow:
+        workflow['steps'].update(steps)
+    else:
+        workflow['steps'] = dict(steps)
+    workflow.setdefault('task_ids', []).extend(task_ids)
+    workflow_runs_version += 1
+    return workflow
@@ -0,0 +1,77 @@
+import json
+import random
+
+import pytest
+
+from utils.json_stream import parse_json_stream
+
+# Characters that exercise every decoding path: escapes, multi-byte UTF-8,
+# astral characters (surrogate pairs when escaped) and lone surrogates
+ALPHABET = ['a', 'z', ' ', '"', '\\', '/', '\n', '\t', '\x00', '\x1f', 'é', 'ü', '€', '中', '😀', '𝄞',
+            '\ud800', '\udbff', '\udc00', '\udc80', '\udfff']
+
+def random_string(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12)))
+
+def random_value(rng, depth=0):
+    kind = rng.randint(0, 6 if depth < 4 else 3)
+    if kind == 0:
+        return random_string(rng)
+    if kind == 1:
+        return rng.choice([0, -1, 7, 12345678901234567890, 1.5, -2.25e-8, 3e20])
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return random_string(rng)
+    if kind in (4, 5):
+        return {random_string(rng): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+
+def encode(rng, value):
+    text = json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+    # Lone surrogates cannot be written as raw UTF-8, only as \u escapes
+    try:
+        return text.encode('utf-8')
+    except UnicodeEncodeError:
+        return json.dumps(value, ensure_ascii=True).encode('utf-8')
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+class CollectingSink:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    def finish(self):
+        return {'collected': self.data.decode('utf-8', errors='surrogatepass')}
+
+    def abort(self):
+        pass
+
+@pytest.mark.parametrize('document', [b'{"a":"\\ud800"}', b'["\\udbff"]', b'"\\ud800\\u0041"', b'"x\\ud83d\\ude00"'])
+def test_lone_and_paired_surrogates_at_end_of_input(document):
+    for size in range(1, len(document) + 1):
+        assert parse_json_stream(chunked(document, size)) == json.loads(document)
+
+def test_random_documents_match_json_loads():
+    rng = random.Random(20240101)
+    for _ in range(3000):
+        value = random_value(rng)
+        data = encode(rng, value)
+        expected = json.loads(data)
+        for size in {1, 2, 3, rng.randint(1, len(data)), len(data)}:
+            assert parse_json_stream(chunked(data, size)) == expected, (data, size)
+
+def test_random_streamed_strings_match_json_loads():
+    rng = random.Random(7)
+    for _ in range(1000):
+        stdout = ''.join(random_string(rng) for _ in range(rng.randint(0, 20)))
+        data = encode(rng, {'logs': [{'stdout': stdout, 'exit_code': 0}]})
+        # Adjacent lone surrogates in the source come back as one pair, as json.loads reads them
+        expected = {'logs': [{'collected': json.loads(data)['logs'][0]['stdout'], 'exit_code': 0}]}
+        for size in {1, rng.randint(1, len(data)), len(data)}:
+            document = parse_json_stream(chunked(data, size), {('logs', '*', 'stdout')}, lambda path: CollectingSink())
+            assert document == expected, (data, size)
@@ -7,7 +7,3 @@ def load_batch_runs():
         with open(BATCH_RUNS_FILE, 'r') as f:
             return json.load(f)
     return []
-
-def save_batch_runs(runs):
-    with open(BATCH_RUNS_FILE, 'w') as f:
-        json.dump(runs, f)
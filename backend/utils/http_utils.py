@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, Response
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/msgpack',
+    'application/javascript',
+    'application/x-ndjson',
+    'text/plain',
+    'text/html',
+    'text/css',
+    'text/csv',
+}
+
+# Store versions restart at zero with the process, so tags from a previous
+# run must never validate against the new one.
+_ETAG_SALT = uuid.uuid4().hex
+
+_compressed_bodies = OrderedDict()
+_compressed_bodies_lock = threading.Lock()
+_COMPRESSED_BODIES_MAX = 64
+
+def make_etag(key, version):
+    digest = hashlib.sha1(f"{_ETAG_SALT}:{key}:{version}".encode('utf-8')).hexdigest()
+    return digest[:32]
+
+def _strip_encoding_suffix(tag):
+    for encoding in ('br', 'gzip'):
+        suffix = f"-{encoding}"
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+def etag_matches(etag):
+    """True when the request's If-None-Match already names this representation"""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    if if_none_match.star_tag:
+        return True
+    return any(_strip_encoding_suffix(tag) == etag for tag in if_none_match.as_set())
+
+def not_modified_response(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def cache_for(max_age):
+    """Mark a near-static endpoint as cacheable by browsers and proxies for max_age seconds"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.headers['Cache-Control'] = f'public, max-age={max_age}'
+            return response
+        return wrapper
+    return decorator
+
+def _choose_encoding(accept_encodings):
+    if BROTLI_AVAILABLE and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+def _compressed_body(body, encoding, etag):
+    # Polled endpoints keep returning the same ETag; compress each
+    # representation once instead of on every poll.
+    if not etag:
+        return _compress(body, encoding)
+    key = (etag, encoding)
+    with _compressed_bodies_lock:
+        cached = _compressed_bodies.get(key)
+        if cached is not None:
+            _compressed_bodies.move_to_end(key)
+            return cached
+    compressed = _compress(body, encoding)
+    with _compressed_bodies_lock:
+        _compressed_bodies[key] = compressed
+        while len(_compressed_bodies) > _COMPRESSED_BODIES_MAX:
+            _compressed_bodies.popitem(last=False)
+    return compressed
+
+def gzip_stream(chunks):
+    """Gzip a generator of str/bytes chunks incrementally for streamed responses"""
+    compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_response(chunks, mimetype):
+    """Build a chunked streaming response, gzipped on the fly when the client accepts it"""
+    headers = {'X-Accel-Buffering': 'no'}
+    if request.accept_encodings['gzip']:
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(chunks, mimetype=mimetype, headers=headers)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def compress_response(response):
+    if request.method == 'HEAD' or response.status_code != 200:
+        return response
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    compressed = _compressed_body(body, encoding, etag)
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=bool(weak))
+    return response
+
+def register_compression(app):
+    app.after_request(compress_response)
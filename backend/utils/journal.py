@@ -0,0 +1,299 @@
+import json
+import os
+import threading
+
+# Journal lines are {"seq", "key", "value"} or {"seq", "key", "deleted"}; the
+# snapshot is a {"seq"} header followed by {"key", "value"} lines
+_SEPARATORS = (',', ':')
+
+def _fsync_replace(temp_path, path):
+    os.replace(temp_path, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _write_atomic(path, lines):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        for line in lines:
+            f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_replace(temp_path, path)
+
+class Journal:
+    """Keyed records kept as an append-only JSONL journal plus a compacted snapshot.
+
+    put() appends one line and returns once it is fsynced; concurrent callers
+    share a single write + fsync (group commit). enqueue() + wait() split put()
+    for callers that must fix the order of their writes under their own lock
+    but should not hold it during the fsync. After compact_every records
+    the latest value of every key is rewritten into the snapshot and the
+    journal starts over. An in-memory offset index (key -> file, offset,
+    length) means get() reads one line instead of parsing the history; the
+    snapshot's part of it is saved next to the snapshot so startup only has
+    to replay the journal written since the last compaction.
+
+    Crash safety: the snapshot and its index are replaced atomically and
+    record the last journal sequence number they contain, so replay skips
+    journal lines that were already compacted, and a torn final line (a crash
+    mid-append) is cut off.
+    """
+
+    def __init__(self, path, snapshot_path, compact_every=1000):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.index_path = snapshot_path + '.idx'
+        self.compact_every = compact_every
+        self.cond = threading.Condition()
+        # key -> (in_snapshot, offset, length), in first-insertion order
+        self.index = {}
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.journal_records = 0
+        self.journal_size = 0
+        self.pending = []
+        self.committed_seq = 0
+        self.writing = False
+        self.failed = {}
+        self.stats = {'appends': 0, 'commits': 0, 'compactions': 0, 'replayed': 0, 'truncated_bytes': 0}
+
+    def _load_snapshot_index(self):
+        snapshot_size = os.path.getsize(self.snapshot_path)
+        try:
+            with open(self.index_path, 'r') as f:
+                saved = json.load(f)
+            if saved.get('snapshot_size') == snapshot_size:
+                self.snapshot_seq = saved['seq']
+                self.index = {key: (True, offset, length) for key, offset, length in saved['offsets']}
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        # Missing or stale index: rebuild it from the snapshot itself
+        with open(self.snapshot_path, 'rb') as f:
+            header = f.readline()
+            self.snapshot_seq = json.loads(header)['seq']
+            offset = len(header)
+            for line in f:
+                key = json.loads(line)['key']
+                self.index[key] = (True, offset, len(line))
+                offset += len(line)
+        self._save_snapshot_index(snapshot_size)
+
+    def _save_snapshot_index(self, snapshot_size):
+        offsets = [[key, offset, length] for key, (in_snapshot, offset, length) in self.index.items() if in_snapshot]
+        _write_atomic(self.index_path, [json.dumps({'seq': self.snapshot_seq, 'snapshot_size': snapshot_size,
+                                                    'offsets': offsets}, separators=_SEPARATORS).encode()])
+
+    def open(self, initial_records=None):
+        """Load the snapshot index and replay the journal; initial_records(), if given,
+        seeds an empty store (e.g. from an older file format) as (key, value) pairs."""
+        with self.cond:
+            if os.path.exists(self.snapshot_path):
+                self._load_snapshot_index()
+            elif initial_records is not None and not os.path.exists(self.path):
+                self._write_snapshot(list(initial_records()))
+            self.seq = self.snapshot_seq
+            if os.path.exists(self.path):
+                self._replay()
+            self.committed_seq = self.seq
+
+    def _replay(self):
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("torn line")
+                    entry = json.loads(line)
+                    seq, key = entry['seq'], entry['key']
+                except (ValueError, KeyError, TypeError):
+                    break
+                if seq > self.snapshot_seq:
+                    if entry.get('deleted'):
+                        self.index.pop(key, None)
+                    else:
+                        self.index[key] = (False, good, len(line))
+                    self.seq = max(self.seq, seq)
+                    self.journal_records += 1
+                    self.stats['replayed'] += 1
+                good += len(line)
+        size = os.path.getsize(self.path)
+        if size > good:
+            print(f"⚠️ Truncating {size - good} bytes of incomplete journal entries in {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+                os.fsync(f.fileno())
+            self.stats['truncated_bytes'] += size - good
+        self.journal_size = good
+
+    def put(self, key, value):
+        """Append a new value for key; returns once it is durable"""
+        self.wait(self.enqueue(key, value))
+
+    def enqueue(self, key, value):
+        """Queue a new value for key without waiting for it to be written.
+
+        Values are serialized now and committed in the order they were queued.
+        Returns the sequence number to pass to wait(); get() only sees the
+        value once it is committed.
+        """
+        return self._enqueue(key, {'value': value})
+
+    def delete(self, key):
+        """Append a tombstone for key; compaction drops it for good"""
+        self.wait(self._enqueue(key, {'deleted': True}))
+
+    def _enqueue(self, key, entry):
+        with self.cond:
+            self.seq += 1
+            seq = self.seq
+            line = json.dumps(dict(entry, seq=seq, key=key), separators=_SEPARATORS).encode() + b'\n'
+            self.pending.append((seq, key, line, 'deleted' in entry))
+            self.stats['appends'] += 1
+            return seq
+
+    def wait(self, seq):
+        """Block until the entry queued as seq is durable; raises the OSError if its commit failed"""
+        with self.cond:
+            while self.committed_seq < seq and seq not in self.failed:
+                if self.writing:
+                    self.cond.wait()
+                    continue
+                # This caller becomes the leader and commits everything queued so far
+                batch, self.pending = self.pending, []
+                self.writing = True
+                self.cond.release()
+                try:
+                    error = self._commit(batch)
+                finally:
+                    self.cond.acquire()
+                    self.writing = False
+                if error is None:
+                    offset = self.journal_size
+                    for _, entry_key, line, deleted in batch:
+                        if deleted:
+                            self.index.pop(entry_key, None)
+                        else:
+                            self.index[entry_key] = (False, offset, len(line))
+                        offset += len(line)
+                    self.journal_size = offset
+                    self.journal_records += len(batch)
+                    self.stats['commits'] += 1
+                else:
+                    for entry_seq, _, _, _ in batch:
+                        self.failed[entry_seq] = error
+                self.committed_seq = max(self.committed_seq, batch[-1][0])
+                self.cond.notify_all()
+            error = self.failed.pop(seq, None)
+            if error is not None:
+                raise error
+            if self.journal_records >= self.compact_every and not self.writing:
+                self._compact()
+
+    def _commit(self, batch):
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(line for _, _, line, _ in batch))
+                f.flush()
+                os.fsync(f.fileno())
+            return None
+        except OSError as e:
+            # Drop whatever part of the batch made it to disk
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.journal_size:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(self.journal_size)
+            return e
+
+    def _read(self, location, snapshot, journal):
+        in_snapshot, offset, length = location
+        f = snapshot if in_snapshot else journal
+        f.seek(offset)
+        line = json.loads(f.read(length))
+        return line['value']
+
+    def _open_files(self):
+        snapshot = open(self.snapshot_path, 'rb') if os.path.exists(self.snapshot_path) else None
+        journal = open(self.path, 'rb') if os.path.exists(self.path) else None
+        return snapshot, journal
+
+    def get(self, key, default=None):
+        with self.cond:
+            location = self.index.get(key)
+            if location is None:
+                return default
+            snapshot, journal = self._open_files()
+            try:
+                return self._read(location, snapshot, journal)
+            finally:
+                for f in (snapshot, journal):
+                    if f is not None:
+                        f.close()
+
+    def keys(self):
+        with self.cond:
+            return list(self.index)
+
+    def values(self):
+        """Latest value of every key, in the order keys were first written"""
+        with self.cond:
+            snapshot, journal = self._open_files()
+            try:
+                return [self._read(location, snapshot, journal) for location in self.index.values()]
+            finally:
+                for f in (snapshot, journal):
+                    if f is not None:
+                        f.close()
+
+    def __contains__(self, key):
+        with self.cond:
+            return key in self.index
+
+    def __len__(self):
+        with self.cond:
+            return len(self.index)
+
+    def _write_snapshot(self, items):
+        # Called with self.cond held and no commit in progress; entries still
+        # queued for the next commit are newer than the snapshot
+        header = json.dumps({'seq': self.committed_seq}, separators=_SEPARATORS).encode() + b'\n'
+        lines = [json.dumps({'key': key, 'value': value}, separators=_SEPARATORS).encode() + b'\n' for key, value in items]
+        _write_atomic(self.snapshot_path, [header] + lines)
+        self.snapshot_seq = self.committed_seq
+        self.index = {}
+        offset = len(header)
+        for (key, _), line in zip(items, lines):
+            self.index[key] = (True, offset, len(line))
+            offset += len(line)
+        self._save_snapshot_index(offset)
+
+    def _compact(self):
+        snapshot, journal = self._open_files()
+        try:
+            items = [(key, self._read(location, snapshot, journal)) for key, location in self.index.items()]
+        finally:
+            for f in (snapshot, journal):
+                if f is not None:
+                    f.close()
+        self._write_snapshot(items)
+        # The snapshot now holds every journal entry; a crash before this
+        # truncate only leaves entries that replay skips by sequence number
+        with open(self.path, 'wb') as f:
+            os.fsync(f.fileno())
+        self.journal_size = 0
+        self.journal_records = 0
+        self.stats['compactions'] += 1
+
+    def compact(self):
+        with self.cond:
+            while self.writing:
+                self.cond.wait()
+            self._compact()
+
+    def get_stats(self):
+        with self.cond:
+            return dict(self.stats, records=len(self.index), journal_records=self.journal_records,
+                        journal_bytes=self.journal_size, seq=self.seq, snapshot_seq=self.snapshot_seq)
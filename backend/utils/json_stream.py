@@ -0,0 +1,242 @@
+import json
+import re
+from json.decoder import scanstring
+
+# A run of string content made of plain bytes and complete escapes; a high
+# surrogate escape only counts together with the low one after it
+_STRING_RUN = re.compile(
+    rb'[^"\\]*(?:\\(?:["\\/bfnrt]|u[dD][89abAB][0-9a-fA-F]{2}\\u[dD][c-fC-F][0-9a-fA-F]{2}'
+    rb'|u(?![dD][89abAB])[0-9a-fA-F]{4})[^"\\]*)*'
+)
+# Any \uD800-\uDFFF escape; decoded to surrogatepass bytes rather than through the C scanner
+_SURROGATE_ESCAPE = re.compile(rb'\\u[dD][89a-fA-F]')
+_ESCAPE_SEQUENCE = re.compile(rb'\\(?:u([dD][89abAB][0-9a-fA-F]{2})\\u([0-9a-fA-F]{4})|u([0-9a-fA-F]{4})|(.))', re.S)
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_NUMBER = re.compile(rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?')
+_ESCAPES = {
+    ord('"'): b'"', ord('\\'): b'\\', ord('/'): b'/', ord('b'): b'\b',
+    ord('f'): b'\f', ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t',
+}
+_LITERALS = {ord('t'): (b'true', True), ord('f'): (b'false', False), ord('n'): (b'null', None)}
+# Longest token kept in the buffer before we require it to be complete
+_MAX_TOKEN = 64
+# Enough for a surrogate pair (two \uXXXX escapes)
+_MAX_ESCAPE = 12
+
+def _replace_escape(match):
+    high, low, code, char = match.groups()
+    if char is not None:
+        return _ESCAPES[ord(char)]
+    if high is not None:
+        value = 0x10000 + ((int(high, 16) - 0xD800) << 10) + (int(low, 16) - 0xDC00)
+    else:
+        value = int(code, 16)
+    return chr(value).encode('utf-8', errors='surrogatepass')
+
+def _unescape(segment):
+    """Decode the escapes in a run of string content, leaving its other bytes as they are"""
+    if b'\\' not in segment:
+        return segment
+    if _SURROGATE_ESCAPE.search(segment):
+        # A decoded lone \uDC80-\uDCFF would be mistaken for a surrogateescape'd byte below
+        return _ESCAPE_SEQUENCE.sub(_replace_escape, segment)
+    # The json module's C scanner does the work; surrogateescape carries a UTF-8
+    # sequence cut at the segment boundary through unchanged
+    try:
+        text = scanstring(segment.decode('utf-8', errors='surrogateescape') + '"', 0, False)[0]
+        return text.encode('utf-8', errors='surrogateescape')
+    except UnicodeEncodeError:
+        # Unpaired surrogate escapes
+        return _ESCAPE_SEQUENCE.sub(_replace_escape, segment)
+
+class JSONStreamParser:
+    """Pull parser over an iterable of byte chunks that builds the document
+    but hands selected string values to a sink piece by piece.
+
+    stream_paths is a set of key paths (tuples; '*' stands for any array
+    index) whose string values should never be held in memory whole. For
+    each of them open_sink(path) is called and must return an object with
+    write(bytes), finish() -> dict and abort(). The dict returned by finish()
+    is merged into the enclosing object in place of the key.
+    """
+
+    def __init__(self, chunks, stream_paths=(), open_sink=None):
+        self.chunks = iter(chunks)
+        self.buf = b''
+        self.pos = 0
+        self.eof = False
+        self.stream_paths = set(stream_paths)
+        self.open_sink = open_sink
+        self.open_sinks = []
+
+    def _fill(self):
+        """Read one more chunk, dropping consumed bytes; False at end of input"""
+        if self.eof:
+            return False
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def _available(self, count):
+        """Read until count bytes are buffered past self.pos; False if the input ends first"""
+        while len(self.buf) - self.pos < count:
+            if not self._fill():
+                return False
+        return True
+
+    def _ensure(self, count):
+        if not self._available(count):
+            raise ValueError("Unexpected end of JSON input")
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def _peek(self):
+        self._skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise ValueError("Unexpected end of JSON input")
+        return self.buf[self.pos]
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected {chr(char)!r} at offset {self.pos}")
+        self.pos += 1
+
+    def _decode_escape(self):
+        """Decode the escape at self.pos (a backslash) and return its UTF-8 bytes"""
+        self._ensure(2)
+        kind = self.buf[self.pos + 1]
+        if kind != ord('u'):
+            if kind not in _ESCAPES:
+                raise ValueError(f"Invalid escape at offset {self.pos}")
+            self.pos += 2
+            return _ESCAPES[kind]
+        self._ensure(6)
+        code = int(self.buf[self.pos + 2:self.pos + 6], 16)
+        self.pos += 6
+        if 0xD800 <= code < 0xDC00:
+            # A high surrogate is only meaningful together with the low one after it;
+            # near the end of the input it is a lone surrogate like any other
+            if self._available(6) and self.buf[self.pos:self.pos + 2] == b'\\u':
+                low = int(self.buf[self.pos + 2:self.pos + 6], 16)
+                if 0xDC00 <= low < 0xE000:
+                    self.pos += 6
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+        return chr(code).encode('utf-8', errors='surrogatepass')
+
+    def _string_pieces(self):
+        """Yield the decoded UTF-8 bytes of the string at self.pos, a buffer at a time"""
+        self._expect(ord('"'))
+        while True:
+            end = _STRING_RUN.match(self.buf, self.pos).end()
+            if end > self.pos:
+                segment = self.buf[self.pos:end]
+                self.pos = end
+                yield _unescape(segment)
+            if self.pos >= len(self.buf):
+                if not self._fill():
+                    raise ValueError("Unterminated string")
+                continue
+            if self.buf[self.pos] == ord('"'):
+                self.pos += 1
+                return
+            # An escape cut off by the end of the buffer, or one the fast path does not take
+            if len(self.buf) - self.pos < _MAX_ESCAPE and self._fill():
+                continue
+            yield self._decode_escape()
+
+    def _string(self):
+        data = b''.join(self._string_pieces())
+        try:
+            # Lone surrogate escapes come back as themselves, as with json.loads
+            return data.decode('utf-8', errors='surrogatepass')
+        except UnicodeDecodeError:
+            return data.decode('utf-8', errors='replace')
+
+    def _stream_string(self, path):
+        sink = self.open_sink(path)
+        self.open_sinks.append(sink)
+        for piece in self._string_pieces():
+            sink.write(piece)
+        self.open_sinks.pop()
+        return sink.finish()
+
+    def _scalar(self):
+        char = self._peek()
+        if char in _LITERALS:
+            literal, value = _LITERALS[char]
+            self._ensure(len(literal))
+            if self.buf[self.pos:self.pos + len(literal)] != literal:
+                raise ValueError(f"Invalid literal at offset {self.pos}")
+            self.pos += len(literal)
+            return value
+        # Make sure a number is not cut off by the end of the buffer
+        while len(self.buf) - self.pos < _MAX_TOKEN and not self.eof:
+            if not self._fill():
+                break
+        match = _NUMBER.match(self.buf, self.pos)
+        if not match:
+            raise ValueError(f"Unexpected character {chr(char)!r} at offset {self.pos}")
+        self.pos = match.end()
+        return json.loads(match.group())
+
+    def _value(self, path):
+        char = self._peek()
+        if char == ord('{'):
+            self.pos += 1
+            result = {}
+            if self._peek() == ord('}'):
+                self.pos += 1
+                return result
+            while True:
+                key = self._string()
+                self._expect(ord(':'))
+                child = path + (key,)
+                if child in self.stream_paths and self._peek() == ord('"'):
+                    result.update(self._stream_string(child))
+                else:
+                    result[key] = self._value(child)
+                if self._peek() == ord(','):
+                    self.pos += 1
+                    continue
+                self._expect(ord('}'))
+                return result
+        if char == ord('['):
+            self.pos += 1
+            result = []
+            if self._peek() == ord(']'):
+                self.pos += 1
+                return result
+            child = path + ('*',)
+            while True:
+                result.append(self._value(child))
+                if self._peek() == ord(','):
+                    self.pos += 1
+                    continue
+                self._expect(ord(']'))
+                return result
+        if char == ord('"'):
+            return self._string()
+        return self._scalar()
+
+    def parse(self):
+        try:
+            document = self._value(())
+            self._skip_whitespace()
+            if self.pos < len(self.buf):
+                raise ValueError(f"Extra data at offset {self.pos}")
+            return document
+        except Exception:
+            for sink in self.open_sinks:
+                sink.abort()
+            raise
+
+def parse_json_stream(chunks, stream_paths=(), open_sink=None):
+    return JSONStreamParser(chunks, stream_paths, open_sink).parse()
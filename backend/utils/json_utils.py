@@ -0,0 +1,159 @@
+import json
+import threading
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from flask import current_app, request
+from utils.http_utils import make_etag, etag_matches, not_modified_response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+    _ORJSON_OPTIONS = 0
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+def _default(obj):
+    # Datetimes are emitted as ISO 8601 by both encoders, matching the
+    # isoformat() strings the rest of the backend already stores.
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', errors='replace')
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_bytes(obj):
+    """Encode obj as compact UTF-8 JSON bytes using the fastest available encoder"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Integers beyond 64 bits, mixed-type keys and similar edge cases
+            # that orjson rejects still go through the stdlib encoder.
+            pass
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def packb(obj):
+    """Encode obj as MessagePack with the same schema the JSON responses use"""
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+def unpackb(data):
+    return msgpack.unpackb(data, raw=False)
+
+def wants_msgpack():
+    # JSON stays the default: MessagePack is only chosen when the client names
+    # it explicitly (not through */*) at least as highly as JSON.
+    if not MSGPACK_AVAILABLE:
+        return False
+    accept = request.accept_mimetypes
+    msgpack_quality = max((quality for value, quality in accept if value in MSGPACK_MIMETYPES), default=0)
+    return msgpack_quality > 0 and msgpack_quality >= accept.quality(JSON_MIMETYPE)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib encoder"""
+
+    default = staticmethod(_default)
+    ensure_ascii = False
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', self.default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+class EncodedResponseCache:
+    """Keeps the encoded JSON body of hot read endpoints until their store version changes"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, version, builder, encoder=dumps_bytes):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # The version is read by the caller before building, so a store change
+        # during the build leaves a stale version here and forces a rebuild.
+        # Builders may return already-encoded bytes.
+        body = builder()
+        if not isinstance(body, bytes):
+            body = encoder(body)
+        with self._lock:
+            self._entries[key] = (version, body)
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(len(body) for _, body in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+encoded_response_cache = EncodedResponseCache()
+
+def cached_json_response(key, version, builder, allow_msgpack=False):
+    encoder, mimetype = dumps_bytes, JSON_MIMETYPE
+    if allow_msgpack and wants_msgpack():
+        key, encoder, mimetype = f"{key}.msgpack", packb, MSGPACK_MIMETYPE
+    # Unchanged polls are answered from the ETag alone, without touching the
+    # store or the encoder.
+    etag = make_etag(key, version)
+    if etag_matches(etag):
+        response = not_modified_response(etag)
+    else:
+        body = encoded_response_cache.get_or_build(key, version, builder, encoder)
+        response = current_app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    if allow_msgpack:
+        response.vary.add('Accept')
+    return response
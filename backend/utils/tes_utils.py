@@ -2,6 +2,18 @@ import json
 from pathlib import Path
 from config import TES_INSTANCES_FILE, TES_LOCATIONS_FILE
 
+def _file_version(path):
+    try:
+        stat = path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (0, 0)
+
+def get_tes_config_version():
+    # Changes whenever .tes_instances or tes_instance_locations.json is edited,
+    # which is the only way the instance views can change.
+    return _file_version(TES_INSTANCES_FILE) + _file_version(TES_LOCATIONS_FILE)
+
 def load_tes_instances():
     instances = []
     if TES_INSTANCES_FILE.exists():
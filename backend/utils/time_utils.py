@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 / RFC 3339 timestamp into a naive UTC datetime, or None"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip().replace('Z', '+00:00')
+        # TES servers may send nanosecond precision; older fromisoformat only
+        # accepts exactly 3 or 6 fractional digits
+        if '.' in text:
+            head, _, rest = text.partition('.')
+            digits = len(rest) - len(rest.lstrip('0123456789'))
+            text = f"{head}.{rest[:digits][:6].ljust(6, '0')}{rest[digits:]}" if digits else head + rest
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    # Stored timestamps are a mix of naive UTC and aware values; compare as naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def to_epoch(value):
+    parsed = parse_timestamp(value)
+    if parsed is None:
+        return None
+    return parsed.replace(tzinfo=timezone.utc).timestamp()